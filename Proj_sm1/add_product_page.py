@@ -1,133 +1,179 @@
-# add_product_page.py
-
-import streamlit as st
-import pandas as pd
-from datetime import timedelta
-
-from data_model import (
-    load_products,
-    save_products,
-    auto_detect_type,
-    auto_expiry_days,
-    generate_product_id,
-    validate_manufacture_date,
-    check_expired,
-)
-
-
-def render_add_product_page():
-    st.title("➕ Add Product")
-
-    df = load_products()
-
-    # Get unique categories for dropdown
-    category_options = sorted(df["Category"].astype(str).str.strip().unique())
-
-    st.subheader("Enter Product Details")
-
-    col1, col2 = st.columns(2)
-
-    with col1:
-        product_name = st.text_input("Product Name")
-
-        # NEW: Category dropdown
-        category = st.selectbox(
-            "Category",
-            category_options,
-            key="category_dropdown"
-        )
-
-        quantity_str = st.text_input("Total Quantity")
-        unit_price_str = st.text_input("Unit Price")
-
-    detected_type = auto_detect_type(product_name)
-
-    with col2:
-        manu_date = st.date_input("Manufacture Date")
-
-        product_type = st.selectbox(
-            "Product Type (auto-filled but editable)",
-            ["Veg", "Non-Veg", "Inedible"],
-            index=["Veg", "Non-Veg", "Inedible"].index(
-                detected_type if detected_type in ["Veg", "Non-Veg", "Inedible"] else "Veg"
-            ),
-        )
-
-        default_exp_days = auto_expiry_days(product_name, product_type)
-        expiry_days = st.number_input(
-            "Expiry Days",
-            min_value=1,
-            value=int(default_exp_days),
-            step=1,
-        )
-
-    try:
-        pid_preview = generate_product_id(df, product_type)
-        st.info(f"Product ID will be automatically assigned: **{pid_preview}**")
-    except Exception as e:
-        st.error(str(e))
-
-    if st.button("Save Product", use_container_width=True, key="add_save"):
-        errors = []
-
-        if not product_name.strip():
-            errors.append("Product Name is required.")
-
-        try:
-            quantity = float(quantity_str)
-        except:
-            errors.append("Total Quantity must be numeric.")
-
-        try:
-            unit_price = float(unit_price_str)
-        except:
-            errors.append("Unit Price must be numeric.")
-
-        err_msg, warn_msg = validate_manufacture_date(manu_date)
-        if err_msg:
-            errors.append(err_msg)
-
-        expired, expiry_date = check_expired(manu_date, expiry_days)
-        if expired:
-            errors.append(f"This product has already expired on {expiry_date}.")
-
-        try:
-            pid = generate_product_id(df, product_type)
-        except Exception as e:
-            errors.append(str(e))
-
-        if errors:
-            st.error("Cannot add product:")
-            for e in errors:
-                st.markdown(f"- {e}")
-            return
-
-        if warn_msg:
-            st.warning(warn_msg)
-
-        total_amount = quantity * unit_price
-
-        new_row = {
-            "Product ID": pid,
-            "Product Name": product_name.strip(),
-            "Category": category.strip(),
-            "Type": product_type,
-            "Unit Price": unit_price,
-            "Total Quantity": quantity,
-            "Total_Amount": total_amount,
-            "Manufacture_Date": manu_date,
-            "Expiry_Days": expiry_days,
-            "Expiry_Date": expiry_date,
-        }
-
-        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-        save_products(df)
-
-        st.success(f"Product Added Successfully! (ID: {pid})")
-        st.write("### Added Record")
-        st.dataframe(pd.DataFrame([new_row]))
-
-    st.markdown("---")
-    if st.button("⬅ Back", key="add_back"):
-        st.session_state.current_page = "home"
-        st.rerun()
+# add_product_page.py
+
+import streamlit as st
+import pandas as pd
+from datetime import timedelta
+
+from data_model import (
+    load_products,
+    save_products,
+    products_lock,
+    auto_detect_type,
+    auto_expiry_days,
+    generate_product_id,
+    validate_manufacture_date,
+    check_expired,
+)
+from alert_model import refresh_alerts
+from lot_model import add_lot, receive_lot, lots_for_product
+from product_index import product_choices, get_product
+
+
+def render_add_product_page():
+    st.title("➕ Add Product")
+
+    df = load_products()
+
+    # Get unique categories for dropdown
+    category_options = sorted(df["Category"].astype(str).str.strip().unique())
+
+    st.subheader("Enter Product Details")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        product_name = st.text_input("Product Name")
+
+        # NEW: Category dropdown
+        category = st.selectbox(
+            "Category",
+            category_options,
+            key="category_dropdown"
+        )
+
+        quantity_str = st.text_input("Total Quantity")
+        unit_price_str = st.text_input("Unit Price")
+
+    detected_type = auto_detect_type(product_name)
+
+    with col2:
+        manu_date = st.date_input("Manufacture Date")
+
+        product_type = st.selectbox(
+            "Product Type (auto-filled but editable)",
+            ["Veg", "Non-Veg", "Inedible"],
+            index=["Veg", "Non-Veg", "Inedible"].index(
+                detected_type if detected_type in ["Veg", "Non-Veg", "Inedible"] else "Veg"
+            ),
+        )
+
+        default_exp_days = auto_expiry_days(product_name, product_type)
+        expiry_days = st.number_input(
+            "Expiry Days",
+            min_value=1,
+            value=int(default_exp_days),
+            step=1,
+        )
+
+    try:
+        pid_preview = generate_product_id(df, product_type)
+        st.info(f"Product ID will be automatically assigned: **{pid_preview}**")
+    except Exception as e:
+        st.error(str(e))
+
+    if st.button("Save Product", use_container_width=True, key="add_save"):
+        errors = []
+
+        if not product_name.strip():
+            errors.append("Product Name is required.")
+
+        try:
+            quantity = float(quantity_str)
+        except:
+            errors.append("Total Quantity must be numeric.")
+
+        try:
+            unit_price = float(unit_price_str)
+        except:
+            errors.append("Unit Price must be numeric.")
+
+        err_msg, warn_msg = validate_manufacture_date(manu_date)
+        if err_msg:
+            errors.append(err_msg)
+
+        expired, expiry_date = check_expired(manu_date, expiry_days)
+        if expired:
+            errors.append(f"This product has already expired on {expiry_date}.")
+
+        try:
+            pid = generate_product_id(df, product_type)
+        except Exception as e:
+            errors.append(str(e))
+
+        if errors:
+            st.error("Cannot add product:")
+            for e in errors:
+                st.markdown(f"- {e}")
+            return
+
+        if warn_msg:
+            st.warning(warn_msg)
+
+        total_amount = quantity * unit_price
+
+        new_row = {
+            "Product ID": pid,
+            "Product Name": product_name.strip(),
+            "Category": category.strip(),
+            "Type": product_type,
+            "Unit Price": unit_price,
+            "Total Quantity": quantity,
+            "Total_Amount": total_amount,
+            "Manufacture_Date": pd.Timestamp(manu_date),
+            "Expiry_Days": expiry_days,
+            "Expiry_Date": pd.Timestamp(expiry_date),
+        }
+
+        # re-read under the lock: sales and receipts since the page loaded
+        # (here or in the POS service) must survive the rewrite
+        with products_lock():
+            df = load_products()
+            if (df["Product ID"] == pid).any():
+                pid = new_row["Product ID"] = generate_product_id(df, product_type)
+            # the opening stock is the product's first lot
+            if int(quantity) > 0:
+                add_lot(pid, int(quantity), manu_date, expiry_date)
+            df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
+            save_products(df)
+        refresh_alerts([pid])
+
+        st.success(f"Product Added Successfully! (ID: {pid})")
+        st.write("### Added Record")
+        st.dataframe(pd.DataFrame([new_row]))
+
+    st.markdown("---")
+
+    # ---------- Restock: each receipt is its own lot ----------
+    st.subheader("📦 Receive Stock (New Lot)")
+    pids, labels = product_choices("Stock_Label")
+    lot_pid = st.selectbox(
+        "Product", [None] + pids, key="lot_product",
+        format_func=lambda p: "-- Select --" if p is None else labels[p],
+    )
+    if lot_pid is not None:
+        row = get_product(lot_pid)
+        l1, l2, l3 = st.columns(3)
+        with l1:
+            lot_qty = st.number_input("Quantity received", min_value=1, value=1, key="lot_qty")
+        with l2:
+            lot_manu = st.date_input("Manufacture Date", key="lot_manu")
+        with l3:
+            default_days = int(row["Expiry_Days"]) if pd.notna(row["Expiry_Days"]) else 7
+            lot_days = st.number_input("Expiry Days", min_value=1, value=default_days, key="lot_days")
+
+        if st.button("Receive Lot", key="lot_receive"):
+            expired, lot_expiry = check_expired(lot_manu, lot_days)
+            if expired:
+                st.error(f"This lot has already expired on {lot_expiry}.")
+            else:
+                lot_id = receive_lot(lot_pid, int(lot_qty), lot_manu, lot_expiry)
+                refresh_alerts([lot_pid])
+                st.success(f"Lot #{lot_id} received: {int(lot_qty)} × {row['Product Name']} (expires {lot_expiry}).")
+
+        st.write("Open lots (sold first-expired-first-out):")
+        st.dataframe(lots_for_product(lot_pid), use_container_width=True)
+
+    st.markdown("---")
+    if st.button("⬅ Back", key="add_back"):
+        st.session_state.current_page = "home"
+        st.rerun()
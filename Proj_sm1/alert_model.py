@@ -0,0 +1,237 @@
+# alert_model.py
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from data_model import load_products
+from velocity_model import rolling_velocity
+from store_utils import file_version, write_csv, store_lock
+
+STOCK_ALERTS_CSV = "Stock_alerts.csv"
+REORDER_POINTS_CSV = "Reorder_points.csv"
+
+# ---------- Overstock Rules You Defined ----------
+OVERSTOCK_THRESHOLDS = {
+    "Canned/Processed": 100,
+    "Car Care": 50,
+    "Cleaning": 80,
+    "Dairy/Eggs": 200,
+    "Dry Fruit/Nuts": 50,
+    "Frozen/Processed": 100,
+    "Fruit": 150,
+    "Grain/Staple": 200,
+    "Household/Care": 100,
+    "Meat/Protein": 75,
+    "Paper Products": 100,
+    "Personal Care": 70,
+    "Seafood": 50,
+    "Snack/Confectionery": 80,
+    "Vegetable": 250,
+    "Beverage": 100,
+}
+DEFAULT_OVERSTOCK = 100
+
+# at or below this quantity a product is Understock unless a reorder point says otherwise
+DEFAULT_REORDER_POINT = 25
+
+# a product that will sell out within this many days (at its current velocity) needs reordering
+REORDER_LEAD_DAYS = 7
+VELOCITY_WINDOW_DAYS = 30
+
+# Scope:
+#   "Category" -> Target is a category name
+#   "Product"  -> Target is a Product ID (overrides its category)
+REORDER_COLUMNS = ["Scope", "Target", "Reorder_Point"]
+
+ALERT_COLUMNS = [
+    "Product ID", "Product Name", "Category", "Alert", "Total Quantity",
+    "Reorder_Point", "Velocity", "Days_Of_Stock", "Since",
+]
+
+# most urgent first
+ALERT_LEVELS = ["Out of Stock", "Understock", "Reorder Soon", "Overstock"]
+
+
+# ---------------------------
+# Reorder Points
+# ---------------------------
+def load_reorder_points() -> pd.DataFrame:
+    if not os.path.exists(REORDER_POINTS_CSV):
+        return pd.DataFrame(columns=REORDER_COLUMNS)
+    df = pd.read_csv(REORDER_POINTS_CSV, dtype={"Target": str})
+    df["Target"] = df["Target"].astype(str).str.strip()
+    df["Reorder_Point"] = pd.to_numeric(df["Reorder_Point"], errors="coerce").fillna(DEFAULT_REORDER_POINT)
+    return df[REORDER_COLUMNS]
+
+
+def set_reorder_point(scope: str, target, reorder_point: int) -> None:
+    """Stores (or replaces) the reorder point for a category or a single product."""
+    if scope not in ["Category", "Product"]:
+        raise ValueError(f"Unknown reorder scope '{scope}'.")
+    if int(reorder_point) < 0:
+        raise ValueError("Reorder point cannot be negative.")
+
+    target = str(target).strip()
+    # read-modify-write of the whole file, shared with the other sessions
+    with store_lock(REORDER_POINTS_CSV):
+        points = load_reorder_points()
+        points = points[~((points["Scope"] == scope) & (points["Target"] == target))]
+        points = pd.concat([points, pd.DataFrame([{
+            "Scope": scope, "Target": target, "Reorder_Point": int(reorder_point),
+        }])], ignore_index=True)
+        write_csv(points, REORDER_POINTS_CSV)
+    rebuild_alerts()   # a category point can touch many products
+
+
+def _reorder_points(prod_df: pd.DataFrame) -> np.ndarray:
+    """Per-row reorder point: product override, else category, else the default."""
+    points = load_reorder_points()
+    by_cat = points[points["Scope"] == "Category"].set_index("Target")["Reorder_Point"]
+    by_pid = points[points["Scope"] == "Product"].set_index("Target")["Reorder_Point"]
+
+    result = prod_df["Category"].astype(object).map(by_cat)
+    pid_key = prod_df["Product ID"].astype("Int64").astype(str)
+    result = pid_key.map(by_pid).fillna(result)
+    return result.fillna(DEFAULT_REORDER_POINT).to_numpy(dtype=float)
+
+
+def stock_limits(prod_df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Per-row (reorder point, overstock limit): the thresholds behind the
+    Understock / Overstock alerts, shared with the Analytics stock status.
+    """
+    overstock = prod_df["Category"].astype(object).map(OVERSTOCK_THRESHOLDS).fillna(DEFAULT_OVERSTOCK)
+    return _reorder_points(prod_df), overstock.to_numpy(dtype=float)
+
+
+# ---------------------------
+# Sales Velocity
+# ---------------------------
+def _velocity(product_ids) -> pd.Series:
+    """Average units per day over the last VELOCITY_WINDOW_DAYS (daily ring buffers)."""
+    velocity = rolling_velocity().set_index("Product ID")[f"Velocity_{VELOCITY_WINDOW_DAYS}d"]
+    return velocity.reindex(product_ids).fillna(0.0)
+
+
+# ---------------------------
+# Evaluation
+# ---------------------------
+def evaluate_alerts(prod_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Evaluates the alert rules for the given product rows in one vectorized
+    step and returns one row per product with an alert (others are dropped).
+    """
+    prod = prod_df.dropna(subset=["Product ID"])
+    if prod.empty:
+        return pd.DataFrame(columns=ALERT_COLUMNS)
+
+    pids = prod["Product ID"].astype(int).to_numpy()
+    qty = pd.to_numeric(prod["Total Quantity"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    reorder, overstock = stock_limits(prod)
+    velocity = _velocity(pids).to_numpy(dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_stock = np.where(velocity > 0, qty / velocity, np.inf)
+
+    alert = np.select(
+        [
+            np.isnan(qty),
+            qty <= 0,
+            qty <= reorder,
+            days_of_stock <= REORDER_LEAD_DAYS,
+            qty > overstock,
+        ],
+        ["", "Out of Stock", "Understock", "Reorder Soon", "Overstock"],
+        default="",
+    )
+
+    out = pd.DataFrame({
+        "Product ID": pids,
+        "Product Name": prod["Product Name"].astype(object).to_numpy(),
+        "Category": prod["Category"].astype(object).to_numpy(),
+        "Alert": alert,
+        "Total Quantity": qty,
+        "Reorder_Point": reorder,
+        "Velocity": velocity.round(2),
+        "Days_Of_Stock": np.where(np.isinf(days_of_stock), np.nan, days_of_stock).round(1),
+    })
+    return out[out["Alert"] != ""].reset_index(drop=True)
+
+
+# ---------------------------
+# Alert Feed
+# ---------------------------
+def _read_feed() -> pd.DataFrame:
+    feed = pd.read_csv(STOCK_ALERTS_CSV)
+    for col in ALERT_COLUMNS:
+        if col not in feed.columns:
+            feed[col] = pd.NA
+    return feed[ALERT_COLUMNS]
+
+
+def _write_feed(feed: pd.DataFrame) -> None:
+    level = feed["Alert"].map({a: i for i, a in enumerate(ALERT_LEVELS)})
+    feed = feed.assign(_level=level).sort_values(["_level", "Product ID"]).drop(columns="_level")
+    write_csv(feed[ALERT_COLUMNS], STOCK_ALERTS_CSV)
+
+
+def _stamp(new: pd.DataFrame, old: pd.DataFrame) -> pd.DataFrame:
+    """Keeps the original Since of alerts that are still in the same state."""
+    now = datetime.now().replace(microsecond=0).isoformat(sep=" ")
+    prev = old.set_index(["Product ID", "Alert"])["Since"]
+    keys = pd.MultiIndex.from_arrays([new["Product ID"], new["Alert"]])
+    since = pd.Series(prev.reindex(keys).to_numpy(), index=new.index)
+    return new.assign(Since=since.fillna(now))
+
+
+def rebuild_alerts() -> pd.DataFrame:
+    """Evaluates every product and rewrites the alert feed (first use / rule changes)."""
+    with store_lock(STOCK_ALERTS_CSV):
+        old = _read_feed() if os.path.exists(STOCK_ALERTS_CSV) else pd.DataFrame(columns=ALERT_COLUMNS)
+        feed = _stamp(evaluate_alerts(load_products()), old)
+        _write_feed(feed)
+    return feed
+
+
+def refresh_alerts(product_ids) -> None:
+    """
+    Re-evaluates only the given products after a sale or stock change and
+    patches their rows in the alert feed. Products that no longer exist
+    (e.g. removed) simply drop out of the feed.
+    """
+    touched = {int(p) for p in product_ids if not pd.isna(p)}
+    if not touched:
+        return
+    # read-modify-write of the feed, which the POS service refreshes too
+    with store_lock(STOCK_ALERTS_CSV):
+        if not os.path.exists(STOCK_ALERTS_CSV):
+            rebuild_alerts()
+            return
+
+        prod = load_products()
+        prod = prod[prod["Product ID"].isin(touched).fillna(False)]
+        old = _read_feed()
+        kept = old[~old["Product ID"].isin(touched)]
+        fresh = _stamp(evaluate_alerts(prod), old)
+        _write_feed(pd.concat([kept, fresh], ignore_index=True) if not fresh.empty else kept)
+
+
+# feed-file version -> feed frame
+_FEED_CACHE = {}
+
+
+def load_alerts() -> pd.DataFrame:
+    """Current alert set, most urgent first (cached per feed-file version)."""
+    if not os.path.exists(STOCK_ALERTS_CSV):
+        rebuild_alerts()
+
+    version = file_version(STOCK_ALERTS_CSV)
+    cached = _FEED_CACHE.get(version)
+    if cached is not None:
+        return cached
+
+    feed = _read_feed()
+    _FEED_CACHE.clear()
+    _FEED_CACHE[version] = feed
+    return feed
@@ -1,201 +1,337 @@
-# analytics_page.py
-
-import streamlit as st
-import pandas as pd
-from datetime import datetime
-
-from data_model import load_products
-
-
-# ---------- Overstock Rules You Defined ----------
-OVERSTOCK_THRESHOLDS = {
-    "Canned/Processed": 100,
-    "Car Care": 50,
-    "Cleaning": 80,
-    "Dairy/Eggs": 200,
-    "Dry Fruit/Nuts": 50,
-    "Frozen/Processed": 100,
-    "Fruit": 150,
-    "Grain/Staple": 200,
-    "Household/Care": 100,
-    "Meat/Protein": 75,
-    "Paper Products": 100,
-    "Personal Care": 70,
-    "Seafood": 50,
-    "Snack/Confectionery": 80,
-    "Vegetable": 250,
-    "Beverage": 100,
-}
-
-
-# ---------- Near-Expiry Rules ----------
-def get_near_expiry_window(category, product_name, expiry_days):
-    name = product_name.lower()
-
-    # Dairy special classification
-    if category == "Dairy/Eggs":
-        if any(x in name for x in ["milk", "curd", "yogurt", "cream"]):
-            return 2
-        if any(x in name for x in ["cheese", "paneer", "butter"]):
-            return 30
-        return 7
-
-    # Fruits & Vegetables
-    if category in ["Fruit", "Vegetable"]:
-        return 2
-
-    # Fresh Meat / Seafood
-    if category in ["Meat/Protein", "Seafood"]:
-        if expiry_days <= 7:
-            return 2
-        return 7
-
-    # Medium-expiry food-based items
-    if category in [
-        "Snack/Confectionery",
-        "Grain/Staple",
-        "Canned/Processed",
-        "Frozen/Processed",
-        "Beverage",
-    ]:
-        return 30
-
-    # Long expiry
-    if category in ["Household/Care", "Cleaning", "Car Care", "Paper Products"]:
-        return 15
-
-    return 30
-
-
-# ---------- Stock Classification ----------
-def classify_stock(qty, category):
-    if pd.isna(qty):
-        return "Unknown"
-    q = float(qty)
-
-    if q == 0:
-        return "Out of Stock"
-    if q <= 25:
-        return "Understock"
-    if q > OVERSTOCK_THRESHOLDS.get(category, 100):
-        return "Overstock"
-    return "Normal"
-
-
-# ---------- Expiry Classification ----------
-def classify_expiry(expiry_date, near_window):
-    today = datetime.today().date()
-
-    if expiry_date < today:
-        return "Expired"
-
-    days_left = (expiry_date - today).days
-
-    if days_left <= near_window:
-        return "Near Expiry"
-
-    return "Good"
-
-
-# ---------- Row Coloring ----------
-def color_rows(row):
-    status = row["Expiry_Status"]
-    stock = row["Stock_Status"]
-
-    if status == "Expired":
-        return ["background-color: #4d0000; color: white"] * len(row)
-    if status == "Near Expiry":
-        return ["background-color: #663c00; color: white"] * len(row)
-    if stock == "Understock":
-        return ["background-color: #002147; color: white"] * len(row)
-    if stock == "Overstock":
-        return ["background-color: #003300; color: white"] * len(row)
-
-    return ["background-color: #1e1e1e; color: white"] * len(row)
-
-
-# ---------- Main Analytics Page ----------
-def render_analytics_page():
-    st.title("📊 Advanced Inventory Analytics")
-
-    df = load_products().copy()
-
-    if df.empty:
-        st.warning("No products available.")
-        return
-
-    df["Expiry_Date"] = pd.to_datetime(df["Expiry_Date"]).dt.date
-
-    # Add statuses
-    df["Stock_Status"] = df.apply(
-        lambda r: classify_stock(r["Total Quantity"], r["Category"]), axis=1
-    )
-
-    df["Expiry_Status"] = df.apply(
-        lambda r: classify_expiry(
-            r["Expiry_Date"],
-            get_near_expiry_window(r["Category"], r["Product Name"], r["Expiry_Days"]),
-        ),
-        axis=1,
-    )
-
-    # ---------- KPI Cards ----------
-    total = len(df)
-    expired = (df["Expiry_Status"] == "Expired").sum()
-    near = (df["Expiry_Status"] == "Near Expiry").sum()
-    under = (df["Stock_Status"] == "Understock").sum()
-    over = (df["Stock_Status"] == "Overstock").sum()
-
-    c1, c2, c3, c4, c5 = st.columns(5)
-    c1.metric("Total Products", total)
-    c2.metric("Expired", expired)
-    c3.metric("Near Expiry", near)
-    c4.metric("Understock", under)
-    c5.metric("Overstock", over)
-
-    st.markdown("---")
-
-    # ---------- FILTERS ----------
-    st.subheader("🧰 Filters")
-    filtered_df = df.copy()
-
-    # Category filter
-    categories = ["(All)"] + sorted(df["Category"].unique())
-    selected_cat = st.selectbox("Category", categories)
-    if selected_cat != "(All)":
-        filtered_df = filtered_df[filtered_df["Category"] == selected_cat]
-
-    # Stock filter
-    stock_options = ["(All)", "Understock", "Overstock", "Out of Stock", "Normal"]
-    selected_stock = st.selectbox("Stock Status", stock_options)
-    if selected_stock != "(All)":
-        filtered_df = filtered_df[filtered_df["Stock_Status"] == selected_stock]
-
-    # Expiry filter
-    expiry_options = ["(All)", "Expired", "Near Expiry", "Good"]
-    selected_exp = st.selectbox("Expiry Status", expiry_options)
-    if selected_exp != "(All)":
-        filtered_df = filtered_df[filtered_df["Expiry_Status"] == selected_exp]
-
-    # Price filter
-    min_p = float(df["Unit Price"].min())
-    max_p = float(df["Unit Price"].max())
-
-    col1, col2 = st.columns(2)
-    with col1:
-        pmin = st.number_input("Min Price", value=min_p, min_value=0.0)
-    with col2:
-        pmax = st.number_input("Max Price", value=max_p, min_value=0.0)
-
-    if pmin <= pmax:
-        filtered_df = filtered_df[
-            (filtered_df["Unit Price"] >= pmin) &
-            (filtered_df["Unit Price"] <= pmax)
-        ]
-
-    st.markdown("---")
-
-    # ---------- FINAL TABLE ----------
-    st.subheader(f"📄 Filtered Results ({len(filtered_df)} items)")
-    styled = filtered_df.style.apply(color_rows, axis=1)
-    st.dataframe(styled, use_container_width=True)
+# analytics_page.py
+
+import streamlit as st
+import numpy as np
+import pandas as pd
+import altair as alt
+from datetime import datetime
+
+from data_model import load_products, products_version, patch_products
+from store_utils import file_version
+from change_bus import subscribe, PRODUCT_ADDED, PRODUCT_UPDATED, PRODUCT_REMOVED
+from alert_model import (
+    OVERSTOCK_THRESHOLDS, DEFAULT_OVERSTOCK, DEFAULT_REORDER_POINT, REORDER_POINTS_CSV, stock_limits,
+)
+from velocity_model import days_of_stock
+from stock_history import stock_series, stock_on, inventory_on
+from product_index import product_choices
+
+
+# ---------- Near-Expiry Rules ----------
+def get_near_expiry_window(category, product_name, expiry_days):
+    name = product_name.lower()
+
+    # Dairy special classification
+    if category == "Dairy/Eggs":
+        if any(x in name for x in ["milk", "curd", "yogurt", "cream"]):
+            return 2
+        if any(x in name for x in ["cheese", "paneer", "butter"]):
+            return 30
+        return 7
+
+    # Fruits & Vegetables
+    if category in ["Fruit", "Vegetable"]:
+        return 2
+
+    # Fresh Meat / Seafood
+    if category in ["Meat/Protein", "Seafood"]:
+        if expiry_days <= 7:
+            return 2
+        return 7
+
+    # Medium-expiry food-based items
+    if category in [
+        "Snack/Confectionery",
+        "Grain/Staple",
+        "Canned/Processed",
+        "Frozen/Processed",
+        "Beverage",
+    ]:
+        return 30
+
+    # Long expiry
+    if category in ["Household/Care", "Cleaning", "Car Care", "Paper Products"]:
+        return 15
+
+    return 30
+
+
+# ---------- Near-Expiry Rules (vectorized) ----------
+def near_expiry_windows(df: pd.DataFrame) -> np.ndarray:
+    """Same rules as get_near_expiry_window, evaluated for all rows at once."""
+    cat = df["Category"]
+    name = df["Product Name"].str.lower()
+    expiry_days = pd.to_numeric(df["Expiry_Days"], errors="coerce")
+
+    dairy = (cat == "Dairy/Eggs").to_numpy()
+    fresh = cat.isin(["Meat/Protein", "Seafood"]).to_numpy()
+    conditions = [
+        dairy & name.str.contains("milk|curd|yogurt|cream", na=False).to_numpy(),
+        dairy & name.str.contains("cheese|paneer|butter", na=False).to_numpy(),
+        dairy,
+        cat.isin(["Fruit", "Vegetable"]).to_numpy(),
+        fresh & (expiry_days <= 7).fillna(False).to_numpy(dtype=bool),
+        fresh,
+        cat.isin([
+            "Snack/Confectionery", "Grain/Staple", "Canned/Processed",
+            "Frozen/Processed", "Beverage",
+        ]).to_numpy(),
+        cat.isin(["Household/Care", "Cleaning", "Car Care", "Paper Products"]).to_numpy(),
+    ]
+    return np.select(conditions, [2, 30, 7, 2, 2, 7, 30, 15], default=30)
+
+
+# ---------- Stock Classification ----------
+def classify_stock(qty, category, reorder_point=DEFAULT_REORDER_POINT):
+    if pd.isna(qty):
+        return "Unknown"
+    q = float(qty)
+
+    if q == 0:
+        return "Out of Stock"
+    if q <= reorder_point:
+        return "Understock"
+    if q > OVERSTOCK_THRESHOLDS.get(category, DEFAULT_OVERSTOCK):
+        return "Overstock"
+    return "Normal"
+
+
+def stock_statuses(prod_df: pd.DataFrame) -> np.ndarray:
+    """
+    Vectorized classify_stock for whole columns, with the same reorder
+    points and overstock limits as the alert feed.
+    """
+    q = pd.to_numeric(prod_df["Total Quantity"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    reorder, limit = stock_limits(prod_df)
+    return np.select(
+        [np.isnan(q), q == 0, q <= reorder, q > limit],
+        ["Unknown", "Out of Stock", "Understock", "Overstock"],
+        default="Normal",
+    )
+
+
+# ---------- Expiry Classification ----------
+def classify_expiry(expiry_date, near_window):
+    today = datetime.today().date()
+
+    if expiry_date < today:
+        return "Expired"
+
+    days_left = (expiry_date - today).days
+
+    if days_left <= near_window:
+        return "Near Expiry"
+
+    return "Good"
+
+
+def expiry_statuses(expiry_dates: pd.Series, near_windows) -> np.ndarray:
+    """Vectorized classify_expiry over a datetime64 column."""
+    today = pd.Timestamp.today().normalize()
+    days_left = (expiry_dates - today).dt.days.to_numpy(dtype=float, na_value=np.nan)
+    return np.select(
+        [np.isnan(days_left), days_left < 0, days_left <= near_windows],
+        ["Unknown", "Expired", "Near Expiry"],
+        default="Good",
+    )
+
+
+# ---------- Classified Products (cached) ----------
+# (products version, (today, reorder-points version)) -> products with Stock_Status / Expiry_Status
+_STATUS_CACHE = {}
+
+
+def _status_context() -> tuple:
+    """What the statuses depend on besides the product file."""
+    return datetime.today().date(), file_version(REORDER_POINTS_CSV)
+
+
+def classified_products() -> pd.DataFrame:
+    """
+    load_products() plus Stock_Status and Expiry_Status, classified once per
+    product-file version, day and set of reorder points (the store watcher
+    pre-warms this).
+    """
+    key = (products_version(), _status_context())
+    cached = _STATUS_CACHE.get(key)
+    if cached is None:
+        cached = load_products()
+        if not cached.empty:
+            cached = _classify(cached)
+        _STATUS_CACHE.clear()
+        _STATUS_CACHE[key] = cached
+    # the page adds columns to what it gets
+    return cached.copy()
+
+
+def _classify(df: pd.DataFrame) -> pd.DataFrame:
+    df["Stock_Status"] = stock_statuses(df)
+    df["Expiry_Status"] = expiry_statuses(df["Expiry_Date"], near_expiry_windows(df))
+    return df
+
+
+def _on_products_changed(event) -> None:
+    """Classifies only the changed rows of the cached frame."""
+    context = _status_context()
+    cached = _STATUS_CACHE.get((event.previous, context), _STATUS_CACHE.get((event.version, context)))
+    if cached is None or cached.empty:
+        return
+    rows = None if event.rows is None else _classify(event.rows.copy())
+    _STATUS_CACHE.clear()
+    _STATUS_CACHE[(event.version, context)] = patch_products(cached, event, rows).reset_index(drop=True)
+
+
+subscribe(_on_products_changed, [PRODUCT_ADDED, PRODUCT_UPDATED, PRODUCT_REMOVED])
+
+
+# ---------- Row Coloring ----------
+# Highlight -> (row CSS, status badge); the first matching highlight wins
+ROW_HIGHLIGHTS = {
+    "Expired": ("background-color: #4d0000; color: white", "🟥 Expired"),
+    "Near Expiry": ("background-color: #663c00; color: white", "🟧 Near Expiry"),
+    "Understock": ("background-color: #002147; color: white", "🟦 Understock"),
+    "Overstock": ("background-color: #003300; color: white", "🟩 Overstock"),
+    "": ("background-color: #1e1e1e; color: white", ""),
+}
+
+# above this many rows CSS is skipped and a status badge column is shown instead
+STYLED_ROWS_LIMIT = 2000
+
+
+def row_highlights(df: pd.DataFrame) -> np.ndarray:
+    """One highlight key per row, from the precomputed status columns."""
+    expiry = df["Expiry_Status"].to_numpy()
+    stock = df["Stock_Status"].to_numpy()
+    return np.select(
+        [expiry == "Expired", expiry == "Near Expiry", stock == "Understock", stock == "Overstock"],
+        ["Expired", "Near Expiry", "Understock", "Overstock"],
+        default="",
+    )
+
+
+def row_styles(df: pd.DataFrame) -> pd.DataFrame:
+    """CSS for every cell, broadcast from the per-row highlight (for Styler.apply(axis=None))."""
+    css = pd.Series({k: v[0] for k, v in ROW_HIGHLIGHTS.items()})
+    per_row = css.reindex(row_highlights(df)).to_numpy()
+    return pd.DataFrame(
+        np.repeat(per_row[:, None], df.shape[1], axis=1), index=df.index, columns=df.columns
+    )
+
+
+def status_badges(df: pd.DataFrame) -> np.ndarray:
+    badges = pd.Series({k: v[1] for k, v in ROW_HIGHLIGHTS.items()})
+    return badges.reindex(row_highlights(df)).to_numpy()
+
+
+# ---------- Main Analytics Page ----------
+def render_analytics_page():
+    st.title("📊 Advanced Inventory Analytics")
+
+    # statuses come precomputed per product-file version
+    df = classified_products()
+
+    if df.empty:
+        st.warning("No products available.")
+        return
+
+    # days until sell-out at the trailing 30-day velocity
+    df.insert(df.columns.get_loc("Total Quantity") + 1, "Days_Of_Stock", days_of_stock(df))
+
+    # ---------- KPI Cards ----------
+    total = len(df)
+    expired = (df["Expiry_Status"] == "Expired").sum()
+    near = (df["Expiry_Status"] == "Near Expiry").sum()
+    under = (df["Stock_Status"] == "Understock").sum()
+    over = (df["Stock_Status"] == "Overstock").sum()
+
+    c1, c2, c3, c4, c5 = st.columns(5)
+    c1.metric("Total Products", total)
+    c2.metric("Expired", expired)
+    c3.metric("Near Expiry", near)
+    c4.metric("Understock", under)
+    c5.metric("Overstock", over)
+
+    st.markdown("---")
+
+    # ---------- STOCK OVER TIME ----------
+    st.subheader("📈 Stock Over Time")
+    pids, labels = product_choices("Stock_Label")
+    hist_pid = st.selectbox(
+        "Product", [None] + pids, key="stock_hist_product",
+        format_func=lambda p: "(Whole store)" if p is None else labels[p],
+    )
+    series = stock_series(hist_pid)
+    chart = alt.Chart(series).mark_line(interpolate="step-after", color="#4EA8DE").encode(
+        x=alt.X("Date:T", title="Date", axis=alt.Axis(format="%Y-%m-%d", labelAngle=-45)),
+        y=alt.Y("Stock:Q", title="Units on hand"),
+        tooltip=[alt.Tooltip("Date:T", format="%Y-%m-%d"), alt.Tooltip("Stock:Q", format=",.0f")],
+    ).properties(height=300, width="container")
+    st.altair_chart(chart.interactive(), use_container_width=True)
+
+    as_of = st.date_input("On hand as of:", value=datetime.today().date(), key="stock_hist_date")
+    if hist_pid is None:
+        snapshot = inventory_on(as_of)
+        st.metric(f"Units on hand on {as_of}", f"{snapshot['Stock_On_Hand'].sum():,.0f}")
+        with st.expander("Per product"):
+            st.dataframe(snapshot, use_container_width=True, hide_index=True)
+    else:
+        st.metric(f"Units on hand on {as_of}", f"{stock_on(hist_pid, as_of):,.0f}")
+
+    st.markdown("---")
+
+    # ---------- FILTERS ----------
+    st.subheader("🧰 Filters")
+    filtered_df = df
+
+    # Category filter
+    categories = ["(All)"] + sorted(df["Category"].unique())
+    selected_cat = st.selectbox("Category", categories)
+    if selected_cat != "(All)":
+        filtered_df = filtered_df[filtered_df["Category"] == selected_cat]
+
+    # Stock filter
+    stock_options = ["(All)", "Understock", "Overstock", "Out of Stock", "Normal"]
+    selected_stock = st.selectbox("Stock Status", stock_options)
+    if selected_stock != "(All)":
+        filtered_df = filtered_df[filtered_df["Stock_Status"] == selected_stock]
+
+    # Expiry filter
+    expiry_options = ["(All)", "Expired", "Near Expiry", "Good"]
+    selected_exp = st.selectbox("Expiry Status", expiry_options)
+    if selected_exp != "(All)":
+        filtered_df = filtered_df[filtered_df["Expiry_Status"] == selected_exp]
+
+    # Price filter
+    min_p = float(df["Unit Price"].min())
+    max_p = float(df["Unit Price"].max())
+
+    col1, col2 = st.columns(2)
+    with col1:
+        pmin = st.number_input("Min Price", value=min_p, min_value=0.0)
+    with col2:
+        pmax = st.number_input("Max Price", value=max_p, min_value=0.0)
+
+    if pmin <= pmax:
+        filtered_df = filtered_df[
+            (filtered_df["Unit Price"] >= pmin) &
+            (filtered_df["Unit Price"] <= pmax)
+        ]
+
+    st.markdown("---")
+
+    # ---------- FINAL TABLE ----------
+    st.subheader(f"📄 Filtered Results ({len(filtered_df)} items)")
+    if len(filtered_df) <= STYLED_ROWS_LIMIT:
+        styled = filtered_df.style.apply(row_styles, axis=None)
+        st.dataframe(styled, use_container_width=True)
+    else:
+        # per-cell CSS does not scale; a badge column carries the same signal
+        badged = filtered_df.copy()
+        badged.insert(0, "Status", status_badges(filtered_df))
+        st.caption(f"Large result: row colours replaced by the Status column (over {STYLED_ROWS_LIMIT} rows).")
+        st.dataframe(
+            badged,
+            use_container_width=True,
+            hide_index=True,
+            column_config={"Status": st.column_config.TextColumn("Status", width="small")},
+        )
@@ -0,0 +1,234 @@
+# bill_model.py
+import os
+import threading
+from datetime import datetime
+import pandas as pd
+
+from store_utils import file_version, parse_dates, format_dates, write_csv, store_lock
+
+BILLS_CSV = "Bills.csv"
+# last issued Bill ID (IDs are reserved here before their bill is written)
+BILL_SEQ_FILE = "Bill_seq.txt"
+
+BILL_COLUMNS = [
+    "Bill ID", "Customer ID", "Date of Sale", "Created_At", "Line Count", "Total",
+]
+
+
+# ---------------------------
+# Loading / Saving
+# ---------------------------
+def _read_bills() -> pd.DataFrame:
+    df = pd.read_csv(BILLS_CSV)
+    for col in BILL_COLUMNS:
+        if col not in df.columns:
+            df[col] = pd.NA
+    df = df[BILL_COLUMNS]
+    df["Bill ID"] = pd.to_numeric(df["Bill ID"], errors="coerce").astype("Int64")
+    df["Customer ID"] = pd.to_numeric(df["Customer ID"], errors="coerce").astype("Int64")
+    df["Date of Sale"] = parse_dates(df["Date of Sale"])
+    df["Created_At"] = pd.to_datetime(df["Created_At"], errors="coerce", format="ISO8601")
+    df["Line Count"] = pd.to_numeric(df["Line Count"], errors="coerce").fillna(0).astype(int)
+    df["Total"] = pd.to_numeric(df["Total"], errors="coerce").fillna(0.0)
+    return df
+
+
+def save_bills(df: pd.DataFrame) -> None:
+    out = df[BILL_COLUMNS].copy()
+    out["Date of Sale"] = format_dates(out["Date of Sale"])
+    write_csv(out, BILLS_CSV)
+
+
+# bills-file version -> bills sorted by Created_At
+_BILLS_CACHE = {}
+
+
+def load_bills() -> pd.DataFrame:
+    """
+    Returns the bill-level table sorted chronologically (cached per file version).
+    Built from the sales log on first use (the log itself is never written here).
+    """
+    if not os.path.exists(BILLS_CSV):
+        with store_lock(BILLS_CSV):
+            if not os.path.exists(BILLS_CSV):
+                rebuild_bills()
+
+    version = file_version(BILLS_CSV)
+    cached = _BILLS_CACHE.get(version)
+    if cached is not None:
+        return cached
+
+    bills = _read_bills().sort_values(["Created_At", "Bill ID"], kind="stable").reset_index(drop=True)
+    _BILLS_CACHE.clear()
+    _BILLS_CACHE[version] = bills
+    return bills
+
+
+def next_bill_id(count: int = 1) -> int:
+    """
+    Reserves `count` consecutive Bill IDs and returns the first. The last
+    issued ID is kept in a sequence file updated under a cross-process lock,
+    so the app and the POS service never hand out the same ID, even before
+    either has written its bill.
+    """
+    with store_lock(BILL_SEQ_FILE):
+        try:
+            with open(BILL_SEQ_FILE, encoding="utf-8") as f:
+                last = int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            last = 0
+        ids = load_bills()["Bill ID"].dropna()
+        if not ids.empty:
+            last = max(last, int(ids.max()))
+        tmp = f"{BILL_SEQ_FILE}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(str(last + count))
+        os.replace(tmp, BILL_SEQ_FILE)
+    return last + 1
+
+
+# ---------------------------
+# Backfill / Migration
+# ---------------------------
+def _bills_from_lines(sales: pd.DataFrame) -> pd.DataFrame:
+    billed = sales.assign(**{"Bill ID": pd.to_numeric(sales["Bill ID"], errors="coerce")})
+    billed = billed.dropna(subset=["Bill ID"])
+    billed["Bill ID"] = billed["Bill ID"].astype("Int64")
+    bills = billed.groupby("Bill ID").agg(**{
+        "Customer ID": ("Customer ID", "first"),
+        "Date of Sale": ("Date of Sale", "min"),
+        "Line Count": ("Product ID", "size"),
+        "Total": ("Total Sale Amount", "sum"),
+    }).reset_index()
+    bills["Created_At"] = bills["Date of Sale"]
+    return bills[BILL_COLUMNS]
+
+
+def rebuild_bills(sales_df: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Rebuilds Bills.csv from the Bill IDs in the sales log. Only reads the
+    log: legacy lines without a Bill ID are left to assign_bill_ids. Bills
+    whose lines have all been archived exist only in Bills.csv and are kept.
+    """
+    with store_lock(BILLS_CSV):
+        if sales_df is None:
+            # imported lazily: sales_model writes bills on every transaction
+            from sales_model import load_sales
+            sales_df = load_sales()
+        if "Bill ID" not in sales_df.columns:
+            sales_df = sales_df.assign(**{"Bill ID": pd.NA})
+        bills = _bills_from_lines(sales_df) if not sales_df.empty else pd.DataFrame(columns=BILL_COLUMNS)
+        if os.path.exists(BILLS_CSV):
+            old = _read_bills().dropna(subset=["Bill ID"])
+            archived = old[~old["Bill ID"].isin(bills["Bill ID"]).fillna(False).to_numpy()]
+            if not archived.empty:
+                bills = pd.concat([archived, bills], ignore_index=True) if not bills.empty else archived
+        save_bills(bills)
+    return bills
+
+
+def assign_bill_ids() -> int:
+    """
+    One-off migration of legacy sales lines without a Bill ID: lines of an
+    identified customer on the same date form one bill, anonymous lines
+    become a bill each. The IDs are reserved like any others, the log is
+    rewritten once under the sales lock and Bills.csv is rebuilt. Returns
+    the number of lines migrated (0 once done).
+    """
+    # imported lazily: sales_model writes bills on every transaction
+    from sales_model import load_sales, save_sales, sales_lock
+
+    with sales_lock():
+        sales = load_sales()
+        if "Bill ID" not in sales.columns:
+            sales["Bill ID"] = pd.NA
+        bill_ids = pd.to_numeric(sales["Bill ID"], errors="coerce")
+        missing = bill_ids.isna()
+        if not missing.any():
+            return 0
+
+        legacy = sales[missing]
+        known = legacy["Customer ID"].notna()
+        # identified customers: one bill per (customer, date)
+        keys = legacy.loc[known, "Customer ID"].astype(str) + "|" + legacy.loc[known, "Date of Sale"].astype(str)
+        codes = pd.Series(pd.factorize(keys)[0], index=keys.index)
+        n_known = int(codes.max()) + 1 if not codes.empty else 0
+        # anonymous lines: one bill each
+        anon_idx = legacy.index[~known]
+        anon_codes = pd.Series(range(n_known, n_known + len(anon_idx)), index=anon_idx)
+        start = next_bill_id(n_known + len(anon_idx))
+        new_ids = pd.concat([codes, anon_codes]).reindex(legacy.index) + start
+        sales["Bill ID"] = bill_ids.astype("Float64").fillna(new_ids.astype("Float64")).astype("Int64")
+        save_sales(sales)
+        rebuild_bills(sales)
+        return int(missing.sum())
+
+
+_MIGRATED = False
+_MIGRATE_LOCK = threading.Lock()
+
+
+def ensure_bill_ids() -> None:
+    """Runs assign_bill_ids once per process (app and POS service startup)."""
+    global _MIGRATED
+    with _MIGRATE_LOCK:
+        if not _MIGRATED:
+            assign_bill_ids()
+            _MIGRATED = True
+
+
+# ---------------------------
+# Incremental Maintenance
+# ---------------------------
+def record_bill_lines(new_rows: list[dict]) -> None:
+    """
+    Folds newly appended sales lines into their bills. New bills are
+    appended to Bills.csv; lines added to an existing bill update its row.
+    """
+    if not new_rows:
+        return
+    # a rebuild running elsewhere may not have seen new_rows: wait for it
+    with store_lock(BILLS_CSV):
+        if not os.path.exists(BILLS_CSV):
+            rebuild_bills()   # the log already contains new_rows
+            return
+        _record_bill_lines(new_rows)
+
+
+def _record_bill_lines(new_rows: list[dict]) -> None:
+    bills = load_bills()
+    existing = set(bills["Bill ID"].dropna().astype(int))
+    now = datetime.now().replace(microsecond=0)
+
+    updates = {}
+    appended = {}
+    for r in new_rows:
+        bid = int(r["Bill ID"])
+        amount = float(r.get("Total Sale Amount", 0.0) or 0.0)
+        target = updates if bid in existing else appended
+        if bid not in target:
+            target[bid] = {
+                "Bill ID": bid,
+                "Customer ID": r.get("Customer ID"),
+                "Date of Sale": r["Date of Sale"],
+                "Created_At": now,
+                "Line Count": 0,
+                "Total": 0.0,
+            }
+        target[bid]["Line Count"] += 1
+        target[bid]["Total"] += amount
+
+    if updates:
+        bills = bills.copy()
+        pos = bills.reset_index().set_index("Bill ID")["index"]
+        for bid, u in updates.items():
+            i = pos[bid]
+            bills.at[i, "Line Count"] = int(bills.at[i, "Line Count"]) + u["Line Count"]
+            bills.at[i, "Total"] = float(bills.at[i, "Total"]) + u["Total"]
+        if appended:
+            bills = pd.concat([bills, pd.DataFrame(list(appended.values()))], ignore_index=True)
+        save_bills(bills)
+    elif appended:
+        pd.DataFrame(list(appended.values()))[BILL_COLUMNS].to_csv(
+            BILLS_CSV, mode="a", header=False, index=False
+        )
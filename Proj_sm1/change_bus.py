@@ -0,0 +1,113 @@
+# change_bus.py
+"""
+In-process change notifications.
+
+Writers emit one typed event per kind of change (with the affected Product
+IDs, the changed rows and the store version before and after the write);
+caches subscribe and patch just those rows instead of being rebuilt.
+Every Streamlit session runs in the same process, so a sale recorded by one
+cashier is seen by the others on their next run (see events_since).
+"""
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+PRODUCT_ADDED = "product_added"
+PRODUCT_UPDATED = "product_updated"
+PRODUCT_REMOVED = "product_removed"
+SALE_APPENDED = "sale_appended"
+EVENT_KINDS = [PRODUCT_ADDED, PRODUCT_UPDATED, PRODUCT_REMOVED, SALE_APPENDED]
+
+EVENT_HISTORY = 1000   # recent events kept for sessions catching up
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    kind: str
+    product_ids: tuple
+    previous: object = None     # store version the change was applied to
+    version: object = None      # store version after the change
+    # new rows: typed product rows (added / updated) or normalized sales lines
+    rows: pd.DataFrame | None = field(default=None, repr=False, compare=False)
+    seq: int = 0
+    origin: object = None       # who made the change (see emitting_as); None if unknown
+
+
+_LOCK = threading.Lock()
+_SUBSCRIBERS = []   # (kinds or None, callback)
+_HISTORY = deque(maxlen=EVENT_HISTORY)
+_SEQ = 0
+_ORIGIN = threading.local()
+
+
+def subscribe(callback, kinds=None) -> None:
+    """Calls callback(event) for every event of the given kinds (all if None)."""
+    with _LOCK:
+        _SUBSCRIBERS.append((set(kinds) if kinds is not None else None, callback))
+
+
+def unsubscribe(callback) -> None:
+    with _LOCK:
+        _SUBSCRIBERS[:] = [s for s in _SUBSCRIBERS if s[1] != callback]
+
+
+@contextmanager
+def emitting_as(origin):
+    """Tags the events emitted on this thread with `origin` (e.g. a session's ID)."""
+    previous = getattr(_ORIGIN, "value", None)
+    _ORIGIN.value = origin
+    try:
+        yield
+    finally:
+        _ORIGIN.value = previous
+
+
+def emit(kind: str, product_ids, previous=None, version=None, rows: pd.DataFrame | None = None) -> ChangeEvent:
+    """
+    Records and delivers one event. Subscribers run on the writer's thread;
+    one that fails is skipped (its cache is still keyed on the old version,
+    so it rebuilds on the next read).
+    """
+    if kind not in EVENT_KINDS:
+        raise ValueError(f"Unknown change kind: {kind}")
+    global _SEQ
+    with _LOCK:
+        _SEQ += 1
+        event = ChangeEvent(kind, tuple(int(p) for p in product_ids), previous, version, rows, _SEQ,
+                            getattr(_ORIGIN, "value", None))
+        _HISTORY.append(event)
+        targets = [cb for kinds, cb in _SUBSCRIBERS if kinds is None or kind in kinds]
+    for cb in targets:
+        try:
+            cb(event)
+        except Exception:
+            pass
+    return event
+
+
+def last_seq() -> int:
+    return _SEQ
+
+
+def events_since(seq: int, until: int | None = None, exclude_origin=None) -> list[ChangeEvent]:
+    """
+    Events after `seq` and up to `until` (oldest first), leaving out those
+    emitted as `exclude_origin`; older ones may have been dropped.
+    """
+    with _LOCK:
+        return [
+            e for e in _HISTORY
+            if e.seq > seq and (until is None or e.seq <= until)
+            and (exclude_origin is None or e.origin != exclude_origin)
+        ]
+
+
+def summarize(events: list[ChangeEvent]) -> dict:
+    """{kind: number of distinct Product IDs} over a list of events."""
+    ids = {}
+    for e in events:
+        ids.setdefault(e.kind, set()).update(e.product_ids)
+    return {kind: len(pids) for kind, pids in ids.items()}
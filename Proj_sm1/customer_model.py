@@ -0,0 +1,280 @@
+# customer_model.py
+import os
+import numpy as np
+import pandas as pd
+
+from store_utils import file_version, parse_dates, format_dates, write_csv, store_lock
+
+CUSTOMER_STATS_CSV = "Customer_stats.csv"
+# distinct (customer, sale date) pairs: one pair is one visit
+CUSTOMER_DAYS_CSV = "Customer_days.csv"
+
+STATS_COLUMNS = [
+    "Customer ID", "Visits", "Lines", "First_Visit", "Last_Visit", "Total_Spend",
+]
+DAYS_COLUMNS = ["Customer ID", "Date"]
+
+# sales append per-customer delta rows to the stats file; it is folded back
+# to one row per customer once it holds this many rows per customer
+STATS_COMPACT_RATIO = 2
+STATS_COMPACT_MIN_ROWS = 1_000
+
+SEGMENTS = ["Champions", "Loyal", "New", "At Risk", "Lost", "Regular"]
+
+
+# ---------------------------
+# Loading / Saving
+# ---------------------------
+def _read_stats() -> pd.DataFrame:
+    """Raw stats rows: one base row per customer plus any appended deltas."""
+    df = pd.read_csv(CUSTOMER_STATS_CSV)
+    for col in STATS_COLUMNS:
+        if col not in df.columns:
+            df[col] = pd.NA
+    df = df[STATS_COLUMNS]
+    df["Customer ID"] = pd.to_numeric(df["Customer ID"], errors="coerce")
+    df = df.dropna(subset=["Customer ID"])
+    df["Customer ID"] = df["Customer ID"].astype(int)
+    df["Visits"] = pd.to_numeric(df["Visits"], errors="coerce").fillna(0).astype(int)
+    df["Lines"] = pd.to_numeric(df["Lines"], errors="coerce").fillna(0).astype(int)
+    df["Total_Spend"] = pd.to_numeric(df["Total_Spend"], errors="coerce").fillna(0.0)
+    df["First_Visit"] = parse_dates(df["First_Visit"])
+    df["Last_Visit"] = parse_dates(df["Last_Visit"])
+    return df
+
+
+def _fold_stats(raw: pd.DataFrame) -> pd.DataFrame:
+    """Folds base rows and deltas into one row per customer, indexed by Customer ID."""
+    return raw.groupby("Customer ID").agg(
+        Visits=("Visits", "sum"),
+        Lines=("Lines", "sum"),
+        First_Visit=("First_Visit", "min"),
+        Last_Visit=("Last_Visit", "max"),
+        Total_Spend=("Total_Spend", "sum"),
+    )
+
+
+def _stats_rows(stats: pd.DataFrame) -> pd.DataFrame:
+    out = stats.reset_index()[STATS_COLUMNS]
+    out["First_Visit"] = format_dates(out["First_Visit"])
+    out["Last_Visit"] = format_dates(out["Last_Visit"])
+    return out
+
+
+def save_customer_stats(stats: pd.DataFrame) -> None:
+    write_csv(_stats_rows(stats), CUSTOMER_STATS_CSV)
+
+
+def _compact_stats() -> tuple:
+    """Rewrites the stats file as one row per customer; returns (stats, file version)."""
+    with store_lock(CUSTOMER_STATS_CSV):
+        stats = _fold_stats(_read_stats())
+        save_customer_stats(stats)
+        return stats, file_version(CUSTOMER_STATS_CSV)
+
+
+def _day_keys(customer_ids, dates) -> np.ndarray:
+    """One int64 key per (customer, day) pair."""
+    days = parse_dates(pd.Series(dates)).to_numpy().astype("datetime64[D]").astype(np.int64)
+    return np.asarray(customer_ids, dtype=np.int64) * (1 << 20) + days
+
+
+# days-file version -> sorted (customer, day) keys
+_DAYS_CACHE = {}
+
+
+def _known_days() -> np.ndarray:
+    version = file_version(CUSTOMER_DAYS_CSV)
+    cached = _DAYS_CACHE.get(version)
+    if cached is not None:
+        return cached
+    df = pd.read_csv(CUSTOMER_DAYS_CSV)
+    keys = np.unique(_day_keys(pd.to_numeric(df["Customer ID"], errors="coerce").fillna(0), df["Date"]))
+    _DAYS_CACHE.clear()
+    _DAYS_CACHE[version] = keys
+    return keys
+
+
+def rebuild_customer_stats(sales_df: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Recomputes the per-customer table (and the visit-day index) from the
+    full sales log plus the per-customer rollups of archived lines, and
+    saves it. Only needed once (or after editing the log by hand);
+    afterwards update_customer_stats keeps it current.
+    """
+    parts = []
+    if sales_df is None:
+        # imported lazily: sales_model updates this store on every transaction
+        from sales_model import load_sales, load_customer_archive
+        sales_df = load_sales()
+        archive = load_customer_archive()
+        parts.append(pd.DataFrame({
+            "Customer ID": archive["Customer ID"],
+            "Date of Sale": archive["Date"],
+            "Lines": archive["Lines"],
+            "Spend": archive["Spend"],
+        }))
+    parts.append(pd.DataFrame({
+        "Customer ID": sales_df["Customer ID"],
+        "Date of Sale": sales_df["Date of Sale"],
+        "Lines": 1,
+        "Spend": pd.to_numeric(sales_df["Total Sale Amount"], errors="coerce").fillna(0.0),
+    }))
+
+    sales = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+    sales["Customer ID"] = pd.to_numeric(sales["Customer ID"], errors="coerce")
+    sales = sales.dropna(subset=["Customer ID"])
+    sales["Customer ID"] = sales["Customer ID"].astype(int)
+    sales["Date of Sale"] = parse_dates(sales["Date of Sale"])
+
+    # a visit is one distinct (customer, date) pair, as in update_customer_stats
+    days = sales.drop_duplicates(["Customer ID", "Date of Sale"])
+    stats = sales.groupby("Customer ID").agg(
+        Lines=("Lines", "sum"),
+        First_Visit=("Date of Sale", "min"),
+        Last_Visit=("Date of Sale", "max"),
+        Total_Spend=("Spend", "sum"),
+    )
+    stats.insert(0, "Visits", days.groupby("Customer ID").size().reindex(stats.index).fillna(0).astype(int))
+
+    with store_lock(CUSTOMER_STATS_CSV):
+        write_csv(pd.DataFrame({
+            "Customer ID": days["Customer ID"].to_numpy(),
+            "Date": format_dates(days["Date of Sale"]).to_numpy(),
+        }, columns=DAYS_COLUMNS), CUSTOMER_DAYS_CSV)
+        save_customer_stats(stats)
+    return stats
+
+
+# ---------------------------
+# Incremental Maintenance
+# ---------------------------
+def update_customer_stats(new_rows: list[dict]) -> None:
+    """
+    Folds newly appended sales lines into the per-customer table by
+    appending one delta row per customer touched; nothing is rewritten.
+    A visit is one distinct (customer, date) pair, checked against the
+    visit-day index, so a backdated line on an already visited day joins
+    that visit. Cost is O(customers touched), independent of log size.
+    """
+    rows = [r for r in new_rows if r.get("Customer ID") is not None and not pd.isna(r.get("Customer ID"))]
+    if not rows:
+        return
+
+    if not (os.path.exists(CUSTOMER_STATS_CSV) and os.path.exists(CUSTOMER_DAYS_CSV)):
+        rebuild_customer_stats()   # the log already contains new_rows
+        return
+
+    batch = pd.DataFrame({
+        "Customer ID": [int(r["Customer ID"]) for r in rows],
+        "Date of Sale": parse_dates(pd.Series([r["Date of Sale"] for r in rows])).to_numpy(),
+        "Amount": [float(r.get("Total Sale Amount", 0.0) or 0.0) for r in rows],
+    })
+    delta = batch.groupby("Customer ID").agg(
+        Lines=("Amount", "size"),
+        First_Visit=("Date of Sale", "min"),
+        Last_Visit=("Date of Sale", "max"),
+        Total_Spend=("Amount", "sum"),
+    )
+    days = batch.drop_duplicates(["Customer ID", "Date of Sale"])
+    keys = _day_keys(days["Customer ID"], days["Date of Sale"])
+
+    with store_lock(CUSTOMER_STATS_CSV):
+        known = _known_days()
+        pos = np.searchsorted(known, keys).clip(max=max(len(known) - 1, 0))
+        new_day = ~(known[pos] == keys) if len(known) else np.ones(len(keys), dtype=bool)
+        fresh = days[new_day]
+        delta.insert(0, "Visits", fresh.groupby("Customer ID").size().reindex(delta.index).fillna(0).astype(int))
+
+        if not fresh.empty:
+            pd.DataFrame({
+                "Customer ID": fresh["Customer ID"].to_numpy(),
+                "Date": format_dates(fresh["Date of Sale"]).to_numpy(),
+            }).to_csv(CUSTOMER_DAYS_CSV, mode="a", header=False, index=False)
+            # patch the cached index instead of re-reading the file we just appended to
+            _DAYS_CACHE.clear()
+            _DAYS_CACHE[file_version(CUSTOMER_DAYS_CSV)] = np.union1d(known, keys[new_day])
+        _stats_rows(delta).to_csv(CUSTOMER_STATS_CSV, mode="a", header=False, index=False)
+
+
+# ---------------------------
+# RFM Scoring
+# ---------------------------
+def _score(values: pd.Series, higher_is_better: bool = True) -> pd.Series:
+    """Quintile score 1..5 over the customer table."""
+    pct = values.rank(method="average", pct=True, ascending=higher_is_better)
+    return np.ceil(pct * 5).clip(1, 5).astype(int)
+
+
+def _with_rfm(stats: pd.DataFrame) -> pd.DataFrame:
+    stats = stats.copy()
+    stats["Avg_Bill"] = (stats["Total_Spend"] / stats["Visits"].where(stats["Visits"] > 0)).fillna(0.0).round(2)
+    if stats.empty:
+        for col in ["Recency_Days", "R_Score", "F_Score", "M_Score", "RFM", "Segment"]:
+            stats[col] = pd.Series(dtype=object)
+        return stats
+
+    last = stats["Last_Visit"]
+    # recency is measured against the latest activity in the store
+    stats["Recency_Days"] = (last.max() - last).dt.days
+    stats["R_Score"] = _score(stats["Recency_Days"], higher_is_better=False)
+    stats["F_Score"] = _score(stats["Visits"])
+    stats["M_Score"] = _score(stats["Total_Spend"])
+    stats["RFM"] = (
+        stats["R_Score"].astype(str) + stats["F_Score"].astype(str) + stats["M_Score"].astype(str)
+    )
+
+    r, f = stats["R_Score"], stats["F_Score"]
+    stats["Segment"] = np.select(
+        [
+            (r >= 4) & (f >= 4),
+            f >= 4,
+            (r >= 4) & (f <= 2),
+            (r <= 2) & (f >= 3),
+            (r <= 2) & (f <= 2),
+        ],
+        SEGMENTS[:5],
+        default="Regular",
+    )
+    return stats
+
+
+# stats-file version -> scored customer table (indexed by Customer ID)
+_STATS_CACHE = {}
+
+
+def load_customer_stats() -> pd.DataFrame:
+    """
+    Returns the per-customer table indexed by Customer ID, with Avg_Bill,
+    recency and R/F/M scores. Cached until the stats file changes.
+    """
+    if not os.path.exists(CUSTOMER_STATS_CSV):
+        rebuild_customer_stats()
+
+    version = file_version(CUSTOMER_STATS_CSV)
+    cached = _STATS_CACHE.get(version)
+    if cached is not None:
+        return cached
+
+    raw = _read_stats()
+    stats = _fold_stats(raw)
+    if len(raw) > max(STATS_COMPACT_RATIO * len(stats), STATS_COMPACT_MIN_ROWS):
+        stats, version = _compact_stats()
+    stats = _with_rfm(stats)
+    _STATS_CACHE.clear()
+    _STATS_CACHE[version] = stats
+    return stats
+
+
+def get_customer(customer_id):
+    """O(1) lookup of one customer's aggregates; None if unknown."""
+    stats = load_customer_stats()
+    cid = int(customer_id)
+    if cid not in stats.index:
+        return None
+    return stats.loc[cid]
+
+
+def customers_in_segment(segment: str) -> pd.DataFrame:
+    stats = load_customer_stats()
+    return stats[stats["Segment"] == segment].sort_values("Total_Spend", ascending=False)
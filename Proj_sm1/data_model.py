@@ -1,163 +1,434 @@
-# data_model.py
-import pandas as pd
-import os
-from datetime import datetime, timedelta
-
-CSV_FILE = "product_data_manufacture_expiry.csv"  # <-- change here if your file name is different
-
-COLUMNS = [
-    "Product ID", "Product Name", "Category", "Type",
-    "Unit Price", "Total Quantity", "Total_Amount",
-    "Manufacture_Date", "Expiry_Days", "Expiry_Date",
-]
-
-
-# ---------------------------
-# Loading / Saving
-# ---------------------------
-def load_products() -> pd.DataFrame:
-    if not os.path.exists(CSV_FILE):
-        df = pd.DataFrame(columns=COLUMNS)
-        df.to_csv(CSV_FILE, index=False)
-        return df
-
-    df = pd.read_csv(CSV_FILE)
-
-    # Ensure columns exist
-    for col in COLUMNS:
-        if col not in df.columns:
-            df[col] = pd.NA
-
-    # Keep only expected columns & order
-    df = df[COLUMNS]
-
-    # Convert types
-    df["Product ID"] = pd.to_numeric(df["Product ID"], errors="coerce").astype("Int64")
-    df["Unit Price"] = pd.to_numeric(df["Unit Price"], errors="coerce")
-    df["Total Quantity"] = pd.to_numeric(df["Total Quantity"], errors="coerce")
-    df["Total_Amount"] = pd.to_numeric(df["Total_Amount"], errors="coerce")
-
-    df["Manufacture_Date"] = pd.to_datetime(df["Manufacture_Date"], errors="coerce").dt.date
-    df["Expiry_Date"] = pd.to_datetime(df["Expiry_Date"], errors="coerce").dt.date
-
-    return df
-
-
-def save_products(df: pd.DataFrame) -> None:
-    df.to_csv(CSV_FILE, index=False)
-
-
-# ---------------------------
-# Auto Type Detection
-# ---------------------------
-def auto_detect_type(product_name: str) -> str:
-    name = (product_name or "").lower()
-
-    nonveg_keywords = [
-        "chicken", "fish", "meat", "mutton", "prawn", "prawns",
-        "nugget", "sausage", "ham", "salami", "cold cut", "bacon"
-    ]
-    veg_keywords = ["fruit", "vegetable", "veg", "tomato", "potato", "greens"]
-    inedible_keywords = [
-        "detergent", "cleaner", "liquid", "soap", "tissue",
-        "paste", "sanitizer", "shampoo", "toothpaste"
-    ]
-
-    if any(k in name for k in nonveg_keywords):
-        return "Non-Veg"
-    if any(k in name for k in veg_keywords):
-        return "Veg"
-    if any(k in name for k in inedible_keywords):
-        return "Inedible"
-    return "Veg"  # default edible
-
-
-# ---------------------------
-# Auto Expiry Days
-# ---------------------------
-def auto_expiry_days(product_name: str, product_type: str) -> int:
-    name = (product_name or "").lower()
-    pt = (product_type or "").lower()
-
-    if pt == "inedible":
-        return 548  # 1.5 years approx
-
-    nonveg_keywords = ["chicken", "meat", "fish", "prawn", "mutton"]
-    coldcut_keywords = ["sausage", "ham", "salami", "cold cut", "bacon"]
-    fruitveg_keywords = ["fruit", "veg", "vegetable", "tomato", "potato"]
-    juice_keywords = ["juice"]
-    grain_keywords = ["rice", "wheat", "cereal", "grain", "dal", "lentil"]
-
-    if any(k in name for k in nonveg_keywords):
-        return 7
-    if any(k in name for k in coldcut_keywords):
-        return 365
-    if any(k in name for k in fruitveg_keywords):
-        return 7
-    if any(k in name for k in juice_keywords):
-        return 180
-    if any(k in name for k in grain_keywords):
-        return 365
-
-    return 7  # default edible expiry
-
-
-# ---------------------------
-# Product ID Generation
-# ---------------------------
-def _range_for_type(product_type: str) -> tuple[int, int]:
-    pt = product_type.lower()
-    if pt == "non-veg":
-        return 4200, 4299
-    if pt == "veg":
-        return 4700, 4899  # you allowed 4800 too
-    if pt == "inedible":
-        return 5700, 5799
-    # default: treat as veg
-    return 4700, 4899
-
-
-def generate_product_id(df: pd.DataFrame, product_type: str) -> int:
-    start, end = _range_for_type(product_type)
-    existing = df["Product ID"].dropna().astype(int)
-    in_range = existing[(existing >= start) & (existing <= end)]
-
-    if in_range.empty:
-        candidate = start + 1
-    else:
-        candidate = int(in_range.max()) + 1
-
-    if candidate > end:
-        raise ValueError(
-            f"No more Product IDs available for type '{product_type}' "
-            f"in range {start}-{end}."
-        )
-    return candidate
-
-
-# ---------------------------
-# Validation Helpers
-# ---------------------------
-def validate_manufacture_date(manu_date) -> tuple[str | None, str | None]:
-    """
-    Returns (error_msg, warning_msg).
-    error_msg != None => block.
-    warning_msg != None => show but allow.
-    """
-    today = datetime.now().date()
-    if manu_date > today:
-        return "Manufacture date cannot be in the future.", None
-
-    if (today - manu_date).days > 182:  # ~6 months
-        return None, (
-            "This product was manufactured over 6 months ago. "
-            "It might be too old for certain purposes."
-        )
-
-    return None, None
-
-
-def check_expired(manu_date, expiry_days: int) -> tuple[bool, datetime.date]:
-    expiry_date = manu_date + timedelta(days=int(expiry_days))
-    today = datetime.now().date()
-    return expiry_date < today, expiry_date
+# data_model.py
+import numpy as np
+import pandas as pd
+import os
+import threading
+from datetime import datetime, timedelta
+
+from store_utils import file_version, parse_dates, format_dates, write_csv, store_lock
+from shared_snapshot import load_shared
+from io_metrics import observe, record_parse, record_write, record_coercion
+from change_bus import emit, PRODUCT_ADDED, PRODUCT_UPDATED, PRODUCT_REMOVED
+
+CSV_FILE = "product_data_manufacture_expiry.csv"  # <-- change here if your file name is different
+
+# Deleted Product IDs waiting for compaction (hidden from load_products)
+TOMBSTONES_CSV = "Product_tombstones.csv"
+COMPACT_AFTER_TOMBSTONES = 200   # remove page starts a background compaction past this
+
+COLUMNS = [
+    "Product ID", "Product Name", "Category", "Type",
+    "Unit Price", "Total Quantity", "Total_Amount",
+    "Manufacture_Date", "Expiry_Days", "Expiry_Date",
+]
+
+# ---------------------------
+# Compact In-Memory Schema
+# ---------------------------
+# Repeated strings are categoricals (one small integer code per row),
+# IDs/quantities are 32-bit and dates are datetime64 - never Python objects.
+# Approximate budget per product row: ~45 bytes (+ the shared category tables).
+PRODUCT_DTYPES = {
+    "Product ID": "Int32",
+    "Product Name": "category",
+    "Category": "category",
+    "Type": "category",
+    "Unit Price": "float64",
+    "Total Quantity": "Int32",
+    "Total_Amount": "float64",
+    "Expiry_Days": "Int32",
+}
+PRODUCT_DATE_COLUMNS = ["Manufacture_Date", "Expiry_Date"]
+
+
+# ---------------------------
+# Loading / Saving
+# ---------------------------
+# products version -> typed product frame (callers get a copy: pages add columns)
+_PRODUCTS_CACHE = {}
+
+
+def load_products() -> pd.DataFrame:
+    if not os.path.exists(CSV_FILE):
+        df = pd.DataFrame(columns=COLUMNS)
+        df.to_csv(CSV_FILE, index=False)
+        return df
+
+    with observe("load_products", "products", CSV_FILE, cached=True) as op:
+        version = products_version()
+        df = _PRODUCTS_CACHE.get(version)
+        if df is None:
+            # parsed once per version across processes when snapshots are enabled
+            df = load_shared("products", version, _read_products)
+            _cache_products(version, df)
+        op.rows = len(df)
+    return df.copy()
+
+
+def _cache_products(version, df: pd.DataFrame) -> None:
+    _PRODUCTS_CACHE.clear()
+    _PRODUCTS_CACHE[version] = df
+
+
+def _read_products() -> pd.DataFrame:
+    df = pd.read_csv(CSV_FILE)
+    record_parse("products", CSV_FILE, len(df))
+
+    # Ensure columns exist
+    for col in COLUMNS:
+        if col not in df.columns:
+            df[col] = pd.NA
+
+    # Keep only expected columns & order
+    df = df[COLUMNS]
+
+    # deleted rows stay in the file until compaction
+    dead = tombstoned_ids()
+    if dead:
+        df = df[~pd.to_numeric(df["Product ID"], errors="coerce").isin(dead)]
+
+    return apply_product_schema(df)
+
+
+def apply_product_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Coerces a product frame to the compact schema (see PRODUCT_DTYPES)."""
+    for col, dtype in PRODUCT_DTYPES.items():
+        if dtype == "category":
+            df[col] = df[col].astype("string").str.strip().astype("category")
+        else:
+            values = pd.to_numeric(df[col], errors="coerce")
+            record_coercion("products", col, df[col], values)
+            df[col] = values.astype(dtype) if dtype == "float64" else values.round().astype(dtype)
+
+    for col in PRODUCT_DATE_COLUMNS:
+        dates = parse_dates(df[col])
+        record_coercion("products", col, df[col], dates)
+        df[col] = dates
+
+    return df
+
+
+def save_products(df: pd.DataFrame) -> None:
+    """
+    Rewrites the product file. A full rewrite is also a compaction: rows
+    with a tombstone are left out and the tombstone log is cleared.
+    """
+    with products_lock(), observe("save_products", "products", CSV_FILE) as op:
+        before = products_version()
+        old_hashes = _saved_hashes(before)
+        out = df.copy()
+        dead = tombstoned_ids()
+        if dead:
+            out = out[~pd.to_numeric(out["Product ID"], errors="coerce").isin(dead)]
+        typed = apply_product_schema(out.reindex(columns=COLUMNS))
+        for col in PRODUCT_DATE_COLUMNS:
+            if col in out.columns:
+                out[col] = format_dates(out[col])
+        write_csv(out, CSV_FILE)
+        op.rows = len(out)
+        record_write("products", "rewrite", len(out), os.path.getsize(CSV_FILE))
+        if dead and os.path.exists(TOMBSTONES_CSV):
+            os.remove(TOMBSTONES_CSV)
+        # the next load_products reads back what was just written
+        _cache_products(products_version(), typed.reset_index(drop=True))
+        _emit_product_changes(typed, old_hashes, before)
+
+
+def products_version():
+    """Cache key for anything derived from load_products (file + pending deletes)."""
+    return file_version(CSV_FILE), file_version(TOMBSTONES_CSV)
+
+
+# ---------------------------
+# Change Events
+# ---------------------------
+# products version -> {Product ID: row hash}, what the next save is diffed against
+_ROW_HASHES = {}
+
+
+def _row_hashes(df: pd.DataFrame) -> pd.Series:
+    rows = df.dropna(subset=["Product ID"])
+    rows = rows[~rows["Product ID"].duplicated(keep="last").to_numpy()]
+    hashes = pd.util.hash_pandas_object(rows[COLUMNS], index=False)
+    return pd.Series(hashes.to_numpy(), index=rows["Product ID"].astype(int).to_numpy())
+
+
+def _saved_hashes(version) -> pd.Series:
+    cached = _ROW_HASHES.get(version)
+    if cached is None:
+        cached = _row_hashes(load_products())
+    return cached
+
+
+def _emit_product_changes(typed: pd.DataFrame, old_hashes: pd.Series, before) -> None:
+    """Diffs the rows just written against the previous version, one event per kind."""
+    version = products_version()
+    new_hashes = _row_hashes(typed)
+    _ROW_HASHES.clear()
+    _ROW_HASHES[version] = new_hashes
+
+    common = new_hashes.index.intersection(old_hashes.index)
+    changed = common[new_hashes[common].to_numpy() != old_hashes[common].to_numpy()]
+    added = new_hashes.index.difference(old_hashes.index)
+    removed = old_hashes.index.difference(new_hashes.index)
+
+    pids = typed["Product ID"]
+    latest = typed[~pids.duplicated(keep="last").to_numpy() & pids.notna().to_numpy()]
+    for kind, ids in ((PRODUCT_ADDED, added), (PRODUCT_UPDATED, changed)):
+        if len(ids):
+            rows = latest[latest["Product ID"].isin(ids).to_numpy()].reset_index(drop=True)
+            emit(kind, ids, before, version, rows)
+    if len(removed):
+        emit(PRODUCT_REMOVED, removed, before, version)
+
+
+def patch_products(df: pd.DataFrame, event, rows: pd.DataFrame | None = None) -> pd.DataFrame:
+    """
+    Applies a product change event to a cached frame with a Product ID
+    column instead of reloading it. `rows` are the event's rows with the
+    cache's derived columns added. Updated rows keep their place, added rows
+    go last, removed rows are dropped; categoricals stay categorical.
+    """
+    hit = df["Product ID"].isin(event.product_ids).fillna(False).to_numpy()
+    if event.kind == PRODUCT_REMOVED:
+        return df[~hit]
+    rows = event.rows if rows is None else rows
+    old_pos = pd.Series(np.arange(len(df)), index=df["Product ID"].to_numpy())
+    old_pos = old_pos[~old_pos.index.duplicated(keep="last")]
+    row_pos = rows["Product ID"].map(old_pos).to_numpy(dtype=float, na_value=np.nan)
+    row_pos = np.where(np.isnan(row_pos), len(df) + np.arange(len(rows)), row_pos)
+
+    out = pd.concat([df[~hit], rows[df.columns]])
+    order = np.argsort(np.concatenate([np.flatnonzero(~hit), row_pos]), kind="stable")
+    out = out.iloc[order]
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype) and not isinstance(out[col].dtype, pd.CategoricalDtype):
+            out[col] = out[col].astype("category")
+    return out
+
+
+# ---------------------------
+# Tombstone Deletes / Compaction
+# ---------------------------
+_COMPACT_THREAD = None
+
+
+def products_lock():
+    """
+    Held for every read-modify-write of the product file. A file lock, so
+    it also excludes the POS service process (see store_utils.store_lock).
+    """
+    return store_lock(CSV_FILE)
+
+# tombstone-file version -> set of deleted Product IDs
+_TOMBSTONE_CACHE = {}
+
+
+def tombstoned_ids() -> set:
+    version = file_version(TOMBSTONES_CSV)
+    if version is None:
+        return set()
+    cached = _TOMBSTONE_CACHE.get(version)
+    if cached is not None:
+        return cached
+    ids = pd.to_numeric(pd.read_csv(TOMBSTONES_CSV)["Product ID"], errors="coerce").dropna()
+    dead = set(ids.astype(int))
+    _TOMBSTONE_CACHE.clear()
+    _TOMBSTONE_CACHE[version] = dead
+    return dead
+
+
+def delete_products(product_ids) -> int:
+    """
+    Records tombstones for the given Product IDs (an append, no rewrite).
+    They disappear from load_products at once; compact_products removes
+    them from the file. Returns how many IDs were newly deleted.
+    """
+    # a compaction clears the tombstone log: no tombstone may land in between
+    with products_lock():
+        dead = tombstoned_ids()
+        new = sorted({int(p) for p in product_ids if not pd.isna(p)} - dead)
+        if not new:
+            return 0
+        before = products_version()
+        stamp = datetime.now().replace(microsecond=0).isoformat(sep=" ")
+        pd.DataFrame({"Product ID": new, "Deleted_At": stamp}).to_csv(
+            TOMBSTONES_CSV, mode="a", header=not os.path.exists(TOMBSTONES_CSV), index=False
+        )
+        version = products_version()
+        hashes = _ROW_HASHES.pop(before, None)
+        if hashes is not None:
+            _ROW_HASHES[version] = hashes.drop(new, errors="ignore")
+    emit(PRODUCT_REMOVED, new, before, version)
+    return len(new)
+
+
+def compact_products() -> int:
+    """Physically drops tombstoned rows with one rewrite. Returns rows removed."""
+    with products_lock():
+        pending = len(tombstoned_ids())
+        if pending:
+            save_products(load_products())
+        return pending
+
+
+def compact_in_background() -> bool:
+    """Starts compact_products on a daemon thread unless one is already running."""
+    global _COMPACT_THREAD
+    if _COMPACT_THREAD is not None and _COMPACT_THREAD.is_alive():
+        return False
+    _COMPACT_THREAD = threading.Thread(target=compact_products, name="product-compaction", daemon=True)
+    _COMPACT_THREAD.start()
+    return True
+
+
+def decrement_stock(sold: dict) -> None:
+    """
+    Subtracts sold quantities {Product ID: qty} from Total Quantity (never
+    below 0) and refreshes Total_Amount, with a single rewrite of the file.
+    """
+    if not sold:
+        return
+    # read-modify-write of the whole file: sessions selling at once must not lose updates
+    with products_lock():
+        _decrement_stock(sold)
+
+
+def _decrement_stock(sold: dict) -> None:
+    df = load_products()
+    qty = df["Product ID"].map(sold).fillna(0).astype("int32")
+    hit = (qty > 0).to_numpy()
+    new_qty = (df["Total Quantity"] - qty).clip(lower=0)
+
+    df["Total Quantity"] = new_qty
+    df.loc[hit, "Total_Amount"] = new_qty[hit] * df.loc[hit, "Unit Price"]
+
+    # dates follow the lot each product now sells from (FEFO head)
+    # imported lazily: lot_model builds on this module
+    from lot_model import fefo_heads
+    heads = fefo_heads(sold)
+    if heads:
+        pids = df["Product ID"]
+        df["Manufacture_Date"] = pids.map({p: h[0] for p, h in heads.items()}).fillna(df["Manufacture_Date"])
+        df["Expiry_Date"] = pids.map({p: h[1] for p, h in heads.items()}).fillna(df["Expiry_Date"])
+    if "Applied_Sales_Total" not in df.columns:
+        df["Applied_Sales_Total"] = 0
+    df["Applied_Sales_Total"] = df["Applied_Sales_Total"].fillna(0).astype(int) + qty
+    save_products(df)
+
+
+# ---------------------------
+# Auto Type Detection
+# ---------------------------
+def auto_detect_type(product_name: str) -> str:
+    name = (product_name or "").lower()
+
+    nonveg_keywords = [
+        "chicken", "fish", "meat", "mutton", "prawn", "prawns",
+        "nugget", "sausage", "ham", "salami", "cold cut", "bacon"
+    ]
+    veg_keywords = ["fruit", "vegetable", "veg", "tomato", "potato", "greens"]
+    inedible_keywords = [
+        "detergent", "cleaner", "liquid", "soap", "tissue",
+        "paste", "sanitizer", "shampoo", "toothpaste"
+    ]
+
+    if any(k in name for k in nonveg_keywords):
+        return "Non-Veg"
+    if any(k in name for k in veg_keywords):
+        return "Veg"
+    if any(k in name for k in inedible_keywords):
+        return "Inedible"
+    return "Veg"  # default edible
+
+
+# ---------------------------
+# Auto Expiry Days
+# ---------------------------
+def auto_expiry_days(product_name: str, product_type: str) -> int:
+    name = (product_name or "").lower()
+    pt = (product_type or "").lower()
+
+    if pt == "inedible":
+        return 548  # 1.5 years approx
+
+    nonveg_keywords = ["chicken", "meat", "fish", "prawn", "mutton"]
+    coldcut_keywords = ["sausage", "ham", "salami", "cold cut", "bacon"]
+    fruitveg_keywords = ["fruit", "veg", "vegetable", "tomato", "potato"]
+    juice_keywords = ["juice"]
+    grain_keywords = ["rice", "wheat", "cereal", "grain", "dal", "lentil"]
+
+    if any(k in name for k in nonveg_keywords):
+        return 7
+    if any(k in name for k in coldcut_keywords):
+        return 365
+    if any(k in name for k in fruitveg_keywords):
+        return 7
+    if any(k in name for k in juice_keywords):
+        return 180
+    if any(k in name for k in grain_keywords):
+        return 365
+
+    return 7  # default edible expiry
+
+
+# ---------------------------
+# Product ID Generation
+# ---------------------------
+def _range_for_type(product_type: str) -> tuple[int, int]:
+    pt = product_type.lower()
+    if pt == "non-veg":
+        return 4200, 4299
+    if pt == "veg":
+        return 4700, 4899  # you allowed 4800 too
+    if pt == "inedible":
+        return 5700, 5799
+    # default: treat as veg
+    return 4700, 4899
+
+
+def generate_product_id(df: pd.DataFrame, product_type: str) -> int:
+    start, end = _range_for_type(product_type)
+    # deleted-but-not-compacted IDs are still taken
+    existing = pd.concat([df["Product ID"].dropna().astype(int), pd.Series(sorted(tombstoned_ids()), dtype=int)])
+    in_range = existing[(existing >= start) & (existing <= end)]
+
+    if in_range.empty:
+        candidate = start + 1
+    else:
+        candidate = int(in_range.max()) + 1
+
+    if candidate > end:
+        raise ValueError(
+            f"No more Product IDs available for type '{product_type}' "
+            f"in range {start}-{end}."
+        )
+    return candidate
+
+
+# ---------------------------
+# Validation Helpers
+# ---------------------------
+def validate_manufacture_date(manu_date) -> tuple[str | None, str | None]:
+    """
+    Returns (error_msg, warning_msg).
+    error_msg != None => block.
+    warning_msg != None => show but allow.
+    """
+    today = datetime.now().date()
+    if manu_date > today:
+        return "Manufacture date cannot be in the future.", None
+
+    if (today - manu_date).days > 182:  # ~6 months
+        return None, (
+            "This product was manufactured over 6 months ago. "
+            "It might be too old for certain purposes."
+        )
+
+    return None, None
+
+
+def check_expired(manu_date, expiry_days: int) -> tuple[bool, datetime.date]:
+    expiry_date = manu_date + timedelta(days=int(expiry_days))
+    today = datetime.now().date()
+    return expiry_date < today, expiry_date
@@ -1,83 +1,190 @@
-# discount_page.py
-import streamlit as st
-import pandas as pd
-from data_model import load_products
-
-
-def render_discount_page():
-    st.title("💸 Auto Discounts – Expiry-Based Pricing")
-
-    df = load_products()
-
-    if df.empty:
-        st.warning("No products available.")
-        return
-
-    # Convert dates
-    df["Expiry_Date"] = pd.to_datetime(df["Expiry_Date"], errors="coerce")
-    df["Manufacture_Date"] = pd.to_datetime(df["Manufacture_Date"], errors="coerce")
-    df["Days_Left"] = (df["Expiry_Date"] - pd.Timestamp.now().normalize()).dt.days
-
-    # -----------------------
-    # 1️⃣ NEAR-EXPIRY LIST
-    # -----------------------
-    st.subheader("📅 Near-Expiry Items")
-
-    near = df[df["Days_Left"] <= 7].sort_values("Days_Left")
-
-    if near.empty:
-        st.info("No items expiring within 7 days.")
-    else:
-        st.dataframe(near, use_container_width=True)
-
-    st.markdown("---")
-
-    # -----------------------
-    # 2️⃣ CATEGORY-WISE DISCOUNT
-    # -----------------------
-    st.subheader("🏷 Apply Discount (Category-Wise)")
-
-    categories = sorted(df["Category"].unique().tolist())
-    sel_cat = st.selectbox("Select Category", ["-- Select --"] + categories)
-
-    discount_cat = st.number_input("Discount %", min_value=0, max_value=90, value=10)
-
-    if st.button("Apply Category Discount"):
-        if sel_cat == "-- Select --":
-            st.error("Select a valid category.")
-        else:
-            filtered = df[df["Category"] == sel_cat].copy()
-            filtered["Discounted Price"] = filtered["Unit Price"] * (1 - discount_cat / 100)
-            st.success(f"Applied {discount_cat}% discount to category: {sel_cat}")
-            st.dataframe(filtered[[
-                "Product ID", "Product Name", "Category", "Unit Price", "Discounted Price"
-            ]], use_container_width=True)
-
-    st.markdown("---")
-
-    # -----------------------
-    # 3️⃣ ITEM-WISE DISCOUNT
-    # -----------------------
-    st.subheader("🎯 Apply Discount (Item-Wise)")
-
-    item_options = df.apply(
-        lambda r: f"{int(r['Product ID'])} | {r['Product Name']} | ₹{r['Unit Price']}",
-        axis=1
-    ).tolist()
-
-    sel_item = st.selectbox("Select Product", ["-- Select --"] + item_options)
-
-    discount_item = st.number_input("Item Discount %", min_value=0, max_value=90, value=5)
-
-    if st.button("Apply Item Discount"):
-        if sel_item == "-- Select --":
-            st.error("Select a valid product.")
-        else:
-            pid = int(sel_item.split("|")[0].strip())
-            row = df[df["Product ID"] == pid].iloc[0]
-
-            new_price = row["Unit Price"] * (1 - discount_item / 100)
-
-            st.success(f"Applied {discount_item}% discount to {row['Product Name']}")
-            st.write(f"### Before: ₹{row['Unit Price']}")
-            st.write(f"### After: ₹{new_price:.2f}")
+# discount_page.py
+import streamlit as st
+import pandas as pd
+from data_model import load_products
+from product_index import product_choices, get_product
+from lot_model import open_lots
+from pricing_model import (
+    load_discount_rules,
+    add_discount_rule,
+    remove_discount_rule,
+    compute_effective_prices,
+    simulate_discounts,
+    best_discount_per_product,
+)
+
+
+def render_discount_page():
+    st.title("💸 Auto Discounts – Expiry-Based Pricing")
+
+    df = load_products()
+
+    if df.empty:
+        st.warning("No products available.")
+        return
+
+    # Dates are already datetime64
+    df["Days_Left"] = (df["Expiry_Date"] - pd.Timestamp.now().normalize()).dt.days
+
+    rules = load_discount_rules()
+    prices = compute_effective_prices(df, rules)
+    df["Discount_Pct"] = prices["Discount_Pct"].to_numpy()
+    df["Effective Price"] = prices["Effective Price"].to_numpy()
+
+    # -----------------------
+    # 1️⃣ NEAR-EXPIRY LIST
+    # -----------------------
+    st.subheader("📅 Near-Expiry Lots")
+
+    # expiry tiers apply per lot: each lot is priced on its own days left
+    lots = open_lots()
+    lot_prices = compute_effective_prices(lots, rules)
+    lots["Days_Left"] = lot_prices["Days_Left"].to_numpy()
+    lots["Discount_Pct"] = lot_prices["Discount_Pct"].to_numpy()
+    lots["Effective Price"] = lot_prices["Effective Price"].to_numpy()
+
+    near = lots[(lots["Days_Left"] <= 7).fillna(False).to_numpy()].sort_values("Days_Left")
+
+    if near.empty:
+        st.info("No lots expiring within 7 days.")
+    else:
+        st.dataframe(near, use_container_width=True)
+
+    st.markdown("---")
+
+    # -----------------------
+    # 2️⃣ CATEGORY-WISE DISCOUNT
+    # -----------------------
+    st.subheader("🏷 Apply Discount (Category-Wise)")
+
+    categories = sorted(df["Category"].unique().tolist())
+    sel_cat = st.selectbox("Select Category", ["-- Select --"] + categories)
+
+    discount_cat = st.number_input("Discount %", min_value=0, max_value=90, value=10)
+
+    if st.button("Apply Category Discount"):
+        if sel_cat == "-- Select --":
+            st.error("Select a valid category.")
+        elif add_discount_rule("Category", sel_cat, discount_cat) is None:
+            st.success(f"Removed the discount on category: {sel_cat}")
+        else:
+            filtered = df[df["Category"] == sel_cat].copy()
+            filtered["Discounted Price"] = filtered["Unit Price"] * (1 - discount_cat / 100)
+            st.success(f"Applied {discount_cat}% discount to category: {sel_cat}")
+            st.dataframe(filtered[[
+                "Product ID", "Product Name", "Category", "Unit Price", "Discounted Price"
+            ]], use_container_width=True)
+
+    st.markdown("---")
+
+    # -----------------------
+    # 3️⃣ ITEM-WISE DISCOUNT
+    # -----------------------
+    st.subheader("🎯 Apply Discount (Item-Wise)")
+
+    item_pids, item_labels = product_choices("Price_Label")
+    sel_item = st.selectbox(
+        "Select Product", [None] + item_pids,
+        format_func=lambda p: "-- Select --" if p is None else item_labels[p],
+    )
+
+    discount_item = st.number_input("Item Discount %", min_value=0, max_value=90, value=5)
+
+    if st.button("Apply Item Discount"):
+        if sel_item is None:
+            st.error("Select a valid product.")
+        else:
+            pid = sel_item
+            row = get_product(pid)
+
+            if add_discount_rule("Product", pid, discount_item) is None:
+                st.success(f"Removed the discount on {row['Product Name']}")
+            else:
+                new_price = row["Unit Price"] * (1 - discount_item / 100)
+
+                st.success(f"Applied {discount_item}% discount to {row['Product Name']}")
+                st.write(f"### Before: ₹{row['Unit Price']}")
+                st.write(f"### After: ₹{new_price:.2f}")
+
+    st.markdown("---")
+
+    # -----------------------
+    # 4️⃣ EXPIRY-TIER DISCOUNT
+    # -----------------------
+    st.subheader("⏳ Auto Discount (Days to Expiry)")
+
+    tier_cat = st.selectbox("Applies to", ["(All)"] + categories, key="tier_cat")
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        tier_min = st.number_input("From days left", min_value=0, value=0, key="tier_min")
+    with c2:
+        tier_max = st.number_input("To days left", min_value=0, value=3, key="tier_max")
+    with c3:
+        tier_pct = st.number_input("Tier Discount %", min_value=0, max_value=90, value=20, key="tier_pct")
+
+    if st.button("Add Expiry Tier", key="tier_add"):
+        if tier_min > tier_max:
+            st.error("'From days left' must not exceed 'To days left'.")
+        else:
+            target = "*" if tier_cat == "(All)" else tier_cat
+            if add_discount_rule("Expiry", target, tier_pct, tier_min, tier_max) is None:
+                st.success(f"Removed the {tier_min}–{tier_max} days tier for {tier_cat}.")
+            else:
+                st.success(f"{tier_pct}% off for {tier_cat} items with {tier_min}–{tier_max} days left.")
+
+    st.markdown("---")
+
+    # -----------------------
+    # 5️⃣ ACTIVE RULES
+    # -----------------------
+    st.subheader("📋 Active Discount Rules")
+
+    rules = load_discount_rules()
+    if rules.empty:
+        st.info("No discount rules stored. Sales use the regular Unit Price.")
+    else:
+        st.dataframe(rules, use_container_width=True)
+        rule_id = st.selectbox("Remove rule", ["-- Select --"] + rules["Rule ID"].astype(int).tolist(), key="rule_remove")
+        if st.button("Remove Rule", key="rule_remove_btn"):
+            if rule_id == "-- Select --":
+                st.error("Select a rule to remove.")
+            elif remove_discount_rule(rule_id):
+                st.success(f"Removed rule {rule_id}.")
+
+    st.markdown("---")
+
+    # -----------------------
+    # 6️⃣ WHAT-IF SIMULATION (DUMMY TAB)
+    # -----------------------
+    st.subheader("🧪 What-if Simulation (does not change live prices)")
+
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        sim_range = st.slider("Discount range %", 0, 90, (0, 50), key="sim_range")
+    with c2:
+        sim_step = st.number_input("Step %", min_value=1, max_value=30, value=5, key="sim_step")
+    with c3:
+        sim_near = st.number_input("Near-expiry window (days)", min_value=1, value=7, key="sim_near")
+    sim_elasticity = st.slider(
+        "Demand uplift per 100% discount (elasticity)", 0.0, 10.0, 2.0, 0.5, key="sim_elasticity"
+    )
+
+    levels = list(range(sim_range[0], sim_range[1] + 1, int(sim_step)))
+    sim = simulate_discounts(df, levels, int(sim_near), float(sim_elasticity))
+
+    if sim.empty:
+        st.info(f"No items expiring within {sim_near} days to simulate.")
+    else:
+        summary = sim.groupby("Discount_Pct")[["Units_Cleared", "Unsold_Units", "Revenue"]].sum()
+        best_level = summary["Revenue"].idxmax()
+        st.write(
+            f"**{sim['Product ID'].nunique()} products × {len(levels)} levels** — "
+            f"best flat discount: **{best_level:.0f}%** "
+            f"(₹{summary.loc[best_level, 'Revenue']:,.2f} recovered, "
+            f"{summary.loc[best_level, 'Unsold_Units']:,.0f} units left to expire)"
+        )
+        st.line_chart(summary[["Revenue"]])
+        st.dataframe(summary.reset_index(), use_container_width=True)
+
+        st.write("### Best Discount per Product")
+        st.dataframe(best_discount_per_product(sim), use_container_width=True)
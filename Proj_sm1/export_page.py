@@ -0,0 +1,62 @@
+# export_page.py
+import tempfile
+from datetime import datetime, timedelta
+import streamlit as st
+
+from report_export import REPORTS, EXPORT_FORMATS, write_report, export_file_name
+
+
+def _deferred_export(report: str, fmt: str, params: dict):
+    """
+    Download data for st.download_button: generated only when the button is
+    clicked (on Streamlit's download thread), streamed chunk by chunk into a
+    temporary file rather than built up in memory.
+    """
+    def build():
+        out = tempfile.TemporaryFile()
+        write_report(report, out, fmt, **params)
+        out.seek(0)
+        return out
+    return build
+
+
+def render_export_page():
+    st.title("📤 Reports & Exports")
+
+    report = st.selectbox(
+        "Report:", list(REPORTS), format_func=lambda r: REPORTS[r][0], key="export_report"
+    )
+    accepted = REPORTS[report][2]
+    params = {}
+
+    if "start" in accepted:
+        today = datetime.today().date()
+        period = st.date_input("Sale dates:", value=(today - timedelta(days=30), today), key="export_period")
+        if isinstance(period, (list, tuple)) and len(period) == 2:
+            params["start"], params["end"] = period
+        else:
+            st.info("Select a start and end date.")
+            return
+    if "customer_id" in accepted:
+        params["customer_id"] = int(st.number_input("Customer ID", min_value=1, step=1, key="export_customer"))
+    if "days" in accepted:
+        if st.checkbox("Only lots expiring within N days", key="export_days_on"):
+            params["days"] = int(st.number_input("N (days)", min_value=0, value=7, key="export_days"))
+        else:
+            st.caption("Expired and near-expiry lots (category windows, as on the Updates page).")
+
+    fmt = st.radio("Format:", list(EXPORT_FORMATS), format_func=str.upper, horizontal=True, key="export_format")
+
+    st.download_button(
+        f"⬇️ Download {REPORTS[report][0]}",
+        data=_deferred_export(report, fmt, params),
+        file_name=export_file_name(report, fmt),
+        mime=EXPORT_FORMATS[fmt][0],
+        on_click="ignore",
+        key="export_download",
+    )
+    st.caption(
+        "Very large exports can also be streamed without going through the browser session: "
+        f"`python report_export.py {report} --format {fmt} -o <file>`, or GET "
+        f"`/reports/{report}?format={fmt}` on the POS service."
+    )
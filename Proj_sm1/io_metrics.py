@@ -0,0 +1,281 @@
+# io_metrics.py
+"""
+In-process I/O metrics for the CSV stores, in the Prometheus text format.
+
+The data layer reports every load / save / append of the product file and
+the sales log: durations, rows, bytes, full rewrites vs appends, cache
+hits vs parses and values that failed type coercion. The current size of
+each store is exported as a gauge, so an alert can fire before a store
+gets big enough to hurt latency.
+
+Collection is always on (a few dict updates per operation). Exposure is
+opt-in:
+    SHELPIFY_METRICS_PORT=9108   -> http://127.0.0.1:9108/metrics
+    SHELPIFY_METRICS_FILE=path   -> rewritten every METRICS_DUMP_INTERVAL seconds
+The POS service also answers GET /metrics.
+"""
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METRICS_DUMP_INTERVAL = 15.0   # seconds between dump-file rewrites
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ROWS_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+# ---------------------------
+# Metric Types
+# ---------------------------
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._lock = threading.Lock()
+        self._values = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels[n] for n in self.label_names)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key: tuple, value) -> list[str]:
+        return [f"{self.name}{_labels(self.label_names, key)} {_num(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = SECONDS_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self, key: tuple, value) -> list[str]:
+        counts, total, n = value
+        labels = _labels(self.label_names, key)
+        lines = []
+        for bound, c in zip(self.buckets, counts):
+            le = _labels(self.label_names, key, f'le="{_num(bound)}"')
+            lines.append(f"{self.name}_bucket{le} {c}")
+        inf = _labels(self.label_names, key, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{inf} {n}")
+        lines.append(f"{self.name}_sum{labels} {_num(total)}")
+        lines.append(f"{self.name}_count{labels} {n}")
+        return lines
+
+
+REGISTRY = []
+
+OP_SECONDS = Histogram("shelpify_store_op_seconds", "Duration of data-layer operations.", ("op",))
+OP_ROWS = Histogram("shelpify_store_op_rows", "Rows returned or written per operation.", ("op",), ROWS_BUCKETS)
+OP_ERRORS = Counter("shelpify_store_op_errors_total", "Data-layer operations that raised.", ("op",))
+CACHE_LOOKUPS = Counter("shelpify_store_cache_lookups_total", "Loads served from cache (hit) or by parsing the file (miss).", ("op", "result"))
+BYTES_READ = Counter("shelpify_store_read_bytes_total", "Bytes of CSV parsed.", ("store",))
+ROWS_PARSED = Counter("shelpify_store_parsed_rows_total", "Rows parsed from CSV.", ("store",))
+WRITES = Counter("shelpify_store_writes_total", "Writes to a store, by mode (rewrite = whole file, append).", ("store", "mode"))
+BYTES_WRITTEN = Counter("shelpify_store_written_bytes_total", "Bytes written to a store.", ("store", "mode"))
+ROWS_WRITTEN = Counter("shelpify_store_written_rows_total", "Rows written to a store.", ("store", "mode"))
+COERCION_FAILURES = Counter("shelpify_store_coercion_failures_total", "Non-empty values that failed type coercion (read as missing).", ("store", "column"))
+STORE_SIZE = Gauge("shelpify_store_size_bytes", "Current size of the store file.", ("store",))
+
+
+# ---------------------------
+# Recording
+# ---------------------------
+_LOCAL = threading.local()
+
+
+class _Op:
+    __slots__ = ("rows", "parsed")
+
+    def __init__(self):
+        self.rows = None
+        self.parsed = False
+
+
+@contextmanager
+def observe(op: str, store: str, path: str, cached: bool = False):
+    """
+    Times one operation on a store. Set `.rows` on the yielded object; for a
+    cached load (cached=True) a record_parse inside the block marks a miss.
+    """
+    rec = _Op()
+    outer = getattr(_LOCAL, "op", None)
+    _LOCAL.op = rec
+    start = time.perf_counter()
+    try:
+        yield rec
+    except Exception:
+        OP_ERRORS.inc(op=op)
+        raise
+    finally:
+        _LOCAL.op = outer
+        OP_SECONDS.observe(time.perf_counter() - start, op=op)
+        if rec.rows is not None:
+            OP_ROWS.observe(rec.rows, op=op)
+        if cached:
+            CACHE_LOOKUPS.inc(op=op, result="miss" if rec.parsed else "hit")
+        record_size(store, path)
+
+
+def record_size(store: str, path: str) -> None:
+    try:
+        STORE_SIZE.set(os.path.getsize(path), store=store)
+    except OSError:
+        pass
+
+
+def record_parse(store: str, path: str, rows: int) -> None:
+    """A full parse of the store file (its size counts as bytes read)."""
+    op = getattr(_LOCAL, "op", None)
+    if op is not None:
+        op.parsed = True
+    try:
+        BYTES_READ.inc(os.path.getsize(path), store=store)
+    except OSError:
+        pass
+    ROWS_PARSED.inc(rows, store=store)
+
+
+def record_write(store: str, mode: str, rows: int, nbytes: int) -> None:
+    WRITES.inc(store=store, mode=mode)
+    ROWS_WRITTEN.inc(rows, store=store, mode=mode)
+    BYTES_WRITTEN.inc(max(nbytes, 0), store=store, mode=mode)
+
+
+def record_coercion(store: str, column: str, before, after) -> None:
+    """Counts values present in `before` that coerced to missing in `after`."""
+    failed = int((after.isna() & before.notna()).sum())
+    if failed:
+        COERCION_FAILURES.inc(failed, store=store, column=column)
+
+
+# ---------------------------
+# Exposure
+# ---------------------------
+def render_metrics() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def dump_metrics(path: str) -> None:
+    """Writes the current metrics to `path` atomically (textfile-collector style)."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render_metrics())
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):   # keep the console quiet
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        data = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves /metrics on a daemon thread (local only by default)."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def _dump_loop(path: str) -> None:
+    while True:
+        time.sleep(METRICS_DUMP_INTERVAL)
+        try:
+            dump_metrics(path)
+        except OSError:
+            pass
+
+
+_STARTED = False
+_START_LOCK = threading.Lock()
+
+
+def start_metrics() -> None:
+    """
+    Starts the exposure configured by SHELPIFY_METRICS_PORT and/or
+    SHELPIFY_METRICS_FILE (once per process; a no-op when neither is set).
+    """
+    global _STARTED
+    with _START_LOCK:
+        if _STARTED:
+            return
+        _STARTED = True
+        port = os.environ.get("SHELPIFY_METRICS_PORT")
+        if port:
+            try:
+                serve_metrics(int(port))
+            except OSError:
+                pass   # another process (e.g. a second app server) already serves it
+        path = os.environ.get("SHELPIFY_METRICS_FILE")
+        if path:
+            threading.Thread(target=_dump_loop, args=(path,), name="metrics-dump", daemon=True).start()
+            atexit.register(dump_metrics, path)
@@ -0,0 +1,355 @@
+# load_test.py
+"""
+Multi-session load test for the Streamlit app, on one machine.
+
+Generates a store of the requested size in a scratch directory, then drives
+the real app headlessly with Streamlit's AppTest: every simulated user is a
+thread with its own AppTest session, all in this process - the same way the
+Streamlit server runs sessions, so module-level caches, the change bus and
+the CSV stores are shared exactly as in production.
+
+The POS service (pos_api.py) runs as a separate process and is not driven
+here; its writes are kept apart from the app's by the stores' file locks
+(store_utils.store_lock), not by anything in this process.
+
+Cashiers log in and ring up sales on the Sales tab; managers log in, change
+the analytics filters and search products. Every rerun is timed and
+reported per step (p50 / p95 / p99 latency, errors), with overall
+throughput:
+
+    python load_test.py --sessions 20 --duration 60 --products 2000 --sales 100000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from datetime import date
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_SCRIPT = os.path.join(APP_DIR, "app.py")
+RUN_TIMEOUT = 120   # seconds per rerun before it counts as an error
+
+# name stems per category (so auto-detected types and expiry windows are realistic)
+CATALOG = {
+    "Dairy/Eggs": ("Veg", 10, ["Milk", "Curd", "Cheese", "Paneer", "Butter", "Eggs"]),
+    "Fruit": ("Veg", 7, ["Apple", "Banana", "Mango", "Orange", "Grapes"]),
+    "Vegetable": ("Veg", 7, ["Tomatoes", "Potatoes", "Onions", "Spinach", "Carrots"]),
+    "Meat/Protein": ("Non-Veg", 5, ["Chicken Breast", "Mutton", "Chicken Wings"]),
+    "Seafood": ("Non-Veg", 3, ["Prawns", "Salmon", "Tuna Steak"]),
+    "Snack/Confectionery": ("Veg", 180, ["Chips", "Chocolate", "Biscuits", "Cookies"]),
+    "Grain/Staple": ("Veg", 365, ["Rice", "Wheat Flour", "Lentils", "Oats"]),
+    "Beverage": ("Veg", 270, ["Apple Juice", "Cola", "Green Tea", "Coffee"]),
+    "Household/Care": ("Other", 720, ["Shampoo", "Soap", "Toothpaste"]),
+    "Cleaning": ("Other", 720, ["Detergent", "Floor Cleaner", "Dish Wash"]),
+}
+
+
+# ---------------------------
+# Generated Data
+# ---------------------------
+def generate_store(path: str, n_products: int = 2000, n_sales: int = 100_000,
+                   days: int = 180, seed: int = 0) -> None:
+    """Writes a product file and a sales log of the given sizes into `path`."""
+    # imported here: the app modules resolve their stores against the cwd
+    from data_model import CSV_FILE, COLUMNS
+    from sales_model import SALES_CSV
+
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(date.today())
+    cats = list(CATALOG)
+    cat = np.array(cats)[rng.integers(0, len(cats), n_products)]
+    stems = [CATALOG[c][2][i % len(CATALOG[c][2])] for i, c in enumerate(cat)]
+    shelf = np.array([CATALOG[c][1] for c in cat])
+    manu = today - pd.to_timedelta(rng.integers(0, 30, n_products), unit="D")
+    price = rng.integers(10, 500, n_products).astype(float)
+    qty = rng.integers(50, 1000, n_products)
+    prod = pd.DataFrame({
+        "Product ID": np.arange(1001, 1001 + n_products),
+        "Product Name": [f"{s} {i}" for i, s in enumerate(stems)],
+        "Category": cat,
+        "Type": [CATALOG[c][0] for c in cat],
+        "Unit Price": price,
+        "Total Quantity": qty,
+        "Total_Amount": price * qty,
+        "Manufacture_Date": manu.strftime("%Y-%m-%d"),
+        "Expiry_Days": shelf,
+        "Expiry_Date": (manu + pd.to_timedelta(shelf, unit="D")).strftime("%Y-%m-%d"),
+    })[COLUMNS]
+    prod.to_csv(os.path.join(path, CSV_FILE), index=False)
+
+    # ~4 lines per bill, 70% of bills by a known customer
+    pick = rng.integers(0, n_products, n_sales)
+    bills = np.arange(n_sales) // 4 + 1
+    n_bills = int(bills[-1]) if n_sales else 0
+    bill_day = today - pd.to_timedelta(np.sort(rng.integers(1, days + 1, n_bills))[::-1], unit="D")
+    bill_cust = np.where(rng.random(n_bills) < 0.7, rng.integers(1, 5000, n_bills), -1)
+    sold = rng.integers(1, 5, n_sales)
+    sales = pd.DataFrame({
+        "Customer ID": pd.array(bill_cust[bills - 1], dtype="Int64"),
+        "Product ID": prod["Product ID"].to_numpy()[pick],
+        "Product Name": prod["Product Name"].to_numpy()[pick],
+        "Date of Sale": bill_day[bills - 1].strftime("%Y-%m-%d"),
+        "Quantity Sold": sold,
+        "Unit Price": price[pick],
+        "Total Sale Amount": price[pick] * sold,
+        "Bill ID": bills,
+    })
+    sales.loc[sales["Customer ID"] < 0, "Customer ID"] = pd.NA
+    sales.to_csv(os.path.join(path, SALES_CSV), index=False)
+
+
+# ---------------------------
+# Sessions
+# ---------------------------
+class Recorder:
+    """Thread-safe list of (step, seconds, error or None) samples."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def add(self, step: str, seconds: float, error: str | None) -> None:
+        with self._lock:
+            self.samples.append((step, seconds, error))
+
+
+@contextmanager
+def _shared_test_runtime():
+    """
+    Lets AppTest runs overlap on several threads, for the length of a load
+    test only.
+
+    AppTest installs a mock Runtime for each run and clears it afterwards.
+    With runs overlapping, one session's cleanup would pull the runtime from
+    under the others. So while this is active, Runtime.instance keeps
+    returning the last mock installed.
+
+    This patches private Streamlit internals (Runtime.instance and
+    Runtime._instance, as of streamlit 1.66) for the whole process. It is
+    undone on exit and never happens inside the app itself. If a Streamlit
+    upgrade changes them, the load test breaks, not the app. Latencies are
+    measured on this in-process test runtime, without the server's
+    websocket and serialization costs.
+    """
+    from streamlit.runtime import Runtime
+    original = Runtime.__dict__["instance"]
+    last = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            last[:] = [cls._instance]
+            return cls._instance
+        return last[0] if last else original.__func__(cls)
+
+    Runtime.instance = classmethod(instance)
+    try:
+        yield
+    finally:
+        Runtime.instance = original
+
+
+class Session:
+    """One simulated user: an AppTest session whose reruns are timed."""
+    def __init__(self, recorder: Recorder, rng: random.Random):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(APP_SCRIPT, default_timeout=RUN_TIMEOUT)
+        self.recorder = recorder
+        self.rng = rng
+
+    def run(self, step: str, widget=None) -> bool:
+        """Reruns the app (through `widget` if given) and records the latency."""
+        start = time.perf_counter()
+        error = None
+        try:
+            (widget or self.at).run()
+            if self.at.exception:
+                error = str(self.at.exception[0].value).splitlines()[0]
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        self.recorder.add(step, time.perf_counter() - start, error)
+        return error is None
+
+    def by_label(self, widgets, label: str):
+        return next(w for w in widgets if w.label == label)
+
+    def login(self, username: str) -> bool:
+        if not self.run("login_page"):
+            return False
+        self.at.text_input[0].input(username)
+        self.at.text_input[1].input("load-test")
+        return self.run("login", self.by_label(self.at.button, "Login").click())
+
+
+def cashier(s: Session) -> None:
+    """Picks a product and records a sale line on the Sales tab."""
+    options = s.at.selectbox(key="addtx_select").options
+    s.at.selectbox(key="addtx_select").select_index(s.rng.randrange(1, len(options)))
+    if not s.run("pick_product"):
+        return
+    s.at.number_input(key="addtx_qty").set_value(s.rng.randint(1, 3))
+    if s.rng.random() < 0.7:
+        s.at.text_input(key="addtx_cust").input(str(s.rng.randint(1, 5000)))
+    s.run("add_transaction", s.at.button(key="addtx_create").click())
+
+
+def manager(s: Session) -> None:
+    """Changes an analytics filter or searches for a product."""
+    if s.rng.random() < 0.7:
+        label = s.rng.choice(["Category", "Stock Status", "Expiry Status"])
+        box = s.by_label(s.at.selectbox, label)
+        s.run("analytics_filter", box.set_value(s.rng.choice(box.options)))
+        return
+    if not s.run("open_find", s.at.button(key="home_find").click()):
+        return
+    s.at.radio(key="find_mode").set_value("Product Name")
+    s.at.text_input(key="find_input").input(s.rng.choice(["milk", "chips", "apple", "soap", "rice"]))
+    s.run("find_product", s.at.button(key="find_btn").click())
+    s.run("back_home", s.at.button(key="find_back").click())
+
+
+ROLES = {"cashier": cashier, "manager": manager}
+
+
+def _stopped() -> threading.Event:
+    stop = threading.Event()
+    stop.set()
+    return stop
+
+
+def _user(role: str, recorder: Recorder, stop: threading.Event, think: float, seed: int) -> None:
+    s = Session(recorder, random.Random(seed))
+    s.login(f"{role}-{seed}")
+    while not stop.is_set():
+        try:
+            ROLES[role](s)
+        except (KeyError, IndexError, StopIteration) as e:
+            # the page is not what the script expects (usually after a failed
+            # rerun): count it and start over from the home page
+            recorder.add(f"{role}_script", 0.0, f"{type(e).__name__}: {e}")
+            s.at.session_state["logged_in"] = True
+            s.at.session_state["current_page"] = "home"
+            s.run("recover")
+        time.sleep(s.rng.uniform(0, think))
+
+
+# ---------------------------
+# Report
+# ---------------------------
+def summarize(samples: list, wall_seconds: float) -> dict:
+    """Per-step latency percentiles (ms), error counts and overall throughput."""
+    df = pd.DataFrame(samples, columns=["Step", "Seconds", "Error"])
+    steps = {}
+    for step, grp in df.groupby("Step", sort=False):
+        ms = grp["Seconds"].to_numpy() * 1000
+        errors = int(grp["Error"].notna().sum())
+        steps[step] = {
+            "runs": len(grp),
+            "errors": errors,
+            "error_rate": round(errors / len(grp), 4),
+            "p50_ms": round(float(np.percentile(ms, 50)), 1),
+            "p95_ms": round(float(np.percentile(ms, 95)), 1),
+            "p99_ms": round(float(np.percentile(ms, 99)), 1),
+            "max_ms": round(float(ms.max()), 1),
+        }
+    errors = df["Error"].dropna()
+    return {
+        "wall_seconds": round(wall_seconds, 1),
+        "runs": len(df),
+        "errors": len(errors),
+        "error_rate": round(len(errors) / len(df), 4) if len(df) else 0.0,
+        "throughput_runs_per_s": round(len(df) / wall_seconds, 2) if wall_seconds else 0.0,
+        "steps": steps,
+        "top_errors": errors.value_counts().head(5).to_dict(),
+    }
+
+
+def run_load_test(sessions: int = 10, duration: float = 60.0, cashier_share: float = 0.5,
+                  think: float = 1.0, products: int = 2000, sales: int = 100_000,
+                  seed: int = 0, workdir: str | None = None, keep: bool = False,
+                  warmup: bool = True) -> dict:
+    """
+    Runs `sessions` concurrent users for `duration` seconds against a fresh
+    generated store and returns the summary (see summarize). With
+    warmup=False the sessions start on a cold store (first-use backfills).
+    """
+    work = workdir or tempfile.mkdtemp(prefix="shelpify_load_")
+    cwd = os.getcwd()
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    os.chdir(work)
+    with _shared_test_runtime():
+        try:
+            generate_store(work, products, sales, seed=seed)
+            if warmup:
+                # one session builds the derived stores first, so the run measures
+                # steady state rather than every session backfilling at once
+                _user("manager", Recorder(), _stopped(), 0.0, seed)
+            recorder = Recorder()
+            stop = threading.Event()
+            n_cashiers = round(sessions * cashier_share)
+            roles = ["cashier"] * n_cashiers + ["manager"] * (sessions - n_cashiers)
+            threads = [
+                threading.Thread(target=_user, args=(role, recorder, stop, think, seed + i),
+                                 name=f"load-{role}-{i}", daemon=True)
+                for i, role in enumerate(roles)
+            ]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            time.sleep(duration)
+            stop.set()
+            for t in threads:
+                t.join(RUN_TIMEOUT)
+            result = summarize(recorder.samples, time.perf_counter() - start)
+            result.update(sessions=sessions, cashiers=n_cashiers, products=products, sales=sales, warmup=warmup)
+            return result
+        finally:
+            os.chdir(cwd)
+            if not keep and workdir is None:
+                shutil.rmtree(work, ignore_errors=True)
+
+
+def _print_report(result: dict) -> None:
+    print(f"{result['sessions']} sessions ({result['cashiers']} cashiers), "
+          f"{result['products']:,} products, {result['sales']:,} sales lines"
+          f"{'' if result['warmup'] else ', cold start'}")
+    table = pd.DataFrame(result["steps"]).T
+    print(table.to_string())
+    print(f"\n{result['runs']} reruns in {result['wall_seconds']}s: "
+          f"{result['throughput_runs_per_s']} reruns/s, error rate {result['error_rate']:.2%}")
+    for message, count in result["top_errors"].items():
+        print(f"  {count} x {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shelpify multi-session load test")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent users")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to run")
+    parser.add_argument("--cashiers", type=float, default=0.5, help="share of sessions that are cashiers")
+    parser.add_argument("--think", type=float, default=1.0, help="max think time between actions (s)")
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--sales", type=int, default=100_000, help="sales lines in the generated log")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="generate the store here (kept) instead of a temp dir")
+    parser.add_argument("--keep", action="store_true", help="keep the generated temp store")
+    parser.add_argument("--cold", action="store_true", help="skip the warm-up: sessions start on a cold store")
+    parser.add_argument("--json", metavar="FILE", help="also write the summary as JSON")
+    args = parser.parse_args()
+
+    result = run_load_test(args.sessions, args.duration, args.cashiers, args.think,
+                           args.products, args.sales, args.seed, args.workdir, args.keep, not args.cold)
+    _print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+# lot_model.py
+import os
+import heapq
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from data_model import load_products, save_products, products_lock
+from store_utils import file_version, parse_dates, format_dates, store_lock
+
+LOTS_CSV = "Product_lots.csv"
+LOT_ALLOCATIONS_CSV = "Lot_allocations.csv"
+LOT_WRITE_OFFS_CSV = "Lot_write_offs.csv"
+
+# One row per receipt of stock. Quantity left is Quantity_Received minus
+# what sales have drawn from the lot (Lot_allocations.csv) and what was
+# written off once it expired (Lot_write_offs.csv), so all three files
+# are append-only.
+LOT_COLUMNS = [
+    "Lot ID", "Product ID", "Received_Date", "Manufacture_Date", "Expiry_Date", "Quantity_Received",
+]
+LOT_DATE_COLUMNS = ["Received_Date", "Manufacture_Date", "Expiry_Date"]
+ALLOCATION_COLUMNS = ["Lot ID", "Product ID", "Bill ID", "Date of Sale", "Quantity"]
+WRITE_OFF_COLUMNS = ["Lot ID", "Product ID", "Date", "Quantity"]
+
+# lots without an expiry date are used last
+_NO_EXPIRY = np.iinfo(np.int64).max
+
+
+# ---------------------------
+# Loading / Backfill
+# ---------------------------
+def _read_lots() -> pd.DataFrame:
+    lots = pd.read_csv(LOTS_CSV)
+    lots["Lot ID"] = pd.to_numeric(lots["Lot ID"], errors="coerce").astype(int)
+    lots["Product ID"] = pd.to_numeric(lots["Product ID"], errors="coerce").astype("Int32")
+    lots["Quantity_Received"] = pd.to_numeric(lots["Quantity_Received"], errors="coerce").fillna(0).astype(int)
+    for col in LOT_DATE_COLUMNS:
+        lots[col] = parse_dates(lots[col])
+    return lots[LOT_COLUMNS]
+
+
+def _append_lots(lots: pd.DataFrame, path: str = LOTS_CSV) -> None:
+    out = lots[LOT_COLUMNS].copy()
+    for col in LOT_DATE_COLUMNS:
+        out[col] = format_dates(out[col])
+    out.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+
+
+def rebuild_lots() -> None:
+    """
+    One-off backfill: every product row becomes a single lot holding its
+    current quantity and dates. Earlier allocations and write-offs are
+    discarded. Callers hold store_lock(LOTS_CSV).
+    """
+    prod = load_products().dropna(subset=["Product ID"])
+    lots = pd.DataFrame({
+        "Lot ID": np.arange(1, len(prod) + 1),
+        "Product ID": prod["Product ID"].to_numpy(),
+        "Received_Date": prod["Manufacture_Date"].to_numpy(),
+        "Manufacture_Date": prod["Manufacture_Date"].to_numpy(),
+        "Expiry_Date": prod["Expiry_Date"].to_numpy(),
+        "Quantity_Received": prod["Total Quantity"].fillna(0).astype(int).to_numpy(),
+    })
+    for path in (LOTS_CSV, LOT_ALLOCATIONS_CSV, LOT_WRITE_OFFS_CSV):
+        if os.path.exists(path):
+            os.remove(path)
+    pd.DataFrame(columns=ALLOCATION_COLUMNS).to_csv(LOT_ALLOCATIONS_CSV, index=False)
+    # the lot file appears complete: its existence means the backfill is done
+    tmp = LOTS_CSV + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    _append_lots(lots, tmp)
+    os.replace(tmp, LOTS_CSV)
+
+
+# ---------------------------
+# In-Memory Lot Index
+# ---------------------------
+# (lots version, allocations version) -> {"lots": frame indexed by Lot ID with Quantity_Left,
+#                                         "heaps": {Product ID: [(expiry day, Lot ID), ...]},
+#                                         "by_product": {Product ID: [Lot ID, ...]}}
+_LOT_CACHE = {}
+
+
+def _versions():
+    return file_version(LOTS_CSV), file_version(LOT_ALLOCATIONS_CSV), file_version(LOT_WRITE_OFFS_CSV)
+
+
+def _expiry_key(expiry) -> int:
+    return _NO_EXPIRY if pd.isna(expiry) else int(pd.Timestamp(expiry).value // 86_400_000_000_000)
+
+
+def _build_state() -> dict:
+    lots = _read_lots()
+    lots.index = lots["Lot ID"].to_numpy()
+    alloc = pd.read_csv(LOT_ALLOCATIONS_CSV) if os.path.exists(LOT_ALLOCATIONS_CSV) else pd.DataFrame(columns=ALLOCATION_COLUMNS)
+    gone = pd.concat([alloc[["Lot ID", "Quantity"]], load_write_offs()[["Lot ID", "Quantity"]]])
+    used = pd.to_numeric(gone["Quantity"], errors="coerce").groupby(
+        pd.to_numeric(gone["Lot ID"], errors="coerce")
+    ).sum()
+    lots["Quantity_Left"] = (lots["Quantity_Received"] - used.reindex(lots.index).fillna(0)).astype(int)
+
+    # a list sorted by (expiry, lot) is already a valid heap
+    open_lots = lots[lots["Quantity_Left"] > 0]
+    days = open_lots["Expiry_Date"].to_numpy().astype("datetime64[D]")
+    keys = np.where(np.isnat(days), _NO_EXPIRY, days.astype(np.int64))
+    order = np.lexsort((open_lots["Lot ID"].to_numpy(), keys, open_lots["Product ID"].to_numpy()))
+    heaps = {}
+    for pid, key, lot_id in zip(open_lots["Product ID"].to_numpy()[order], keys[order], open_lots["Lot ID"].to_numpy()[order]):
+        heaps.setdefault(int(pid), []).append((int(key), int(lot_id)))
+
+    # Product ID -> all of its Lot IDs (open or not)
+    by_product = {
+        int(pid): list(ids)
+        for pid, ids in lots.groupby("Product ID", observed=True)["Lot ID"]
+    }
+    return {"lots": lots, "heaps": heaps, "by_product": by_product}
+
+
+def _state() -> dict:
+    if not os.path.exists(LOTS_CSV):
+        # several sessions (or the POS service, allocating) can reach the
+        # first use at once: backfill only once, and never under an allocation
+        with store_lock(LOTS_CSV):
+            if not os.path.exists(LOTS_CSV):
+                rebuild_lots()
+    version = _versions()
+    cached = _LOT_CACHE.get(version)
+    if cached is not None:
+        return cached
+    state = _build_state()
+    _LOT_CACHE.clear()
+    _LOT_CACHE[version] = state
+    return state
+
+
+def _rekey(state: dict) -> None:
+    """After our own append the patched state stays valid under the new file versions."""
+    _LOT_CACHE.clear()
+    _LOT_CACHE[_versions()] = state
+
+
+# ---------------------------
+# Receiving / FEFO Allocation
+# ---------------------------
+def add_lot(product_id, quantity: int, manufacture_date, expiry_date, received_date=None) -> int:
+    """
+    Records a lot without touching the product file (for a product whose
+    row is being written with this quantity anyway). Returns the Lot ID.
+    """
+    if int(quantity) <= 0:
+        raise ValueError("Received quantity must be positive.")
+    pid = int(product_id)
+    # Lot IDs and the cached state are read-modify-write, shared with allocate_fefo
+    with store_lock(LOTS_CSV):
+        state = _state()
+        lot_id = int(state["lots"].index.max()) + 1 if len(state["lots"]) else 1
+
+        row = {
+            "Lot ID": lot_id,
+            "Product ID": pid,
+            "Received_Date": pd.Timestamp(received_date or date.today()),
+            "Manufacture_Date": pd.Timestamp(manufacture_date),
+            "Expiry_Date": pd.Timestamp(expiry_date),
+            "Quantity_Received": int(quantity),
+        }
+        _append_lots(pd.DataFrame([row]))
+        state["lots"].loc[lot_id] = {**row, "Quantity_Left": int(quantity)}
+        heapq.heappush(state["heaps"].setdefault(pid, []), (_expiry_key(row["Expiry_Date"]), lot_id))
+        state["by_product"].setdefault(pid, []).append(lot_id)
+        _rekey(state)
+    return lot_id
+
+
+def receive_lot(product_id, quantity: int, manufacture_date, expiry_date, received_date=None) -> int:
+    """
+    Books a receipt of stock as a new lot, adds it to the product's Total
+    Quantity and returns the Lot ID. The product row keeps the dates of its
+    first-expiring open lot.
+    """
+    pid = int(product_id)
+    # read-modify-write of the product file: the same lock as decrement_stock,
+    # so a sale and a receipt at once cannot lose either quantity change
+    with products_lock():
+        lot_id = add_lot(pid, quantity, manufacture_date, expiry_date, received_date)
+
+        prod = load_products()
+        hit = (prod["Product ID"] == pid).fillna(False).to_numpy()
+        prod.loc[hit, "Total Quantity"] = prod.loc[hit, "Total Quantity"].fillna(0) + int(quantity)
+        prod.loc[hit, "Total_Amount"] = prod.loc[hit, "Total Quantity"] * prod.loc[hit, "Unit Price"]
+        head = fefo_heads([pid]).get(pid)
+        if head is not None:
+            prod.loc[hit, "Manufacture_Date"], prod.loc[hit, "Expiry_Date"] = head
+        save_products(prod)
+    return lot_id
+
+
+def allocate_fefo(sales_rows: list[dict]) -> list[dict]:
+    """
+    Draws each sales line's quantity from its product's lots,
+    first-expired-first-out, and records the allocations. Each lot touched
+    costs O(log lots) on the product's heap. Quantity beyond the open lots
+    (stock never received as a lot) is left unallocated.
+    """
+    if not sales_rows:
+        return []
+    with store_lock(LOTS_CSV):
+        return _allocate_fefo(sales_rows)
+
+
+def _allocate_fefo(sales_rows: list[dict]) -> list[dict]:
+    state = _state()
+    lots, heaps = state["lots"], state["heaps"]
+
+    allocations = []
+    for r in sales_rows:
+        pid = int(r["Product ID"])
+        need = int(r["Quantity Sold"])
+        heap = heaps.get(pid, [])
+        while need > 0 and heap:
+            lot_id = heap[0][1]
+            left = int(lots.at[lot_id, "Quantity_Left"])
+            take = min(left, need)
+            lots.at[lot_id, "Quantity_Left"] = left - take
+            need -= take
+            if take == left:
+                heapq.heappop(heap)
+            allocations.append({
+                "Lot ID": lot_id, "Product ID": pid, "Bill ID": r.get("Bill ID"),
+                "Date of Sale": r["Date of Sale"], "Quantity": take,
+            })
+
+    if allocations:
+        pd.DataFrame(allocations)[ALLOCATION_COLUMNS].to_csv(
+            LOT_ALLOCATIONS_CSV, mode="a", header=not os.path.exists(LOT_ALLOCATIONS_CSV), index=False
+        )
+        _rekey(state)
+    return allocations
+
+
+def write_off_expired(on_date=None) -> pd.DataFrame:
+    """
+    Writes off every open lot that expired before `on_date` (today): its
+    quantity left goes to 0 and comes off its product's Total Quantity,
+    and the product moves on to its next lot. Products with fresh stock in
+    other lots are kept. Returns the written-off lots (WRITE_OFF_COLUMNS).
+    """
+    day = pd.Timestamp(on_date or date.today()).normalize()
+    # the same lock order as receive_lot: products, then lots
+    with products_lock():
+        with store_lock(LOTS_CSV):
+            state = _state()
+            lots = state["lots"]
+            hit = lots[((lots["Quantity_Left"] > 0) & (lots["Expiry_Date"] < day)).fillna(False).to_numpy()]
+            out = pd.DataFrame({
+                "Lot ID": hit["Lot ID"].to_numpy(),
+                "Product ID": hit["Product ID"].astype(int).to_numpy(),
+                "Date": day,
+                "Quantity": hit["Quantity_Left"].to_numpy(),
+            }, columns=WRITE_OFF_COLUMNS)
+            if out.empty:
+                return out
+
+            written = out.assign(Date=format_dates(out["Date"]))
+            written.to_csv(LOT_WRITE_OFFS_CSV, mode="a", header=not os.path.exists(LOT_WRITE_OFFS_CSV), index=False)
+            lots.loc[hit.index, "Quantity_Left"] = 0
+            gone = set(hit.index)
+            for pid in set(out["Product ID"]):
+                heap = [entry for entry in state["heaps"].get(pid, []) if entry[1] not in gone]
+                heapq.heapify(heap)
+                state["heaps"][pid] = heap
+            _rekey(state)
+
+        # not a sale: Applied_Sales_Total is left alone
+        off = out.groupby("Product ID")["Quantity"].sum()
+        prod = load_products()
+        qty = prod["Product ID"].map(off).fillna(0).astype(int)
+        hit = (qty > 0).to_numpy()
+        prod.loc[hit, "Total Quantity"] = (prod.loc[hit, "Total Quantity"].fillna(0) - qty[hit]).clip(lower=0)
+        prod.loc[hit, "Total_Amount"] = prod.loc[hit, "Total Quantity"] * prod.loc[hit, "Unit Price"]
+        heads = fefo_heads(off.index)
+        if heads:
+            pids = prod["Product ID"]
+            prod["Manufacture_Date"] = pids.map({p: h[0] for p, h in heads.items()}).fillna(prod["Manufacture_Date"])
+            prod["Expiry_Date"] = pids.map({p: h[1] for p, h in heads.items()}).fillna(prod["Expiry_Date"])
+        save_products(prod)
+    return out
+
+
+# ---------------------------
+# Lot Queries
+# ---------------------------
+def load_write_offs() -> pd.DataFrame:
+    """Expired lot quantities written off (WRITE_OFF_COLUMNS, Date parsed)."""
+    if not os.path.exists(LOT_WRITE_OFFS_CSV):
+        return pd.DataFrame({
+            "Lot ID": pd.Series(dtype=int), "Product ID": pd.Series(dtype=int),
+            "Date": pd.Series(dtype="datetime64[ns]"), "Quantity": pd.Series(dtype=int),
+        })
+    offs = pd.read_csv(LOT_WRITE_OFFS_CSV)
+    offs["Date"] = parse_dates(offs["Date"])
+    return offs[WRITE_OFF_COLUMNS]
+
+
+
+def fefo_heads(product_ids) -> dict:
+    """{Product ID: (Manufacture_Date, Expiry_Date)} of the lot each product sells from next."""
+    state = _state()
+    lots = state["lots"]
+    heads = {}
+    for pid in product_ids:
+        heap = state["heaps"].get(int(pid))
+        if heap:
+            lot = heap[0][1]
+            heads[int(pid)] = (lots.at[lot, "Manufacture_Date"], lots.at[lot, "Expiry_Date"])
+    return heads
+
+
+def load_lots() -> pd.DataFrame:
+    """All lots with Quantity_Left (indexed by Lot ID)."""
+    return _state()["lots"]
+
+
+def lots_for_product(product_id, open_only: bool = True) -> pd.DataFrame:
+    """A product's lots in FEFO order."""
+    state = _state()
+    sel = state["lots"].loc[state["by_product"].get(int(product_id), [])]
+    if open_only:
+        sel = sel[sel["Quantity_Left"] > 0]
+    return sel.sort_values(["Expiry_Date", "Lot ID"]).reset_index(drop=True)
+
+
+def open_lots() -> pd.DataFrame:
+    """
+    Lots with stock left, joined with their product's name, category, type
+    and price. Expiry_Days is the lot's own shelf life, so per-lot expiry
+    windows and discounts can be evaluated with the product-level rules.
+    """
+    lots = _state()["lots"]
+    lots = lots[lots["Quantity_Left"] > 0].reset_index(drop=True)
+    prod = load_products().dropna(subset=["Product ID"]).drop_duplicates("Product ID")
+    info = prod[["Product ID", "Product Name", "Category", "Type", "Unit Price"]]
+    out = lots.merge(info, on="Product ID", how="inner")
+    out["Expiry_Days"] = (out["Expiry_Date"] - out["Manufacture_Date"]).dt.days.astype("Int32")
+    return out[[
+        "Lot ID", "Product ID", "Product Name", "Category", "Type", "Unit Price",
+        "Received_Date", "Manufacture_Date", "Expiry_Date", "Expiry_Days",
+        "Quantity_Received", "Quantity_Left",
+    ]]
+
+
+def stock_drift(prod_df: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Products whose Total Quantity differs from the units left in their open
+    lots. Receipts and sales update both, so a difference means a write
+    bypassed the lots (or only one of the two writes landed).
+    Columns: Product ID, Product Name, Total Quantity, Lot_Quantity, Difference.
+    """
+    prod = load_products() if prod_df is None else prod_df
+    prod = prod.dropna(subset=["Product ID"]).drop_duplicates("Product ID", keep="last")
+    lots = _state()["lots"]
+    left = lots.groupby("Product ID", observed=True)["Quantity_Left"].sum()
+
+    qty = pd.to_numeric(prod["Total Quantity"], errors="coerce").fillna(0).astype(int).to_numpy()
+    in_lots = prod["Product ID"].astype(int).map(left).fillna(0).astype(int).to_numpy()
+    out = pd.DataFrame({
+        "Product ID": prod["Product ID"].astype(int).to_numpy(),
+        "Product Name": prod["Product Name"].astype(object).to_numpy(),
+        "Total Quantity": qty,
+        "Lot_Quantity": in_lots,
+        "Difference": qty - in_lots,
+    })
+    return out[out["Difference"] != 0].reset_index(drop=True)
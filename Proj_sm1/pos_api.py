@@ -0,0 +1,580 @@
+# pos_api.py
+"""
+Local POS ingestion service.
+
+Tills POST sales as JSON; lines are validated against stock, deduplicated by
+idempotency key and committed by a background group-commit writer that turns
+many concurrent requests into one append to Sales_log.csv per batch.
+Reports are streamed back over GET /reports/<name> (see report_export), and
+the data-layer I/O metrics over GET /metrics (see io_metrics).
+
+Run standalone:
+    python pos_api.py --port 8765
+Benchmark with the bundled local client:
+    python pos_api.py --bench 20000 --clients 64
+
+Each group commit costs one pass over the catalogue and the derived stores
+whatever its size, so throughput grows with the number of tills posting at
+once: a few hundred lines/s with 16 tills, well over a thousand with a few
+hundred. A single till posting one bill at a time is bounded by that
+per-commit cost.
+"""
+import argparse
+import json
+import math
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+
+from store_utils import parse_dates
+from data_model import load_products, save_products, decrement_stock, products_version
+from sales_model import add_transactions
+from bill_model import next_bill_id, ensure_bill_ids
+from alert_model import refresh_alerts
+from report_export import REPORTS, EXPORT_FORMATS, stream_report, export_file_name
+from io_metrics import CONTENT_TYPE, render_metrics
+from change_bus import subscribe, unsubscribe, PRODUCT_ADDED, PRODUCT_UPDATED, PRODUCT_REMOVED
+
+IDEMPOTENCY_LOG = "Ingest_keys.jsonl"
+
+MAX_BATCH_LINES = 2000     # lines per group commit
+MAX_BATCH_WAIT = 0.02      # seconds to wait for more requests before committing
+
+
+class IngestError(Exception):
+    """Rejected request; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+# ---------------------------
+# Request Validation
+# ---------------------------
+def _parse_lines(payload) -> tuple[str | None, list[dict]]:
+    """Accepts a single line or {"idempotency_key", "lines": [...]}."""
+    if not isinstance(payload, dict):
+        raise IngestError("Body must be a JSON object.")
+    raw_lines = payload.get("lines", [payload])
+    if not isinstance(raw_lines, list) or not raw_lines:
+        raise IngestError("'lines' must be a non-empty list.")
+
+    lines = []
+    for i, raw in enumerate(raw_lines):
+        try:
+            pid = int(raw["product_id"])
+            qty = int(raw.get("quantity", raw.get("quantity_sold", 1)))
+        except (KeyError, TypeError, ValueError):
+            raise IngestError(f"Line {i}: product_id and quantity must be integers.")
+        if qty <= 0:
+            raise IngestError(f"Line {i}: quantity must be positive.")
+        lines.append({
+            "customer_id": _parse_customer(raw.get("customer_id", payload.get("customer_id")), i),
+            "product_id": pid,
+            "quantity_sold": qty,
+            "unit_price": _parse_price(raw.get("unit_price"), i),
+            "date_of_sale": _parse_date(raw.get("date", payload.get("date")), i),
+        })
+    return payload.get("idempotency_key"), lines
+
+
+def _parse_customer(value, i: int):
+    if value in (None, ""):
+        return None
+    try:
+        cust = int(value)
+    except (TypeError, ValueError):
+        raise IngestError(f"Line {i}: customer_id must be an integer.")
+    if cust <= 0:
+        raise IngestError(f"Line {i}: customer_id must be positive.")
+    return cust
+
+
+def _parse_price(value, i: int):
+    if value is None:
+        return None
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        raise IngestError(f"Line {i}: unit_price must be a number.")
+    if not math.isfinite(price) or price < 0:
+        raise IngestError(f"Line {i}: unit_price must be a non-negative number.")
+    return price
+
+
+def _parse_date(value, i: int):
+    if value in (None, ""):
+        return None
+    parsed = parse_dates(pd.Series([value])).iloc[0] if isinstance(value, str) else pd.NaT
+    if pd.isna(parsed):
+        raise IngestError(f"Line {i}: date must be a date such as 2026-05-10.")
+    return parsed.date()
+
+
+# ---------------------------
+# Group-Commit Writer
+# ---------------------------
+class GroupCommitWriter:
+    """
+    Serializes all writes through one background thread. Requests queue up
+    with their lines already validated against (and reserved from) stock;
+    the writer drains up to MAX_BATCH_LINES at a time and commits them with
+    one sales append, one stock rewrite and one update of each derived store.
+    """
+
+    def __init__(self, max_batch_lines: int = MAX_BATCH_LINES, max_wait: float = MAX_BATCH_WAIT):
+        self.max_batch_lines = max_batch_lines
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stock = {}            # Product ID -> on-hand quantity from the product file
+        self._names = {}            # Product ID -> Product Name
+        self._reserved = {}         # Product ID -> quantity accepted but not yet committed
+        self._stock_version = None
+        self._done = {}             # idempotency key -> response
+        self._inflight = {}         # idempotency key -> Future
+        self._unapplied = {}        # Product ID -> committed quantity whose stock decrement failed
+        self.last_error = None      # last side effect (key log, stock, alerts) that failed after a commit
+        self._thread = None
+        self._stopping = False
+        self._load_idempotency_log()
+
+    # ----- lifecycle -----
+    def start(self):
+        subscribe(self._on_products_changed, [PRODUCT_ADDED, PRODUCT_UPDATED, PRODUCT_REMOVED])
+        self._thread = threading.Thread(target=self._run, name="pos-group-commit", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join()
+        unsubscribe(self._on_products_changed)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    # ----- idempotency -----
+    def _load_idempotency_log(self):
+        if not os.path.exists(IDEMPOTENCY_LOG):
+            return
+        with open(IDEMPOTENCY_LOG, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._done[entry["key"]] = entry["response"]
+
+    # ----- stock -----
+    def _refresh_stock(self):
+        """Re-reads on-hand stock when the product file changed (caller holds the lock)."""
+        version = products_version()
+        if version == self._stock_version:
+            return
+        prod = load_products().dropna(subset=["Product ID"])
+        pids = prod["Product ID"].astype(int)
+        self._stock = dict(zip(pids, prod["Total Quantity"].fillna(0).astype(int)))
+        self._names = dict(zip(pids, prod["Product Name"].astype(str)))
+        self._stock_version = version
+
+    def _on_products_changed(self, event):
+        """Patches the stock map from a product change event (ours or a page's)."""
+        with self._lock:
+            if self._stock_version not in (event.previous, event.version):
+                return
+            if event.kind == PRODUCT_REMOVED:
+                for pid in event.product_ids:
+                    self._stock.pop(pid, None)
+                    self._names.pop(pid, None)
+            else:
+                pids = event.rows["Product ID"].astype(int)
+                self._stock.update(zip(pids, event.rows["Total Quantity"].fillna(0).astype(int)))
+                self._names.update(zip(pids, event.rows["Product Name"].astype(str)))
+            self._stock_version = event.version
+
+    # ----- submit -----
+    def submit(self, key: str | None, lines: list[dict]) -> tuple[Future, bool]:
+        """
+        Validates and reserves stock for one request and queues it.
+        Returns (future of the response, is_duplicate).
+        """
+        with self._lock:
+            if key is not None:
+                if key in self._done:
+                    fut = Future()
+                    fut.set_result(self._done[key])
+                    return fut, True
+                if key in self._inflight:
+                    return self._inflight[key], True
+
+            self._refresh_stock()
+            wanted = {}
+            for line in lines:
+                wanted[line["product_id"]] = wanted.get(line["product_id"], 0) + line["quantity_sold"]
+            for pid, qty in wanted.items():
+                if pid not in self._stock:
+                    raise IngestError(f"Unknown product {pid}.", status=404)
+                available = self._stock[pid] - self._reserved.get(pid, 0)
+                if qty > available:
+                    raise IngestError(f"Not enough stock for {pid}. Available: {available}", status=409)
+            for pid, qty in wanted.items():
+                self._reserved[pid] = self._reserved.get(pid, 0) + qty
+            for line in lines:
+                line["product_name"] = self._names[line["product_id"]]
+
+            fut = Future()
+            if key is not None:
+                self._inflight[key] = fut
+            self._queue.put((key, lines, wanted, fut))
+            return fut, False
+
+    # ----- commit loop -----
+    def _next_batch(self) -> list:
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch, n_lines = [first], len(first[1])
+        deadline = time.monotonic() + self.max_wait
+        while n_lines < self.max_batch_lines:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                self._stopping = True
+                break
+            batch.append(item)
+            n_lines += len(item[1])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._commit(batch)
+            if self._stopping and self._queue.empty():
+                return
+
+    def _commit(self, batch: list):
+        """
+        Commits a batch with one sales append. If it fails before anything
+        reaches the log, each request is retried alone so only the failing
+        ones get an error. Once the lines are in the log every request in the
+        batch succeeds; later failures are side effects, repaired or retried.
+        """
+        responses = []
+
+        def record_keys(rows):
+            # runs in the same locked step as the append, so a retry of a
+            # committed request is always answered from the log of keys
+            pos = 0
+            built = []
+            for key, lines, _, _ in batch:
+                committed = rows[pos:pos + len(lines)]
+                pos += len(lines)
+                built.append({
+                    "idempotency_key": key,
+                    "bill_id": committed[0]["Bill ID"],
+                    "lines": committed,
+                    "total": round(sum(r["Total Sale Amount"] for r in committed), 2),
+                })
+            responses.extend(built)
+            with open(IDEMPOTENCY_LOG, "a", encoding="utf-8") as f:
+                for (key, _, _, _), resp in zip(batch, built):
+                    if key is not None:
+                        f.write(json.dumps({"key": key, "response": resp}) + "\n")
+
+        try:
+            # one bill per request
+            bill_id = next_bill_id(len(batch))
+            all_lines = []
+            for _, lines, _, _ in batch:
+                for line in lines:
+                    line["bill_id"] = bill_id
+                all_lines.extend(lines)
+                bill_id += 1
+            add_transactions(all_lines, on_appended=record_keys)
+        except Exception as exc:
+            if not responses:
+                # nothing was appended
+                if len(batch) > 1:
+                    for item in batch:
+                        self._commit([item])
+                    return
+                key, _, wanted, fut = batch[0]
+                with self._lock:
+                    self._release(wanted)
+                    self._inflight.pop(key, None)
+                fut.set_exception(exc)
+                return
+            self.last_error = exc   # committed; only the key log write failed
+
+        self._apply_stock(batch)
+        with self._lock:
+            for (key, _, _, fut), resp in zip(batch, responses):
+                if key is not None:
+                    self._done[key] = resp
+                    self._inflight.pop(key, None)
+                fut.set_result(resp)
+
+    def _apply_stock(self, batch: list):
+        """
+        Decrements stock for a committed batch, plus any earlier decrement
+        that failed. Reservations are held until the decrement lands, so a
+        failed product-file rewrite cannot oversell; it is retried with the
+        next batch.
+        """
+        sold = dict(self._unapplied)
+        for _, _, wanted, _ in batch:
+            for pid, qty in wanted.items():
+                sold[pid] = sold.get(pid, 0) + qty
+        try:
+            decrement_stock(sold)
+        except Exception as exc:
+            self.last_error = exc
+            self._unapplied = sold
+            return
+        self._unapplied = {}
+        with self._lock:
+            self._release(sold)
+        try:
+            refresh_alerts(sold)
+        except Exception as exc:
+            self.last_error = exc
+
+    def _release(self, wanted: dict):
+        """Drops reservations once committed (stock is re-read from file) or failed."""
+        for pid, qty in wanted.items():
+            left = self._reserved.get(pid, 0) - qty
+            if left > 0:
+                self._reserved[pid] = left
+            else:
+                self._reserved.pop(pid, None)
+
+
+# ---------------------------
+# HTTP Layer
+# ---------------------------
+def _make_handler(writer: GroupCommitWriter):
+    class PosHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):   # keep the console quiet
+            pass
+
+        def _reply(self, status: int, body: dict):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            if url.path == "/health":
+                self._reply(200, {
+                    "status": "ok",
+                    "pending": writer.pending,
+                    "last_error": repr(writer.last_error) if writer.last_error is not None else None,
+                })
+            elif url.path == "/metrics":
+                data = render_metrics().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            elif url.path.startswith("/reports/"):
+                self._stream_report(url.path[len("/reports/"):], urllib.parse.parse_qs(url.query))
+            else:
+                self._reply(404, {"error": "Not found."})
+
+        def _stream_report(self, report: str, query: dict):
+            """Sends the report with chunked encoding as it is generated."""
+            params = {k: v[-1] for k, v in query.items()}
+            fmt = params.pop("format", "csv")
+            if report not in REPORTS:
+                self._reply(404, {"error": f"Unknown report: {report}"})
+                return
+            try:
+                if "customer_id" in params:
+                    params["customer_id"] = int(params["customer_id"])
+                if "days" in params:
+                    params["days"] = int(params["days"])
+                chunks = stream_report(report, fmt, **params)
+            except ValueError as e:
+                self._reply(400, {"error": str(e)})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", EXPORT_FORMATS[fmt][0])
+            self.send_header("Content-Disposition", f'attachment; filename="{export_file_name(report, fmt)}"')
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for data in chunks:
+                    if data:
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.write(b"0\r\n\r\n")
+            except Exception:
+                # headers are gone: drop the connection so the client sees a truncated body
+                self.close_connection = True
+
+        def do_POST(self):
+            if self.path != "/sales":
+                self._reply(404, {"error": "Not found."})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                key, lines = _parse_lines(payload)
+                key = self.headers.get("Idempotency-Key", key)
+                fut, duplicate = writer.submit(key, lines)
+                resp = fut.result()
+            except IngestError as e:
+                self._reply(e.status, {"error": str(e)})
+                return
+            except json.JSONDecodeError:
+                self._reply(400, {"error": "Body is not valid JSON."})
+                return
+            except Exception as e:
+                self._reply(500, {"error": f"Commit failed: {e}"})
+                return
+            self._reply(200 if duplicate else 201, dict(resp, duplicate=duplicate))
+
+    return PosHandler
+
+
+class _TillServer(ThreadingHTTPServer):
+    # many tills may connect at once; the default backlog of 5 resets them
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765) -> tuple[ThreadingHTTPServer, GroupCommitWriter]:
+    """Starts the writer and HTTP server in background threads and returns both."""
+    ensure_bill_ids()   # legacy lines get their Bill IDs before any new bill is issued
+    writer = GroupCommitWriter()
+    writer.start()
+    server = _TillServer((host, port), _make_handler(writer))
+    threading.Thread(target=server.serve_forever, name="pos-http", daemon=True).start()
+    return server, writer
+
+
+def shutdown(server: ThreadingHTTPServer, writer: GroupCommitWriter) -> None:
+    server.shutdown()
+    server.server_close()
+    writer.stop()
+
+
+# ---------------------------
+# Local Client
+# ---------------------------
+def post_sales(url: str, lines: list[dict], idempotency_key: str | None = None,
+               customer_id=None, timeout: float = 30.0) -> tuple[int, dict]:
+    """POSTs one bill to a running service. Returns (HTTP status, JSON body)."""
+    body = {"lines": lines, "idempotency_key": idempotency_key or str(uuid.uuid4())}
+    if customer_id is not None:
+        body["customer_id"] = customer_id
+    req = urllib.request.Request(
+        url.rstrip("/") + "/sales",
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+
+
+def benchmark(n_lines: int = 10000, lines_per_bill: int = 5, clients: int = 16) -> dict:
+    """
+    Runs against a scratch copy of the CSV stores: starts the service on an
+    ephemeral port and pushes `n_lines` through it from `clients` concurrent
+    tills (1 unit per line, cycling over stocked products).
+    Returns throughput in lines per second.
+    """
+    live_dir = os.getcwd()
+    scratch = tempfile.mkdtemp(prefix="shelpify-bench-")
+    for name in os.listdir(live_dir):
+        if name.endswith(".csv"):
+            shutil.copy(os.path.join(live_dir, name), scratch)
+    os.chdir(scratch)
+
+    server, writer = serve(port=0)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        prod = load_products()
+        # plenty of stock so the benchmark measures throughput, not rejections
+        prod["Total Quantity"] = max(n_lines, 1)
+        save_products(prod)
+        pids = prod["Product ID"].dropna().astype(int).tolist()
+        if not pids:
+            raise RuntimeError("No products in stock to benchmark with.")
+        bills = [
+            [{"product_id": pids[(b * lines_per_bill + i) % len(pids)], "quantity": 1}
+             for i in range(lines_per_bill)]
+            for b in range(max(1, n_lines // lines_per_bill))
+        ]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            statuses = list(pool.map(lambda lines: post_sales(url, lines)[0], bills))
+        elapsed = time.perf_counter() - start
+    finally:
+        shutdown(server, writer)
+        os.chdir(live_dir)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    committed = sum(1 for s in statuses if s == 201) * lines_per_bill
+    return {
+        "lines_committed": committed,
+        "rejected_bills": sum(1 for s in statuses if s != 201),
+        "seconds": round(elapsed, 3),
+        "lines_per_second": round(committed / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shelpify local POS ingestion service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--bench", type=int, metavar="LINES",
+                        help="run a local throughput benchmark instead of serving")
+    parser.add_argument("--clients", type=int, default=16,
+                        help="concurrent tills for --bench (default 16)")
+    args = parser.parse_args()
+
+    if args.bench:
+        print(json.dumps(benchmark(args.bench, clients=args.clients), indent=2))
+        return
+
+    server, writer = serve(args.host, args.port)
+    print(f"POS ingestion listening on http://{args.host}:{server.server_address[1]} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutdown(server, writer)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+# pricing_model.py
+import os
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from data_model import load_products, products_version
+from store_utils import file_version, parse_dates, store_lock, write_csv
+from velocity_model import rolling_velocity, VELOCITY_WINDOWS
+
+DISCOUNT_RULES_CSV = "Discount_rules.csv"
+
+# Scope:
+#   "Category" -> Target is a category name
+#   "Product"  -> Target is a Product ID
+#   "Expiry"   -> days-to-expiry tier [Min_Days_Left, Max_Days_Left];
+#                 Target is a category name or "*" for all products
+RULE_COLUMNS = [
+    "Rule ID", "Scope", "Target", "Min_Days_Left", "Max_Days_Left", "Discount_Pct",
+]
+
+RULE_SCOPES = ["Category", "Product", "Expiry"]
+
+
+# ---------------------------
+# Rule Storage
+# ---------------------------
+def load_discount_rules() -> pd.DataFrame:
+    if not os.path.exists(DISCOUNT_RULES_CSV):
+        df = pd.DataFrame(columns=RULE_COLUMNS)
+        with store_lock(DISCOUNT_RULES_CSV):
+            if not os.path.exists(DISCOUNT_RULES_CSV):
+                write_csv(df, DISCOUNT_RULES_CSV)
+        return df
+
+    df = pd.read_csv(DISCOUNT_RULES_CSV, dtype={"Target": str})
+    for col in RULE_COLUMNS:
+        if col not in df.columns:
+            df[col] = pd.NA
+    df = df[RULE_COLUMNS]
+
+    df["Rule ID"] = pd.to_numeric(df["Rule ID"], errors="coerce").astype("Int64")
+    df["Target"] = df["Target"].fillna("*").astype(str).str.strip()
+    df["Min_Days_Left"] = pd.to_numeric(df["Min_Days_Left"], errors="coerce")
+    df["Max_Days_Left"] = pd.to_numeric(df["Max_Days_Left"], errors="coerce")
+    df["Discount_Pct"] = pd.to_numeric(df["Discount_Pct"], errors="coerce").fillna(0.0).clip(0, 90)
+    return df
+
+
+def save_discount_rules(df: pd.DataFrame) -> None:
+    with store_lock(DISCOUNT_RULES_CSV):
+        write_csv(df, DISCOUNT_RULES_CSV)
+
+
+def _scope_key(rules: pd.DataFrame, scope: str, target: str,
+               min_days_left=None, max_days_left=None) -> pd.Series:
+    """Rows of `rules` with the same scope key (scope + target, plus the day range for tiers)."""
+    mask = (rules["Scope"] == scope) & (rules["Target"] == target)
+    if scope == "Expiry":
+        for col, value in (("Min_Days_Left", min_days_left), ("Max_Days_Left", max_days_left)):
+            mask &= rules[col].isna() if value is None else rules[col] == float(value)
+    return mask
+
+
+def add_discount_rule(scope: str, target, discount_pct: float,
+                      min_days_left=None, max_days_left=None):
+    """
+    Stores the discount rule for a scope key, replacing any existing rule for
+    the same category / product / expiry tier. A 0% discount removes the rule
+    instead of storing it. Returns the Rule ID (None when nothing is stored).
+    """
+    if scope not in RULE_SCOPES:
+        raise ValueError(f"Unknown discount scope '{scope}'.")
+    if not 0 <= float(discount_pct) <= 90:
+        raise ValueError("Discount % must be between 0 and 90.")
+
+    target = str(target).strip() if target is not None else "*"
+    # read-modify-write of the whole file: sessions editing rules at once must not lose updates
+    with store_lock(DISCOUNT_RULES_CSV):
+        return _add_discount_rule(scope, target, discount_pct, min_days_left, max_days_left)
+
+
+def _add_discount_rule(scope: str, target: str, discount_pct: float, min_days_left, max_days_left):
+    rules = load_discount_rules()
+    same = _scope_key(rules, scope, target, min_days_left, max_days_left)
+
+    if float(discount_pct) == 0:
+        if same.any():
+            save_discount_rules(rules[~same])
+        return None
+
+    if same.any():
+        # keep the existing Rule ID so the rules list stays stable
+        rule_id = int(rules.loc[same, "Rule ID"].iloc[0])
+        rules = rules[~same]
+    else:
+        ids = rules["Rule ID"].dropna()
+        rule_id = int(ids.max()) + 1 if not ids.empty else 1
+
+    new_row = {
+        "Rule ID": rule_id,
+        "Scope": scope,
+        "Target": target,
+        "Min_Days_Left": min_days_left,
+        "Max_Days_Left": max_days_left,
+        "Discount_Pct": float(discount_pct),
+    }
+    rules = pd.concat([rules, pd.DataFrame([new_row])], ignore_index=True)
+    save_discount_rules(rules.sort_values("Rule ID"))
+    return rule_id
+
+
+def remove_discount_rule(rule_id: int) -> bool:
+    with store_lock(DISCOUNT_RULES_CSV):
+        rules = load_discount_rules()
+        mask = (rules["Rule ID"] == int(rule_id)).fillna(False)
+        if not mask.any():
+            return False
+        save_discount_rules(rules[~mask])
+        return True
+
+
+# ---------------------------
+# Effective Prices
+# ---------------------------
+def compute_effective_prices(prod_df: pd.DataFrame, rules_df: pd.DataFrame,
+                             on_date=None) -> pd.DataFrame:
+    """
+    Computes the effective price of every product in one vectorized pass.
+    Each rule is applied to the whole catalogue as a column operation; when
+    several rules match a product the largest discount wins (no stacking).
+    Returns Product ID, Unit Price, Days_Left, Discount_Pct, Effective Price.
+    """
+    on_date = on_date or date.today()
+    out = pd.DataFrame({
+        "Product ID": pd.to_numeric(prod_df["Product ID"], errors="coerce"),
+        "Unit Price": pd.to_numeric(prod_df["Unit Price"], errors="coerce").fillna(0.0),
+    })
+    expiry = parse_dates(prod_df["Expiry_Date"])
+    out["Days_Left"] = (expiry - pd.Timestamp(on_date)).dt.days
+
+    category = prod_df["Category"].astype(str).str.strip().to_numpy()
+    pid_str = out["Product ID"].astype("Int64").astype(str).to_numpy()
+    days_left = out["Days_Left"].to_numpy(dtype=float, na_value=np.nan)
+    discount = np.zeros(len(out), dtype=float)
+
+    if not rules_df.empty:
+        by_scope = {scope: grp for scope, grp in rules_df.groupby("Scope")}
+
+        cat_rules = by_scope.get("Category")
+        if cat_rules is not None:
+            cat_map = cat_rules.groupby("Target")["Discount_Pct"].max()
+            matched = pd.Series(category).map(cat_map).fillna(0.0).to_numpy()
+            discount = np.maximum(discount, matched)
+
+        prod_rules = by_scope.get("Product")
+        if prod_rules is not None:
+            pid_map = prod_rules.groupby("Target")["Discount_Pct"].max()
+            matched = pd.Series(pid_str).map(pid_map).fillna(0.0).to_numpy()
+            discount = np.maximum(discount, matched)
+
+        tier_rules = by_scope.get("Expiry")
+        if tier_rules is not None:
+            for rule in tier_rules.itertuples(index=False):
+                lo = -np.inf if pd.isna(rule.Min_Days_Left) else rule.Min_Days_Left
+                hi = np.inf if pd.isna(rule.Max_Days_Left) else rule.Max_Days_Left
+                mask = (days_left >= lo) & (days_left <= hi)
+                if rule.Target != "*":
+                    mask &= category == rule.Target
+                discount = np.where(mask, np.maximum(discount, rule.Discount_Pct), discount)
+
+    out["Discount_Pct"] = discount
+    out["Effective Price"] = (out["Unit Price"] * (1 - discount / 100)).round(2)
+    return out
+
+
+# (rules version, products version, date) -> {Product ID: effective price}
+_PRICE_CACHE = {}
+
+
+def get_effective_price_map(on_date=None) -> dict:
+    """
+    Returns {Product ID: effective price} for the given date, cached per
+    rule-set version, product-file version and date.
+    """
+    on_date = on_date or date.today()
+    key = (file_version(DISCOUNT_RULES_CSV), products_version(), on_date)
+    cached = _PRICE_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    prices = compute_effective_prices(load_products(), load_discount_rules(), on_date)
+    prices = prices.dropna(subset=["Product ID"])
+    price_map = dict(zip(prices["Product ID"].astype(int), prices["Effective Price"]))
+
+    # keep only the latest few versions around
+    if len(_PRICE_CACHE) >= 8:
+        _PRICE_CACHE.clear()
+    _PRICE_CACHE[key] = price_map
+    return price_map
+
+
+def get_effective_price(product_id, on_date=None):
+    """
+    O(1) effective-price lookup for checkout. Returns None for unknown products.
+    """
+    return get_effective_price_map(on_date).get(int(product_id))
+
+
+# ---------------------------
+# What-if Simulation
+# ---------------------------
+def _daily_velocity(prod_df: pd.DataFrame, window: int, on_date) -> np.ndarray:
+    """
+    Units sold per day for each product over the trailing `window` days, from
+    the cached velocity rings. Products without sales fall back to the
+    average of their whole category.
+    """
+    if window not in VELOCITY_WINDOWS:
+        raise ValueError(f"Velocity window must be one of {VELOCITY_WINDOWS} days.")
+    rates = rolling_velocity(on_date).set_index("Product ID")[f"Velocity_{window}d"]
+    pids = pd.to_numeric(prod_df["Product ID"], errors="coerce")
+    velocity = pids.map(rates).fillna(0.0).to_numpy(dtype=float)
+
+    cat = prod_df["Category"].astype(str).to_numpy()
+    cat_avg = pd.Series(velocity).groupby(cat).transform("mean").to_numpy()
+    return np.where(velocity > 0, velocity, cat_avg)
+
+
+def simulate_discounts(prod_df: pd.DataFrame, discount_levels,
+                       near_days: int = 7, elasticity: float = 2.0,
+                       history_days: int = 30, on_date=None) -> pd.DataFrame:
+    """
+    Evaluates every discount level against every near-expiry product at once
+    (a products x levels grid). A discount d lifts daily velocity by
+    (1 + elasticity * d); units cleared are capped by stock on hand and by the
+    days left before expiry. `history_days` is one of the velocity windows.
+    Nothing is saved.
+    Returns one row per (product, discount level).
+    """
+    on_date = on_date or date.today()
+    levels = np.asarray(sorted(set(discount_levels)), dtype=float)
+
+    days_left = (parse_dates(prod_df["Expiry_Date"]) - pd.Timestamp(on_date)).dt.days
+    near_mask = ((days_left >= 0) & (days_left <= near_days)).to_numpy()
+    prod = prod_df[near_mask]
+    if prod.empty or levels.size == 0:
+        return pd.DataFrame(columns=[
+            "Product ID", "Product Name", "Category", "Days_Left", "Stock", "Velocity",
+            "Discount_Pct", "Units_Cleared", "Unsold_Units", "Revenue",
+        ])
+
+    # category fallback over the whole catalogue, not just the near-expiry rows
+    velocity = _daily_velocity(prod_df, history_days, on_date)[near_mask][:, None]  # (P, 1)
+    stock = pd.to_numeric(prod["Total Quantity"], errors="coerce").fillna(0).to_numpy(dtype=float)[:, None]
+    price = pd.to_numeric(prod["Unit Price"], errors="coerce").fillna(0).to_numpy(dtype=float)[:, None]
+    left = days_left[near_mask].to_numpy(dtype=float)
+    horizon = np.maximum(left, 1)[:, None]                                       # sell at least today
+    frac = (levels / 100)[None, :]                                               # (1, L)
+
+    units = np.minimum(stock, np.floor(velocity * (1 + elasticity * frac) * horizon))  # (P, L)
+    revenue = units * price * (1 - frac)
+
+    n_levels = levels.size
+    return pd.DataFrame({
+        "Product ID": np.repeat(prod["Product ID"].to_numpy(), n_levels),
+        "Product Name": np.repeat(prod["Product Name"].to_numpy(), n_levels),
+        "Category": np.repeat(prod["Category"].to_numpy(), n_levels),
+        "Days_Left": np.repeat(left, n_levels).astype(int),
+        "Stock": np.repeat(stock[:, 0], n_levels),
+        "Velocity": np.repeat(velocity[:, 0], n_levels).round(2),
+        "Discount_Pct": np.tile(levels, len(prod)),
+        "Units_Cleared": units.ravel(),
+        "Unsold_Units": (stock - units).ravel(),
+        "Revenue": revenue.ravel().round(2),
+    })
+
+
+def best_discount_per_product(sim_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Picks the revenue-maximising discount level for each simulated product.
+    """
+    if sim_df.empty:
+        return sim_df
+    idx = sim_df.groupby("Product ID")["Revenue"].idxmax()
+    return sim_df.loc[idx].sort_values("Days_Left").reset_index(drop=True)
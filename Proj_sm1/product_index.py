@@ -0,0 +1,100 @@
+# product_index.py
+import pandas as pd
+
+from data_model import load_products, products_version, patch_products
+from change_bus import subscribe, PRODUCT_ADDED, PRODUCT_UPDATED, PRODUCT_REMOVED
+from pricing_model import get_effective_price
+from sales_model import get_last_sold_prices
+
+# picker label styles: "<id> | <name> | Qty: <n>" and "<id> | <name> | ₹<price>"
+LABEL_KINDS = ["Stock_Label", "Price_Label"]
+
+
+# ---------------------------
+# Keyed Product Index
+# ---------------------------
+# product-file version -> (products indexed by Product ID, {label kind: (pids, {pid: label})})
+_INDEX_CACHE = {}
+
+
+def _index_rows(prod: pd.DataFrame) -> pd.DataFrame:
+    """Products keyed by Product ID with their picker labels, built column-wise."""
+    pids = prod["Product ID"].astype(int)
+    index = prod.set_index(pids.rename(None))
+    head = pids.astype(str) + " | " + prod["Product Name"].astype(str)
+    qty = prod["Total Quantity"].fillna(0).astype(int).astype(str)
+    index["Stock_Label"] = (head + " | Qty: " + qty).to_numpy()
+    index["Price_Label"] = (head + " | ₹" + prod["Unit Price"].astype(str)).to_numpy()
+    return index
+
+
+def _choices(index: pd.DataFrame) -> dict:
+    pid_list = index.index.tolist()
+    return {kind: (pid_list, dict(zip(pid_list, index[kind]))) for kind in LABEL_KINDS}
+
+
+def _build_index() -> tuple[pd.DataFrame, dict]:
+    # labels are built once per product-file version
+    prod = load_products().dropna(subset=["Product ID"]).drop_duplicates("Product ID", keep="last")
+    index = _index_rows(prod)
+    return index, _choices(index)
+
+
+def _on_products_changed(event) -> None:
+    """Patches the changed rows and their labels into the cached index."""
+    # one save emits an event per kind, all from the same previous version;
+    # patching is idempotent, so a cache already at the new version is patched too
+    cached = _INDEX_CACHE.get(event.previous, _INDEX_CACHE.get(event.version))
+    if cached is None:
+        return
+    rows = None if event.rows is None else _index_rows(event.rows)
+    index = patch_products(cached[0], event, rows)
+    _INDEX_CACHE.clear()
+    _INDEX_CACHE[event.version] = (index, _choices(index))
+
+
+subscribe(_on_products_changed, [PRODUCT_ADDED, PRODUCT_UPDATED, PRODUCT_REMOVED])
+
+
+def _load() -> tuple[pd.DataFrame, dict]:
+    version = products_version()
+    cached = _INDEX_CACHE.get(version)
+    if cached is not None:
+        return cached
+    result = _build_index()
+    _INDEX_CACHE.clear()
+    _INDEX_CACHE[version] = result
+    return result
+
+
+def product_index() -> pd.DataFrame:
+    """Products keyed by Product ID, with pre-built picker labels."""
+    return _load()[0]
+
+
+def get_product(product_id):
+    """O(1) lookup of one product row (a Series), or None if unknown."""
+    index = _load()[0]
+    pid = int(product_id)
+    if pid not in index.index:
+        return None
+    return index.loc[pid]
+
+
+def product_choices(kind: str = "Stock_Label") -> tuple[list, dict]:
+    """
+    (Product IDs, {Product ID: label}) for a selectbox: pass the IDs as
+    options and labels.get as format_func - no string parsing on select.
+    """
+    return _load()[1][kind]
+
+
+def product_prices(product_id, on_date=None) -> dict:
+    """Catalogue, effective (discounted) and last sold price of one product."""
+    row = get_product(product_id)
+    last = get_last_sold_prices().get(int(product_id))
+    return {
+        "Unit Price": float(row["Unit Price"]) if row is not None else None,
+        "Effective Price": get_effective_price(product_id, on_date),
+        "Last Sold Price": last[1] if last is not None else None,
+    }
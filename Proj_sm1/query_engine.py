@@ -0,0 +1,313 @@
+# query_engine.py
+"""
+Optional embedded SQL engine for the sales analytics.
+
+With duckdb installed, queries run in-process straight over Sales_log.csv
+(and the archive): only the referenced columns are materialized, filters are
+applied while scanning, and the scan uses every core. Without it (or with
+SHELPIFY_QUERY_ENGINE=pandas) the same functions fall back to the pandas
+code paths. Results are identical pandas frames either way: duckdb reads
+the log with load_sales' coercions and its output is cast to the dtypes
+the pandas path returns. A log holding dates outside the fixed ISO format
+(legacy writes that parse_dates recovers with its flexible parser) is
+queried through pandas until it is rewritten.
+"""
+import os
+import threading
+import pandas as pd
+from datetime import date, timedelta
+
+from data_model import load_products
+from sales_model import (
+    SALES_CSV, SALES_ARCHIVE_CSV, load_sales, load_sales_archive, products_not_sold_for_days,
+    _normalize_sales,
+)
+from shared_snapshot import snapshots_enabled
+from store_utils import file_version, parse_dates
+
+try:
+    import duckdb
+except ImportError:   # pandas fallback
+    duckdb = None
+
+QUERY_ENGINE = "pandas" if duckdb is None or os.environ.get("SHELPIFY_QUERY_ENGINE") == "pandas" else "duckdb"
+
+SALES_COLUMNS = [
+    "Customer ID", "Product ID", "Product Name",
+    "Date of Sale", "Quantity Sold", "Unit Price", "Total Sale Amount", "Bill ID",
+]
+# the CSV is read as text; each column is coerced the way _normalize_sales does
+# (unparseable IDs -> NULL, unparseable quantities and amounts -> 0)
+SALES_SQL_EXPRS = {
+    "Customer ID": 'TRY_CAST(TRY_CAST("Customer ID" AS DOUBLE) AS INTEGER)',
+    "Product ID": 'TRY_CAST(TRY_CAST("Product ID" AS DOUBLE) AS INTEGER)',
+    "Bill ID": 'TRY_CAST(TRY_CAST("Bill ID" AS DOUBLE) AS INTEGER)',
+    "Date of Sale": """CAST(TRY_STRPTIME("Date of Sale", '%Y-%m-%d') AS DATE)""",
+    "Quantity Sold": 'COALESCE(TRY_CAST(TRY_CAST("Quantity Sold" AS DOUBLE) AS INTEGER), 0)',
+    "Unit Price": """COALESCE(NULLIF(TRY_CAST("Unit Price" AS DOUBLE), 'NaN'::DOUBLE), 0.0)""",
+    "Total Sale Amount": """COALESCE(NULLIF(TRY_CAST("Total Sale Amount" AS DOUBLE), 'NaN'::DOUBLE), 0.0)""",
+}
+# catches fields past the header's last column
+OVERFLOW_COLUMN = "__overflow__"
+# dates the strict scan reads exactly as parse_dates' fixed-format pass does
+ISO_DATE_SQL = (
+    """regexp_full_match("Date of Sale", '[0-9]{4}-[0-9]{1,2}-[0-9]{1,2}') """
+    """AND TRY_STRPTIME("Date of Sale", '%Y-%m-%d') IS NOT NULL"""
+)
+
+# one connection per thread (Streamlit runs each session on its own thread)
+_LOCAL = threading.local()
+
+
+def _connection():
+    con = getattr(_LOCAL, "con", None)
+    if con is None:
+        con = _LOCAL.con = duckdb.connect(database=":memory:")
+    return con
+
+
+def _sales_header() -> list:
+    if not os.path.exists(SALES_CSV):
+        load_sales()   # creates the empty log
+    with open(SALES_CSV, encoding="utf-8-sig") as f:
+        return [c.strip() for c in f.readline().strip().split(",")]
+
+
+def _read_csv_sql(names: list) -> str:
+    """
+    The raw log as text, under its stripped header names. Short rows pad
+    with NULL (as pd.read_csv does); a trailing OVERFLOW_COLUMN catches rows
+    with more fields than the header, which _iso_log refuses like pandas.
+    CRLF and LF lines (Windows-written logs appended to here) mix freely.
+    """
+    path = SALES_CSV.replace("'", "''")
+    cols = ", ".join("'" + n.replace("'", "''") + "': 'VARCHAR'" for n in names + [OVERFLOW_COLUMN])
+    return (f"read_csv('{path}', header = true, auto_detect = false, delim = ',', quote = '\"', "
+            f"escape = '\"', columns = {{{cols}}}, null_padding = true, strict_mode = false)")
+
+
+def _sales_source() -> str:
+    """
+    A subquery scanning Sales_log.csv in place. Header names are taken from
+    the file (legacy logs have padded names or lack Bill ID); file columns
+    keep the file's order and missing ones read as NULL.
+    """
+    names = _sales_header()
+    select = [SALES_SQL_EXPRS.get(n, f'"{n}"') + f' AS "{n}"' for n in names]
+    select += [f'NULL AS "{c}"' for c in SALES_COLUMNS if c not in names]
+    return f"(SELECT {', '.join(select)} FROM {_read_csv_sql(names)})"
+
+
+# sales-log version -> whether every date in it is in the fixed ISO format
+_ISO_LOG_CACHE = {}
+
+def _iso_log() -> bool:
+    """
+    One scan per log version: raises on rows pd.read_csv would reject and
+    reports whether duckdb's strict date parse reads every date.
+    """
+    version = file_version(SALES_CSV)
+    if version not in _ISO_LOG_CACHE:
+        names = _sales_header()
+        non_iso = f'"Date of Sale" IS NOT NULL AND NOT ({ISO_DATE_SQL})' if "Date of Sale" in names else "FALSE"
+        sql = (f'SELECT count("{OVERFLOW_COLUMN}"), count(*) FILTER (WHERE {non_iso}) '
+               f'FROM {_read_csv_sql(names)}')
+        overflow, bad_dates = _connection().execute(sql).fetchone()
+        if overflow:
+            raise pd.errors.ParserError(
+                f"{SALES_CSV}: {overflow} line(s) have more fields than the header ({len(names)})"
+            )
+        _ISO_LOG_CACHE.clear()
+        _ISO_LOG_CACHE[version] = bad_dates == 0
+    return _ISO_LOG_CACHE[version]
+
+
+def _use_pandas() -> bool:
+    """
+    pandas answers when duckdb is off, or when the CSV scan would miss dates
+    that parse_dates only recovers with its flexible fallback.
+    """
+    if QUERY_ENGINE == "pandas":
+        return True
+    return not snapshots_enabled() and not _iso_log()
+
+
+def _query(sql: str, params: list | None = None, frames: dict | None = None) -> pd.DataFrame:
+    con = _connection()
+    for name, frame in (frames or {}).items():
+        con.register(name, frame)
+    try:
+        return con.execute(sql, params or []).df()
+    finally:
+        for name in frames or {}:
+            con.unregister(name)
+
+
+def _sales_from(frames: dict) -> str:
+    # the shared snapshot is already typed: query it instead of parsing the CSV
+    if snapshots_enabled():
+        frames["sales_frame"] = load_sales()
+        return "sales_frame"
+    return _sales_source()
+
+
+_DATE_DTYPE = parse_dates(pd.Series(["1970-01-01"])).dtype
+
+
+def _empty_sales(names: list | None = None) -> pd.DataFrame:
+    """A zero-row log in load_sales' schema, to take the pandas dtypes from."""
+    return _normalize_sales(pd.DataFrame(columns=names or SALES_COLUMNS))
+
+
+def _as_pandas(out: pd.DataFrame, template: pd.DataFrame) -> pd.DataFrame:
+    """Casts a duckdb result to the columns and dtypes the pandas path returns."""
+    out = out[list(template.columns)]
+    for col, dtype in template.dtypes.items():
+        # categories come from the values, and the datetime unit from parsing
+        # real dates (an empty column infers a coarser one)
+        if isinstance(dtype, pd.CategoricalDtype):
+            dtype = "category"
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            dtype = _DATE_DTYPE
+        out[col] = out[col].astype(dtype)
+    return out
+
+
+# ---------------------------
+# Revenue
+# ---------------------------
+def _revenue_split(sales: pd.DataFrame, prod: pd.DataFrame, start, end, by: str) -> pd.DataFrame:
+    dates = sales["Date of Sale"]
+    keep = pd.Series(True, index=sales.index)
+    if start is not None:
+        keep &= dates >= pd.Timestamp(start)
+    if end is not None:
+        keep &= dates <= pd.Timestamp(end)
+    sales = sales[keep.fillna(False).to_numpy()].merge(prod, on="Product ID", how="inner")
+    out = sales.groupby(by, observed=True).agg(
+        Units=("Quantity Sold", "sum"), Revenue=("Total Sale Amount", "sum")
+    ).reset_index()
+    # ties keep group order, as the SQL's ORDER BY does
+    return out.sort_values("Revenue", ascending=False, ignore_index=True, kind="stable")
+
+
+def revenue_split(start=None, end=None, by: str = "Type") -> pd.DataFrame:
+    """Units and revenue per product `by` column (Type, Category, ...) for sale dates in [start, end]."""
+    prod = load_products()[["Product ID", by]].dropna(subset=["Product ID"]).drop_duplicates("Product ID")
+    if _use_pandas():
+        return _revenue_split(load_sales(), prod, start, end, by)
+
+    frames = {"prod": prod.assign(**{by: prod[by].astype("string")})}
+    sql = f"""
+        SELECT p."{by}", SUM(s."Quantity Sold") AS Units, SUM(s."Total Sale Amount") AS Revenue
+        FROM {_sales_from(frames)} s JOIN prod p ON s."Product ID" = p."Product ID"
+        WHERE p."{by}" IS NOT NULL
+          AND (? IS NULL OR s."Date of Sale" >= ?) AND (? IS NULL OR s."Date of Sale" <= ?)
+        GROUP BY p."{by}" ORDER BY Revenue DESC, p."{by}"
+    """
+    lo, hi = _day(start), _day(end)
+    out = _query(sql, [lo, lo, hi, hi], frames)
+    return _as_pandas(out, _revenue_split(_empty_sales(), prod.iloc[:0], None, None, by))
+
+
+def _daily_series(sales: pd.DataFrame, start, end, product_id) -> pd.DataFrame:
+    keep = pd.Series(True, index=sales.index)
+    if product_id is not None:
+        keep &= sales["Product ID"] == int(product_id)
+    if start is not None:
+        keep &= sales["Date of Sale"] >= pd.Timestamp(start)
+    if end is not None:
+        keep &= sales["Date of Sale"] <= pd.Timestamp(end)
+    sales = sales[keep.fillna(False).to_numpy()]
+    out = sales.groupby("Date of Sale").agg(
+        Units=("Quantity Sold", "sum"), Revenue=("Total Sale Amount", "sum")
+    )
+    return out.rename_axis("Date").reset_index()
+
+
+def daily_series(start=None, end=None, product_id=None) -> pd.DataFrame:
+    """Date-wise units and revenue from the sales log (optionally one product)."""
+    if _use_pandas():
+        return _daily_series(load_sales(), start, end, product_id)
+
+    frames = {}
+    sql = f"""
+        SELECT CAST("Date of Sale" AS TIMESTAMP) AS Date,
+               SUM("Quantity Sold") AS Units, SUM("Total Sale Amount") AS Revenue
+        FROM {_sales_from(frames)}
+        WHERE "Date of Sale" IS NOT NULL
+          AND (? IS NULL OR "Product ID" = ?)
+          AND (? IS NULL OR "Date of Sale" >= ?) AND (? IS NULL OR "Date of Sale" <= ?)
+        GROUP BY 1 ORDER BY 1
+    """
+    pid = None if product_id is None else int(product_id)
+    lo, hi = _day(start), _day(end)
+    out = _query(sql, [pid, pid, lo, lo, hi, hi], frames)
+    return _as_pandas(out, _daily_series(_empty_sales(), None, None, None))
+
+
+# ---------------------------
+# Unsold Products
+# ---------------------------
+def unsold_products(days: int, product_df: pd.DataFrame | None = None) -> pd.DataFrame:
+    """
+    Products whose last sale (log or archive) is on/before today - days, or
+    that never sold: an anti-join of the products against recent sales.
+    """
+    prod = load_products() if product_df is None else product_df
+    if _use_pandas():
+        return products_not_sold_for_days(prod, days)
+
+    threshold = date.today() - timedelta(days=int(days))
+    frames = {}
+    archive = ""
+    if os.path.exists(SALES_ARCHIVE_CSV):
+        frames["archive"] = load_sales_archive()[["Product ID", "Date"]]
+        archive = 'UNION ALL SELECT "Product ID" FROM archive WHERE CAST("Date" AS DATE) > ?'
+    sql = f"""
+        SELECT DISTINCT "Product ID" FROM {_sales_from(frames)} WHERE "Date of Sale" > ?
+        {archive}
+    """
+    params = [threshold, threshold] if archive else [threshold]
+    recent = _query(sql, params, frames)["Product ID"].astype("Int32")
+    return prod[~prod["Product ID"].isin(recent).fillna(False).to_numpy()]
+
+
+# ---------------------------
+# Transaction Filters
+# ---------------------------
+def _filter_transactions(sales: pd.DataFrame, product_id, customer_id, on_date) -> pd.DataFrame:
+    keep = pd.Series(True, index=sales.index)
+    if product_id is not None:
+        keep &= sales["Product ID"] == int(product_id)
+    if customer_id is not None:
+        keep &= sales["Customer ID"] == int(customer_id)
+    if on_date is not None:
+        keep &= sales["Date of Sale"] == pd.Timestamp(on_date)
+    return sales[keep.fillna(False).to_numpy()].reset_index(drop=True)
+
+
+def filter_transactions(product_id=None, customer_id=None, on_date=None) -> pd.DataFrame:
+    """
+    Sales lines matching all given filters. With duckdb the filters are
+    pushed into the scan, so only matching lines are ever materialized.
+    """
+    if _use_pandas():
+        return _filter_transactions(load_sales(), product_id, customer_id, on_date)
+
+    frames = {}
+    sql = f"""
+        SELECT * FROM {_sales_from(frames)}
+        WHERE (? IS NULL OR "Product ID" = ?)
+          AND (? IS NULL OR "Customer ID" = ?)
+          AND (? IS NULL OR "Date of Sale" = ?)
+    """
+    pid = None if product_id is None else int(product_id)
+    cid = None if customer_id is None else int(customer_id)
+    day = _day(on_date)
+    out = _query(sql, [pid, pid, cid, cid, day, day], frames)
+    return _as_pandas(out, _empty_sales(_sales_header()))
+
+
+def _day(value):
+    return None if value is None else pd.Timestamp(value).date()
@@ -1,56 +1,95 @@
-# remove_product_page.py
-import streamlit as st
-import pandas as pd
-
-from data_model import load_products, save_products
-
-
-def render_remove_product_page():
-    st.title("🗑 Remove Product")
-
-    df = load_products()
-
-    if df.empty:
-        st.warning("There are no products in the database yet.")
-        if st.button("⬅ Back to Inventory"):
-            st.session_state.current_page = "home"
-            st.rerun()
-        return
-
-    mode = st.radio("Delete by:", ["Product ID", "Product Name"])
-    key = st.text_input(f"Enter {mode}")
-
-    if st.button("Delete Product", use_container_width=True, key="remove_delete"):
-        if not key.strip():
-            st.error(f"Please enter a {mode}.")
-            return
-
-        if mode == "Product ID":
-            if not key.isdigit():
-                st.error("Product ID must be numeric.")
-                return
-            pid = int(key)
-            mask = df["Product ID"] == pid
-        else:
-            key_lower = key.strip().lower()
-            mask = df["Product Name"].str.lower() == key_lower
-
-        if not mask.any():
-            st.warning(
-                "⚠ No matching product found to delete. "
-                "Check the ID or name and try again."
-            )
-        else:
-            deleted = df[mask].copy()
-            df = df[~mask]
-            save_products(df)
-
-            st.success(f"✅ Deleted {len(deleted)} record(s).")
-            st.write("### Deleted Record(s)")
-            st.dataframe(deleted)
-
-    st.markdown("---")
-    if st.button("⬅ Back to Inventory", key="remove_back"):
-        st.session_state.current_page = "home"
-        st.rerun()   # FIXED
-
+# remove_product_page.py
+import streamlit as st
+import pandas as pd
+
+from data_model import (
+    load_products,
+    delete_products,
+    tombstoned_ids,
+    compact_products,
+    compact_in_background,
+    COMPACT_AFTER_TOMBSTONES,
+)
+from alert_model import refresh_alerts
+from lot_model import open_lots, write_off_expired
+
+
+def _delete(product_ids) -> None:
+    delete_products(product_ids)
+    refresh_alerts(product_ids)
+    if len(tombstoned_ids()) >= COMPACT_AFTER_TOMBSTONES:
+        compact_in_background()
+
+
+def render_remove_product_page():
+    st.title("🗑 Remove Product")
+
+    df = load_products()
+
+    if df.empty:
+        st.warning("There are no products in the database yet.")
+        if st.button("⬅ Back to Inventory"):
+            st.session_state.current_page = "home"
+            st.rerun()
+        return
+
+    mode = st.radio("Delete by:", ["Product ID", "Product Name"])
+    key = st.text_input(f"Enter {mode}")
+
+    if st.button("Delete Product", use_container_width=True, key="remove_delete"):
+        if not key.strip():
+            st.error(f"Please enter a {mode}.")
+            return
+
+        if mode == "Product ID":
+            if not key.isdigit():
+                st.error("Product ID must be numeric.")
+                return
+            pid = int(key)
+            mask = (df["Product ID"] == pid).fillna(False)
+        else:
+            # compare against the distinct names only, not every row
+            key_lower = key.strip().lower()
+            names = df["Product Name"].cat.categories
+            mask = df["Product Name"].isin(names[names.str.lower() == key_lower])
+
+        if not mask.any():
+            st.warning(
+                "⚠ No matching product found to delete. "
+                "Check the ID or name and try again."
+            )
+        else:
+            deleted = df[mask].copy()
+            _delete(deleted["Product ID"])
+
+            st.success(f"✅ Deleted {len(deleted)} record(s).")
+            st.write("### Deleted Record(s)")
+            st.dataframe(deleted)
+
+    st.markdown("---")
+
+    # Bulk clean-up: expired lots are written off, not their products - a
+    # product's Expiry_Date is only its first lot's, and other lots may be fresh
+    lots = open_lots()
+    expired = lots[(lots["Expiry_Date"] < pd.Timestamp.today().normalize()).fillna(False).to_numpy()]
+    st.subheader(f"🧹 Expired Lots ({len(expired)})")
+    if st.button("Write off all expired lots", disabled=expired.empty, key="remove_expired"):
+        written = write_off_expired()
+        refresh_alerts(written["Product ID"])
+        st.success(
+            f"✅ Wrote off {int(written['Quantity'].sum())} unit(s) from {len(written)} expired lot(s)."
+        )
+        st.dataframe(written, use_container_width=True)
+
+    # Deleted rows are hidden at once and dropped from the file by compaction
+    pending = len(tombstoned_ids())
+    if pending:
+        st.caption(f"{pending} deleted product(s) waiting for compaction.")
+        if st.button("Compact now", key="remove_compact"):
+            st.success(f"Compacted {compact_products()} deleted record(s).")
+
+    st.markdown("---")
+    if st.button("⬅ Back to Inventory", key="remove_back"):
+        st.session_state.current_page = "home"
+        st.rerun()   # FIXED
+
@@ -0,0 +1,347 @@
+# report_export.py
+"""
+Streaming report exports (CSV / Excel) for downloads, the POS service and
+the command line.
+
+Every report is a generator of DataFrame chunks read straight from the
+stores (the sales log is read EXPORT_CHUNK_ROWS lines at a time), and every
+format turns chunks into bytes as they arrive: the first bytes go out after
+the first chunk and memory stays flat however long the history is.
+
+    python report_export.py transactions --start 2024-01-01 --end 2024-12-31 -o sales.csv
+    python report_export.py statement --customer 42 --format xlsx -o customer_42.xlsx
+"""
+import argparse
+import re
+import sys
+import zipfile
+import pandas as pd
+from datetime import datetime
+
+from data_model import load_products
+from lot_model import open_lots
+from sales_model import iter_sales_chunks
+
+EXPORT_CHUNK_ROWS = 50_000
+EXCEL_MAX_ROWS = 1_048_576   # per sheet (header included); longer reports continue on the next sheet
+
+TRANSACTION_COLUMNS = [
+    "Bill ID", "Date of Sale", "Customer ID", "Product ID", "Product Name",
+    "Quantity Sold", "Unit Price", "Total Sale Amount",
+]
+EXPORT_FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx"),
+}
+
+
+# ---------------------------
+# Reports (DataFrame chunks)
+# ---------------------------
+def _sales_lines(start=None, end=None, customer_id=None):
+    """Sales-log lines in [start, end] (optionally one customer), chunk by chunk."""
+    # parsed before the first chunk is read, so a bad date fails up front
+    lo = pd.Timestamp(start) if start is not None else None
+    hi = pd.Timestamp(end) if end is not None else None
+    return _filtered_chunks(lo, hi, customer_id)
+
+
+def _filtered_chunks(lo, hi, customer_id):
+    for chunk in iter_sales_chunks(EXPORT_CHUNK_ROWS):
+        for col in TRANSACTION_COLUMNS:
+            if col not in chunk.columns:
+                chunk[col] = pd.NA
+        keep = pd.Series(True, index=chunk.index)
+        if lo is not None:
+            keep &= chunk["Date of Sale"] >= lo
+        if hi is not None:
+            keep &= chunk["Date of Sale"] <= hi
+        if customer_id is not None:
+            keep &= chunk["Customer ID"] == customer_id
+        chunk = chunk.loc[keep.fillna(False).to_numpy(), TRANSACTION_COLUMNS]
+        if not chunk.empty:
+            yield chunk
+
+
+def transactions_report(start=None, end=None):
+    """
+    Every sales line with a sale date in [start, end], in log order. Lines
+    older than the retention window only survive as daily archive totals and
+    are not part of this report.
+    """
+    return _sales_lines(start, end)
+
+
+def customer_statement(customer_id=None, start=None, end=None):
+    """One customer's purchase lines in [start, end] with a running total."""
+    if customer_id is None:
+        raise ValueError("A customer statement needs a Customer ID.")
+    return _with_running_total(_sales_lines(start, end, int(customer_id)))
+
+
+def _with_running_total(chunks):
+    running = 0.0
+    for chunk in chunks:
+        chunk = chunk.drop(columns="Customer ID")
+        totals = running + chunk["Total Sale Amount"].cumsum()
+        running = float(totals.iloc[-1])
+        yield chunk.assign(**{"Running Total": totals.round(2)})
+
+
+def inventory_valuation():
+    """Stock value (Unit Price x Total Quantity) per product, by Category."""
+    prod = load_products().dropna(subset=["Product ID"])
+    prod = prod.sort_values(["Category", "Product ID"], kind="stable")
+    for i in range(0, len(prod), EXPORT_CHUNK_ROWS):
+        part = prod.iloc[i:i + EXPORT_CHUNK_ROWS]
+        out = part[["Product ID", "Product Name", "Category", "Type", "Unit Price", "Total Quantity"]].copy()
+        out["Stock Value"] = (part["Unit Price"] * part["Total Quantity"].astype("float64")).round(2)
+        yield out
+
+
+def expiry_report(days: int | None = None):
+    """
+    Open lots that are expired or near expiry (category windows, as on the
+    Updates page), soonest first. With `days`, every open lot expiring
+    within that many days instead.
+    """
+    # imported lazily: analytics_page pulls in the Streamlit page code
+    from analytics_page import near_expiry_windows, expiry_statuses
+
+    lots = open_lots()
+    lots["Expiry_Status"] = expiry_statuses(lots["Expiry_Date"], near_expiry_windows(lots))
+    today = pd.Timestamp.today().normalize()
+    lots["Days_Left"] = (lots["Expiry_Date"] - today).dt.days.astype("Int32")
+    if days is None:
+        lots = lots[lots["Expiry_Status"].isin(["Expired", "Near Expiry"])]
+    else:
+        lots = lots[(lots["Days_Left"] <= int(days)).fillna(False).to_numpy()]
+    lots = lots.sort_values(["Expiry_Date", "Lot ID"], kind="stable")
+    lots["Value_At_Risk"] = (lots["Quantity_Left"] * lots["Unit Price"]).round(2)
+    cols = [
+        "Lot ID", "Product ID", "Product Name", "Category", "Expiry_Date", "Days_Left",
+        "Expiry_Status", "Quantity_Left", "Unit Price", "Value_At_Risk",
+    ]
+    for i in range(0, len(lots), EXPORT_CHUNK_ROWS):
+        yield lots.iloc[i:i + EXPORT_CHUNK_ROWS][cols]
+
+
+# name -> (title, generator, accepted parameters)
+REPORTS = {
+    "transactions": ("Transaction History", transactions_report, ("start", "end")),
+    "inventory": ("Inventory Valuation", inventory_valuation, ()),
+    "expiry": ("Expiry Report", expiry_report, ("days",)),
+    "statement": ("Customer Statement", customer_statement, ("customer_id", "start", "end")),
+}
+
+
+def report_chunks(report: str, **params):
+    """The report's DataFrame chunks; parameters it does not take are ignored."""
+    if report not in REPORTS:
+        raise ValueError(f"Unknown report: {report}")
+    _, generator, accepted = REPORTS[report]
+    return generator(**{k: v for k, v in params.items() if k in accepted and v is not None})
+
+
+# ---------------------------
+# Formats (byte chunks)
+# ---------------------------
+def _csv_stream(chunks):
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header, date_format="%Y-%m-%d").encode("utf-8")
+        header = False
+
+
+# characters XML 1.0 does not allow
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _xml_text(values: pd.Series) -> pd.Series:
+    s = values.astype("string").fillna("")
+    s = s.str.replace("&", "&amp;", regex=False).str.replace("<", "&lt;", regex=False).str.replace(">", "&gt;", regex=False)
+    return s.str.replace(_XML_INVALID, "", regex=True)
+
+
+def _xml_cells(col: pd.Series) -> pd.Series:
+    """One <c> element per value: numbers as numbers, everything else as inline text."""
+    if pd.api.types.is_datetime64_any_dtype(col):
+        col = col.dt.strftime("%Y-%m-%d")
+    elif pd.api.types.is_numeric_dtype(col) and not pd.api.types.is_bool_dtype(col):
+        text = col.astype("string")
+        return ("<c><v>" + text + "</v></c>").fillna("<c/>")
+    text = _xml_text(col)
+    return ("<c t=\"inlineStr\"><is><t xml:space=\"preserve\">" + text + "</t></is></c>").where(col.notna(), "<c/>")
+
+
+def _xml_rows(df: pd.DataFrame) -> str:
+    rows = pd.Series("<row>", index=df.index, dtype="string")
+    for name in df.columns:
+        rows = rows + _xml_cells(df[name])
+    return "".join((rows + "</row>").tolist())
+
+
+class _Pipe:
+    """Write-only sink for ZipFile: bytes written are collected until drained."""
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+_SHEET_HEAD = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = b"</sheetData></worksheet>"
+
+
+def _xlsx_stream(chunks, title: str = "Report"):
+    """
+    A minimal Office Open XML workbook written as a zip stream (no Excel
+    library needed): one sheet per EXCEL_MAX_ROWS rows, inline strings, no
+    styles. Sheet parts are compressed as rows arrive; the workbook parts
+    that list the sheets are written last.
+    """
+    pipe = _Pipe()
+    zf = zipfile.ZipFile(pipe, "w", zipfile.ZIP_DEFLATED)
+    sheets = 0
+    sheet = None
+    header_xml = None
+    rows_in_sheet = 0
+
+    for chunk in chunks:
+        if header_xml is None:
+            header_xml = _xml_rows(pd.DataFrame([list(chunk.columns)], columns=chunk.columns).astype("string"))
+        start = 0
+        while start < len(chunk):
+            if sheet is None or rows_in_sheet >= EXCEL_MAX_ROWS:
+                if sheet is not None:
+                    sheet.write(_SHEET_TAIL)
+                    sheet.close()
+                sheets += 1
+                sheet = zf.open(f"xl/worksheets/sheet{sheets}.xml", "w", force_zip64=True)
+                sheet.write(_SHEET_HEAD + header_xml.encode("utf-8"))
+                rows_in_sheet = 1
+            take = min(len(chunk) - start, EXCEL_MAX_ROWS - rows_in_sheet)
+            sheet.write(_xml_rows(chunk.iloc[start:start + take]).encode("utf-8"))
+            rows_in_sheet += take
+            start += take
+            yield pipe.drain()
+
+    if sheet is None:   # empty report: one empty sheet
+        sheets = 1
+        zf.writestr("xl/worksheets/sheet1.xml", _SHEET_HEAD + _SHEET_TAIL)
+    else:
+        sheet.write(_SHEET_TAIL)
+        sheet.close()
+
+    name = _xml_text(pd.Series([title[:25]])).iloc[0]
+    names = [name] if sheets == 1 else [f"{name} {i}" for i in range(1, sheets + 1)]
+    zf.writestr("xl/workbook.xml", (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+        + "".join(f'<sheet name="{n}" sheetId="{i}" r:id="rId{i}"/>' for i, n in enumerate(names, 1))
+        + "</sheets></workbook>"
+    ))
+    zf.writestr("xl/_rels/workbook.xml.rels", (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        + "".join(
+            f'<Relationship Id="rId{i}" Target="worksheets/sheet{i}.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+            for i in range(1, sheets + 1)
+        )
+        + "</Relationships>"
+    ))
+    zf.writestr("_rels/.rels", (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        "</Relationships>"
+    ))
+    zf.writestr("[Content_Types].xml", (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        + "".join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for i in range(1, sheets + 1)
+        )
+        + "</Types>"
+    ))
+    zf.close()
+    yield pipe.drain()
+
+
+def stream_report(report: str, fmt: str = "csv", **params):
+    """Yields the report as bytes in `fmt` ("csv" or "xlsx"), chunk by chunk."""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    chunks = report_chunks(report, **params)
+    if fmt == "csv":
+        return _csv_stream(chunks)
+    return _xlsx_stream(chunks, REPORTS[report][0])
+
+
+def export_file_name(report: str, fmt: str = "csv") -> str:
+    stamp = datetime.now().strftime("%Y%m%d_%H%M")
+    return f"{report}_{stamp}{EXPORT_FORMATS[fmt][1]}"
+
+
+def write_report(report: str, out, fmt: str = "csv", **params) -> int:
+    """Streams the report to a path or binary file object; returns bytes written."""
+    written = 0
+    if isinstance(out, str):
+        with open(out, "wb") as f:
+            return write_report(report, f, fmt, **params)
+    for data in stream_report(report, fmt, **params):
+        if data:
+            out.write(data)
+            written += len(data)
+    return written
+
+
+# ---------------------------
+# Command Line
+# ---------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Shelpify report exports")
+    parser.add_argument("report", choices=list(REPORTS))
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default="csv")
+    parser.add_argument("--start", help="first sale date (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last sale date (YYYY-MM-DD)")
+    parser.add_argument("--customer", type=int, dest="customer_id", help="Customer ID (statement)")
+    parser.add_argument("--days", type=int, help="expiring within N days (expiry report)")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    params = {"start": args.start, "end": args.end, "customer_id": args.customer_id, "days": args.days}
+    try:
+        if args.output:
+            written = write_report(args.report, args.output, args.format, **params)
+            print(f"Wrote {written:,} bytes to {args.output}", file=sys.stderr)
+        else:
+            write_report(args.report, sys.stdout.buffer, args.format, **params)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
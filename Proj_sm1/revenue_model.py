@@ -0,0 +1,316 @@
+# revenue_model.py
+import io
+import os
+import numpy as np
+import pandas as pd
+
+from data_model import load_products, products_version
+from store_utils import parse_dates, format_dates, write_csv, store_lock
+
+REVENUE_CUBE_CSV = "Revenue_cube.csv"
+
+CUBE_COLUMNS = ["Date", "Type", "Category", "Product ID", "Units", "Revenue"]
+
+ALL = "*"   # wildcard for a Type / Category slice
+
+# every sale appends its cells; the file is folded back to one row per cell
+# once it holds this many rows per cell
+CUBE_COMPACT_RATIO = 2
+CUBE_COMPACT_MIN_ROWS = 10_000
+
+
+# ---------------------------
+# Product Dimensions
+# ---------------------------
+_DIMS_CACHE = {}
+
+
+def _product_dims() -> pd.DataFrame:
+    """Product ID -> Type, Category (cached per product-file version)."""
+    version = products_version()
+    cached = _DIMS_CACHE.get(version)
+    if cached is not None:
+        return cached
+    prod = load_products().dropna(subset=["Product ID"]).drop_duplicates("Product ID")
+    dims = prod.set_index(prod["Product ID"].astype(int))[["Type", "Category"]].astype(object)
+    _DIMS_CACHE.clear()
+    _DIMS_CACHE[version] = dims
+    return dims
+
+
+def _to_cube_rows(sales: pd.DataFrame) -> pd.DataFrame:
+    """Attaches Type/Category to sales lines and aggregates them to cube cells."""
+    dims = _product_dims()
+    pids = pd.to_numeric(sales["Product ID"], errors="coerce").fillna(-1).astype(int)
+    rows = pd.DataFrame({
+        "Date": format_dates(sales["Date of Sale"]).to_numpy(),
+        "Type": pids.map(dims["Type"]).fillna("Unknown").to_numpy(),
+        "Category": pids.map(dims["Category"]).fillna("Unknown").to_numpy(),
+        "Product ID": pids.to_numpy(),
+        "Units": pd.to_numeric(sales["Quantity Sold"], errors="coerce").fillna(0).to_numpy(),
+        "Revenue": pd.to_numeric(sales["Total Sale Amount"], errors="coerce").fillna(0.0).to_numpy(),
+    })
+    return rows.groupby(["Date", "Type", "Category", "Product ID"], as_index=False)[["Units", "Revenue"]].sum()
+
+
+# ---------------------------
+# Build / Incremental Maintenance
+# ---------------------------
+def _archive_as_sales() -> pd.DataFrame:
+    """Archived daily rollups shaped like sales lines (one line per day x product)."""
+    from sales_model import load_sales_archive   # lazy, as in rebuild_revenue_cube
+    archive = load_sales_archive()
+    return pd.DataFrame({
+        "Date of Sale": archive["Date"],
+        "Product ID": archive["Product ID"],
+        "Quantity Sold": archive["Units"],
+        "Total Sale Amount": archive["Revenue"],
+    })
+
+
+def rebuild_revenue_cube(sales_df: pd.DataFrame = None) -> None:
+    """
+    Recomputes the cube from the sales log, streamed chunk by chunk, plus the
+    archived rollups of lines past the retention window (one-off backfill).
+    """
+    with store_lock(REVENUE_CUBE_CSV):
+        if sales_df is None:
+            # imported lazily: sales_model updates the cube on every transaction
+            from sales_model import iter_sales_chunks
+            chunks = [_archive_as_sales(), *iter_sales_chunks()]
+        else:
+            chunks = [sales_df]
+
+        parts = [_to_cube_rows(c) for c in chunks if not c.empty]
+        if not parts:
+            write_csv(pd.DataFrame(columns=CUBE_COLUMNS), REVENUE_CUBE_CSV)
+            return
+        write_csv(_fold_cells(pd.concat(parts))[CUBE_COLUMNS], REVENUE_CUBE_CSV)
+
+
+def update_revenue_cube(new_rows: list[dict]) -> None:
+    """
+    Appends the cube cells for newly recorded sales lines. Cells are
+    additive, so repeated keys are simply summed when the cube is loaded.
+    """
+    if not new_rows:
+        return
+    # a compaction or rebuild rewrites the file: no append may land in between
+    with store_lock(REVENUE_CUBE_CSV):
+        if not os.path.exists(REVENUE_CUBE_CSV):
+            rebuild_revenue_cube()   # the log already contains new_rows
+            return
+        _to_cube_rows(pd.DataFrame(new_rows))[CUBE_COLUMNS].to_csv(
+            REVENUE_CUBE_CSV, mode="a", header=False, index=False
+        )
+
+
+def _fold_cells(cube: pd.DataFrame) -> pd.DataFrame:
+    """One row per (Date, Type, Category, Product ID) cell."""
+    return cube.groupby(["Date", "Type", "Category", "Product ID"], as_index=False)[["Units", "Revenue"]].sum()
+
+
+# ---------------------------
+# Loading + Prefix Sums
+# ---------------------------
+def _slice_keys(types: np.ndarray, cats: np.ndarray) -> list:
+    keys = [(ALL, ALL)]
+    keys += [(t, ALL) for t in np.unique(types)]
+    keys += [(ALL, c) for c in np.unique(cats)]
+    keys += list(set(zip(types, cats)))
+    return keys
+
+
+def _slice_sums(cube: pd.DataFrame, start, n_days: int) -> dict:
+    """Cumulative units/revenue of `cube` per (Type, Category) slice over n_days from start."""
+    day = parse_dates(cube["Date"]).to_numpy().astype("datetime64[D]")
+    offset = (day - start).astype(int)
+    units = cube["Units"].to_numpy(dtype=float)
+    revenue = cube["Revenue"].to_numpy(dtype=float)
+    types = cube["Type"].astype(str).to_numpy()
+    cats = cube["Category"].astype(str).to_numpy()
+
+    slices = {}
+    for t, c in _slice_keys(types, cats):
+        mask = np.ones(len(cube), dtype=bool)
+        if t != ALL:
+            mask &= types == t
+        if c != ALL:
+            mask &= cats == c
+        u = np.bincount(offset[mask], weights=units[mask], minlength=n_days)
+        r = np.bincount(offset[mask], weights=revenue[mask], minlength=n_days)
+        slices[(t, c)] = (
+            np.concatenate([[0.0], np.cumsum(u)]),
+            np.concatenate([[0.0], np.cumsum(r)]),
+        )
+    return slices
+
+
+def _day_range(cube: pd.DataFrame):
+    day = parse_dates(cube["Date"]).to_numpy().astype("datetime64[D]")
+    return day.min(), day.max()
+
+
+def _build_prefix(cube: pd.DataFrame) -> dict:
+    """
+    Lays every (Type, Category) slice - including the ALL wildcards - over a
+    dense calendar and stores cumulative units/revenue, so any date range is
+    answered as cum[end] - cum[start].
+    """
+    if cube.empty:
+        return {"start": None, "days": 0, "slices": {}}
+    first, last = _day_range(cube)
+    n_days = int((last - first).astype(int)) + 1
+    return {"start": first, "days": n_days, "slices": _slice_sums(cube, first, n_days)}
+
+
+def _patch_prefix(prefix: dict, rows: pd.DataFrame) -> dict:
+    """
+    Adds newly appended cells to the prefix sums: the calendar is widened
+    if they fall outside it, and only the slices they touch are summed.
+    """
+    rows = rows.dropna(subset=["Date"])
+    if rows.empty:
+        return prefix
+    if prefix["start"] is None:
+        return _build_prefix(rows)
+
+    first, last = _day_range(rows)
+    start = min(prefix["start"], first)
+    end = max(prefix["start"] + np.timedelta64(prefix["days"] - 1, "D"), last)
+    n_days = int((end - start).astype(int)) + 1
+    before = int((prefix["start"] - start).astype(int))
+    after = n_days - before - prefix["days"]
+
+    def widen(cum: np.ndarray) -> np.ndarray:
+        if not before and not after:
+            return cum
+        return np.concatenate([np.zeros(before), cum, np.full(after, cum[-1])])
+
+    slices = {k: (widen(u), widen(r)) for k, (u, r) in prefix["slices"].items()}
+    empty = np.zeros(n_days + 1)
+    for key, (u, r) in _slice_sums(rows, start, n_days).items():
+        old_u, old_r = slices.get(key, (empty, empty))
+        slices[key] = (old_u + u, old_r + r)
+    return {"start": start, "days": n_days, "slices": slices}
+
+
+def _read_cells(data: bytes, header: bool) -> pd.DataFrame:
+    if header:
+        cube = pd.read_csv(io.BytesIO(data))
+    else:
+        cube = pd.read_csv(io.BytesIO(data), header=None, names=CUBE_COLUMNS)
+    return cube.reindex(columns=CUBE_COLUMNS)
+
+
+def _read_complete_lines(offset: int) -> tuple[bytes, int]:
+    """Bytes of the cube file from `offset` up to its last complete line, and the new offset."""
+    with open(REVENUE_CUBE_CSV, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    return data[:end], offset + end
+
+
+def _compact_cube() -> None:
+    """Rewrites the cube file as one row per cell."""
+    with store_lock(REVENUE_CUBE_CSV):
+        write_csv(_fold_cells(pd.read_csv(REVENUE_CUBE_CSV))[CUBE_COLUMNS], REVENUE_CUBE_CSV)
+
+
+def _full_load(ino) -> dict:
+    data, offset = _read_complete_lines(0)
+    raw = _read_cells(data, header=True)
+    cube = _fold_cells(raw) if not raw.empty else raw
+    return {"ino": ino, "offset": offset, "raw_rows": len(raw), "cells": len(cube),
+            "parts": [cube], "cube": cube, "prefix": _build_prefix(cube)}
+
+
+# cube-file inode -> {"offset": bytes consumed, "parts": cell frames, "prefix": ...}
+# The file only grows by appends until a compaction or rebuild replaces it
+# (a new inode): new cells are read from the offset and patched into the
+# prefix sums instead of reloading the whole cube after every sale.
+_CUBE_CACHE = {}
+
+
+def _load() -> dict:
+    if not os.path.exists(REVENUE_CUBE_CSV):
+        with store_lock(REVENUE_CUBE_CSV):
+            if not os.path.exists(REVENUE_CUBE_CSV):
+                rebuild_revenue_cube()
+
+    st = os.stat(REVENUE_CUBE_CSV)
+    state = _CUBE_CACHE.get(st.st_ino)
+    if state is None or st.st_size < state["offset"]:
+        state = _full_load(st.st_ino)
+    elif st.st_size > state["offset"]:
+        data, offset = _read_complete_lines(state["offset"])
+        if data:
+            rows = _read_cells(data, header=False)
+            state = dict(state, offset=offset, raw_rows=state["raw_rows"] + len(rows),
+                         parts=state["parts"] + [rows], cube=None,
+                         prefix=_patch_prefix(state["prefix"], rows))
+
+    if state["raw_rows"] > max(CUBE_COMPACT_RATIO * state["cells"], CUBE_COMPACT_MIN_ROWS):
+        _compact_cube()
+        state = _full_load(os.stat(REVENUE_CUBE_CSV).st_ino)
+    _CUBE_CACHE.clear()
+    _CUBE_CACHE[state["ino"]] = state
+    return state
+
+
+def load_revenue_cube() -> pd.DataFrame:
+    """Day x Type x Category x Product cells with Units and Revenue."""
+    state = _load()
+    if state["cube"] is None:
+        # cells appended since the last full load are folded on demand
+        state["cube"] = _fold_cells(pd.concat(state["parts"], ignore_index=True))
+        state["parts"] = [state["cube"]]
+    return state["cube"]
+
+
+def _day_index(prefix: dict, d, default: int) -> int:
+    if d is None:
+        return default
+    i = int((np.datetime64(pd.Timestamp(d).date(), "D") - prefix["start"]).astype(int))
+    return min(max(i, 0), prefix["days"])
+
+
+def revenue_between(start=None, end=None, type_: str = ALL, category: str = ALL) -> tuple[float, float]:
+    """
+    Returns (units, revenue) for the inclusive date range and the given
+    Type/Category slice. Constant time once the cube version is loaded.
+    """
+    prefix = _load()["prefix"]
+    cums = prefix["slices"].get((type_ or ALL, category or ALL))
+    if cums is None:
+        return 0.0, 0.0
+    lo = _day_index(prefix, start, 0)
+    hi = _day_index(prefix, pd.Timestamp(end) + pd.Timedelta(days=1) if end is not None else None, prefix["days"])
+    if hi <= lo:
+        return 0.0, 0.0
+    cum_units, cum_rev = cums
+    return float(cum_units[hi] - cum_units[lo]), float(cum_rev[hi] - cum_rev[lo])
+
+
+def daily_revenue(type_: str = ALL, category: str = ALL) -> pd.DataFrame:
+    """Date-wise units and revenue for a slice (days without sales included as 0)."""
+    prefix = _load()["prefix"]
+    cums = prefix["slices"].get((type_ or ALL, category or ALL))
+    if cums is None:
+        return pd.DataFrame(columns=["Date", "Units", "Revenue"])
+    cum_units, cum_rev = cums
+    return pd.DataFrame({
+        "Date": pd.date_range(pd.Timestamp(prefix["start"]), periods=prefix["days"], freq="D"),
+        "Units": np.diff(cum_units),
+        "Revenue": np.diff(cum_rev),
+    })
+
+
+def revenue_date_bounds():
+    """(first, last) date covered by the cube, or (None, None) if empty."""
+    prefix = _load()["prefix"]
+    if prefix["start"] is None:
+        return None, None
+    first = pd.Timestamp(prefix["start"]).date()
+    return first, (pd.Timestamp(prefix["start"]) + pd.Timedelta(days=prefix["days"] - 1)).date()
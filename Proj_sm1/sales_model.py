@@ -1,178 +1,646 @@
-# sales_model.py
-import pandas as pd
-import os
-from datetime import datetime, date, timedelta
-
-SALES_CSV = "Sales_log.csv"   # ensure this exists in project folder
-
-def _ensure_sales_file():
-    if not os.path.exists(SALES_CSV):
-        # create empty sales file with common columns
-        df = pd.DataFrame(columns=[
-            "Customer ID", "Product ID", "Product Name",
-            "Date of Sale", "Quantity Sold", "Unit Price", "Total Sale Amount"
-        ])
-        df.to_csv(SALES_CSV, index=False)
-
-def load_sales():
-    _ensure_sales_file()
-    df = pd.read_csv(SALES_CSV)
-    # Clean column names (strip)
-    df.columns = [c.strip() for c in df.columns]
-    # Normalize expected columns
-    # If old columns had trailing spaces, above strips them
-    # Parse dates:
-    if "Date of Sale" in df.columns:
-        df["Date of Sale"] = pd.to_datetime(df["Date of Sale"], errors="coerce").dt.date
-    # Numeric
-    if "Quantity Sold" in df.columns:
-        df["Quantity Sold"] = pd.to_numeric(df["Quantity Sold"], errors="coerce").fillna(0).astype(int)
-    if "Unit Price" in df.columns:
-        df["Unit Price"] = pd.to_numeric(df["Unit Price"], errors="coerce").fillna(0.0)
-    if "Total Sale Amount" in df.columns:
-        df["Total Sale Amount"] = pd.to_numeric(df["Total Sale Amount"], errors="coerce").fillna(0.0)
-    return df
-
-def save_sales(df: pd.DataFrame):
-    # ensure normalized column names before saving
-    df = df.copy()
-    df.columns = [c.strip() for c in df.columns]
-    # Ensure date formatting
-    if "Date of Sale" in df.columns:
-        df["Date of Sale"] = pd.to_datetime(df["Date of Sale"]).dt.strftime("%Y-%m-%d")
-    df.to_csv(SALES_CSV, index=False)
-
-def get_sales_aggregates():
-    """
-    Returns a DataFrame grouped by Product ID with total units sold and last sold date.
-    """
-    df = load_sales()
-    if df.empty:
-        return pd.DataFrame(columns=["Product ID", "Total_Sold", "Last_Sold_Date"])
-    grp = df.groupby("Product ID").agg(
-        Total_Sold=("Quantity Sold", "sum"),
-        Last_Sold_Date=("Date of Sale", lambda s: pd.to_datetime(s).max())
-    ).reset_index()
-    grp["Last_Sold_Date"] = pd.to_datetime(grp["Last_Sold_Date"]).dt.date
-    return grp
-
-def get_last_sold_date_map():
-    df = get_sales_aggregates()
-    return dict(zip(df["Product ID"].astype(int), df["Last_Sold_Date"]))
-
-def get_total_sold_map():
-    df = get_sales_aggregates()
-    return dict(zip(df["Product ID"].astype(int), df["Total_Sold"]))
-
-def apply_sales_to_inventory(product_df: pd.DataFrame) -> pd.DataFrame:
-    """
-    Subtracts sold quantities (from Sales_log.csv) from product_df['Total Quantity'].
-    This is idempotent: it stores and updates 'Applied_Sales_Total' column in product_df
-    to avoid double application. Returns the updated product_df (and does not save it).
-    """
-    prod = product_df.copy()
-    sales = load_sales()
-    # Normalize types
-    prod["Product ID"] = pd.to_numeric(prod["Product ID"], errors="coerce")
-    prod["Total Quantity"] = pd.to_numeric(prod["Total Quantity"], errors="coerce").fillna(0).astype(int)
-
-    # compute total sold per product from sales df
-    if sales.empty:
-        # ensure Applied_Sales_Total exists
-        if "Applied_Sales_Total" not in prod.columns:
-            prod["Applied_Sales_Total"] = 0
-        return prod
-
-    sales_grp = sales.groupby("Product ID")["Quantity Sold"].sum().to_dict()
-
-    # ensure column exists
-    if "Applied_Sales_Total" not in prod.columns:
-        prod["Applied_Sales_Total"] = 0
-
-    # iterate and apply differences
-    def apply_row(row):
-        pid = int(row["Product ID"]) if not pd.isna(row["Product ID"]) else None
-        applied = int(row.get("Applied_Sales_Total", 0) or 0)
-        sold_total = int(sales_grp.get(pid, 0)) if pid is not None else 0
-        delta = sold_total - applied
-        if delta != 0:
-            # subtract delta from Total Quantity (ensure not negative)
-            new_qty = int(row["Total Quantity"]) - int(delta)
-            if new_qty < 0:
-                new_qty = 0
-            row["Total Quantity"] = new_qty
-            row["Applied_Sales_Total"] = sold_total
-        return row
-
-    prod = prod.apply(apply_row, axis=1)
-
-    return prod
-
-def products_not_sold_for_days(product_df: pd.DataFrame, days: int):
-    """
-    Returns products whose last sold date is older than today - days,
-    or never sold.
-    """
-    prod = product_df.copy()
-    sales = load_sales()
-    # build last sold map
-    last_map = get_last_sold_date_map()
-    today = date.today()
-    threshold = today - timedelta(days=days)
-    results = []
-    for _, row in prod.iterrows():
-        pid = int(row["Product ID"]) if not pd.isna(row["Product ID"]) else None
-        last = last_map.get(pid, None)
-        if last is None:
-            # never sold -> include
-            results.append(row)
-        else:
-            # include if last <= threshold
-            if pd.to_datetime(last).date() <= threshold:
-                results.append(row)
-    if results:
-        return pd.DataFrame(results)
-    else:
-        return pd.DataFrame(columns=prod.columns)
-
-def add_transaction(customer_id, product_id, product_name, date_of_sale, quantity_sold, unit_price=None):
-    """
-    Adds a sale record to Sales_log.csv. Unit price and total sale amount computed if not provided.
-    Returns the new sales row (dict). Does NOT update product CSV here; caller should update inventory.
-    """
-    df = load_sales()
-    # normalize date
-    if isinstance(date_of_sale, str):
-        ds = pd.to_datetime(date_of_sale, errors="coerce").date()
-    elif isinstance(date_of_sale, (datetime, pd.Timestamp)):
-        ds = date_of_sale.date()
-    elif isinstance(date_of_sale, date):
-        ds = date_of_sale
-    else:
-        ds = date.today()
-
-    # compute unit price if not given
-    if unit_price is None:
-        # try to find last unit price for product in sales log
-        prev = df[df["Product ID"] == product_id].sort_values("Date of Sale", ascending=False)
-        if not prev.empty and "Unit Price" in prev.columns:
-            unit_price = float(prev.iloc[0]["Unit Price"])
-        else:
-            unit_price = 0.0
-
-    total_sale = float(quantity_sold) * float(unit_price)
-
-    new_row = {
-        "Customer ID": customer_id,
-        "Product ID": int(product_id),
-        "Product Name": product_name,
-        "Date of Sale": ds.strftime("%Y-%m-%d"),
-        "Quantity Sold": int(quantity_sold),
-        "Unit Price": float(unit_price),
-        "Total Sale Amount": float(total_sale),
-    }
-
-    df2 = df.copy()
-    df2 = pd.concat([df2, pd.DataFrame([new_row])], ignore_index=True)
-    save_sales(df2)
-    return new_row
+# sales_model.py
+import numpy as np
+import pandas as pd
+import io
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, date, timedelta
+
+from pricing_model import get_effective_price
+from store_utils import file_version, parse_dates, format_dates, write_csv, store_lock
+from customer_model import update_customer_stats, CUSTOMER_STATS_CSV, CUSTOMER_DAYS_CSV
+from bill_model import next_bill_id, record_bill_lines, BILLS_CSV
+from revenue_model import update_revenue_cube, REVENUE_CUBE_CSV
+from velocity_model import update_velocity, VELOCITY_NPZ
+from lot_model import allocate_fefo
+from sketch_model import update_sketches, SKETCH_DIR
+from shared_snapshot import load_shared
+from io_metrics import observe, record_parse, record_write, record_coercion
+from change_bus import emit, subscribe, SALE_APPENDED
+
+SALES_CSV = "Sales_log.csv"   # ensure this exists in project folder
+
+SALES_CHUNK_ROWS = 100_000          # rows per chunk for streaming aggregation
+PARALLEL_MIN_BYTES = 64 * 1024**2   # below this a process pool is not worth starting
+
+# Compact in-memory schema for sales lines. Per row:
+#   Customer ID Int32 (5 B), Product ID Int32 (5 B), Product Name category (2 B code),
+#   Date of Sale datetime64 (8 B), Quantity Sold int32 (4 B), Unit Price float64 (8 B),
+#   Total Sale Amount float64 (8 B), Bill ID Int32 (5 B)
+# => ~45 MB per million sales rows (vs ~250 MB with object strings and date objects).
+SALES_DTYPES = {
+    "Customer ID": "Int32",
+    "Product ID": "Int32",
+    "Bill ID": "Int32",
+}
+
+# Retention: lines older than the window are rolled up into per-day,
+# per-product rows of the archive and dropped from Sales_log.csv.
+SALES_ARCHIVE_CSV = "Sales_archive.csv"
+ARCHIVE_COLUMNS = ["Date", "Product ID", "Units", "Revenue", "Lines", "Bills"]
+# the same lines per day and customer (anonymous lines under a blank ID),
+# so the customer stats can be rebuilt once lines have left the log
+CUSTOMER_ARCHIVE_CSV = "Sales_customer_archive.csv"
+CUSTOMER_ARCHIVE_COLUMNS = ["Date", "Customer ID", "Lines", "Spend"]
+SALES_RETENTION_DAYS = 365
+MIN_RETENTION_DAYS = 90   # velocity rings and customer recency look back this far
+
+def _ensure_sales_file():
+    if not os.path.exists(SALES_CSV):
+        # create empty sales file with common columns
+        df = pd.DataFrame(columns=[
+            "Customer ID", "Product ID", "Product Name",
+            "Date of Sale", "Quantity Sold", "Unit Price", "Total Sale Amount", "Bill ID"
+        ])
+        df.to_csv(SALES_CSV, index=False)
+
+def _normalize_sales(df: pd.DataFrame) -> pd.DataFrame:
+    # Clean column names (strip)
+    df.columns = [c.strip() for c in df.columns]
+    # Normalize expected columns
+    # If old columns had trailing spaces, above strips them
+    # Parse dates (datetime64, date-only):
+    if "Date of Sale" in df.columns:
+        dates = parse_dates(df["Date of Sale"])
+        record_coercion("sales", "Date of Sale", df["Date of Sale"], dates)
+        df["Date of Sale"] = dates
+    # Numeric
+    for col, dtype in SALES_DTYPES.items():
+        if col in df.columns:
+            df[col] = _numeric(df, col).astype(dtype)
+    if "Product Name" in df.columns:
+        df["Product Name"] = df["Product Name"].astype("category")
+    if "Quantity Sold" in df.columns:
+        df["Quantity Sold"] = _numeric(df, "Quantity Sold").fillna(0).astype("int32")
+    if "Unit Price" in df.columns:
+        df["Unit Price"] = _numeric(df, "Unit Price").fillna(0.0).astype("float64")
+    if "Total Sale Amount" in df.columns:
+        df["Total Sale Amount"] = _numeric(df, "Total Sale Amount").fillna(0.0).astype("float64")
+    return df
+
+def _numeric(df: pd.DataFrame, col: str) -> pd.Series:
+    values = pd.to_numeric(df[col], errors="coerce")
+    record_coercion("sales", col, df[col], values)
+    return values
+
+def _read_sales() -> pd.DataFrame:
+    df = pd.read_csv(SALES_CSV)
+    record_parse("sales", SALES_CSV, len(df))
+    return _normalize_sales(df)
+
+def load_sales():
+    _ensure_sales_file()
+    with observe("load_sales", "sales", SALES_CSV, cached=True) as op:
+        df = load_shared("sales", file_version(SALES_CSV), _read_sales)
+        op.rows = len(df)
+    return df
+
+def save_sales(df: pd.DataFrame):
+    # ensure normalized column names before saving
+    df = df.copy()
+    df.columns = [c.strip() for c in df.columns]
+    # Ensure date formatting (fixed ISO format on disk)
+    if "Date of Sale" in df.columns:
+        df["Date of Sale"] = format_dates(df["Date of Sale"])
+    with observe("save_sales", "sales", SALES_CSV) as op:
+        write_csv(df, SALES_CSV)
+        op.rows = len(df)
+        record_write("sales", "rewrite", len(df), os.path.getsize(SALES_CSV))
+
+# ---------------------------
+# Streaming Aggregation
+# ---------------------------
+def iter_sales_chunks(chunksize: int = SALES_CHUNK_ROWS):
+    """
+    Yields the sales log as normalized DataFrames of at most `chunksize` rows,
+    so aggregates can be built without holding the whole log in memory.
+    """
+    _ensure_sales_file()
+    with pd.read_csv(SALES_CSV, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield _normalize_sales(chunk)
+
+def _partial_aggregates(chunk: pd.DataFrame) -> dict:
+    """Per-product and per-day partial sums for one chunk."""
+    dates = chunk["Date of Sale"]
+    by_product = chunk.assign(_date=dates).groupby("Product ID").agg(
+        Total_Sold=("Quantity Sold", "sum"),
+        Last_Sold_Date=("_date", "max"),
+        Lines=("Quantity Sold", "size"),
+        Revenue=("Total Sale Amount", "sum"),
+    )
+    by_day = chunk["Total Sale Amount"].groupby(dates).sum()
+    return {"by_product": by_product, "by_day": by_day, "rows": len(chunk)}
+
+def _archive_partial() -> dict:
+    """The archived rollups in the same shape as a chunk's partial aggregates."""
+    archive = load_sales_archive()
+    if archive.empty:
+        return {"by_product": None, "by_day": None, "rows": 0}
+    by_product = archive.groupby("Product ID").agg(
+        Total_Sold=("Units", "sum"),
+        Last_Sold_Date=("Date", "max"),
+        Lines=("Lines", "sum"),
+        Revenue=("Revenue", "sum"),
+    )
+    by_day = archive["Revenue"].groupby(archive["Date"]).sum()
+    return {"by_product": by_product, "by_day": by_day, "rows": int(archive["Lines"].sum())}
+
+def _combine_partials(partials: list[dict]) -> dict:
+    """Merges partial aggregates: sums add up, last-sold dates take the max."""
+    partials = [p for p in partials if p["rows"]]
+    if not partials:
+        return {
+            "by_product": pd.DataFrame(columns=["Total_Sold", "Last_Sold_Date", "Lines", "Revenue"]),
+            "by_day": pd.Series(dtype=float),
+            "rows": 0,
+        }
+    by_product = pd.concat([p["by_product"] for p in partials]).groupby(level=0).agg(
+        {"Total_Sold": "sum", "Last_Sold_Date": "max", "Lines": "sum", "Revenue": "sum"}
+    )
+    by_day = pd.concat([p["by_day"] for p in partials]).groupby(level=0).sum().sort_index()
+    return {"by_product": by_product, "by_day": by_day, "rows": sum(p["rows"] for p in partials)}
+
+def _byte_ranges(path: str, parts: int) -> tuple[bytes, list[tuple[int, int]]]:
+    """Splits a CSV (after its header) into `parts` ranges aligned to line ends."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        body_start = f.tell()
+        bounds = [body_start]
+        for i in range(1, parts):
+            f.seek(max(body_start + (size - body_start) * i // parts, bounds[-1]))
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    bounds.append(size)
+    return header, [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+def _aggregate_byte_range(path: str, header: bytes, start: int, end: int, block_bytes: int) -> dict:
+    """
+    Process-pool worker: aggregates one byte range of the log block by block,
+    so each worker also stays within a fixed memory budget.
+    Assumes no quoted newlines inside fields (true for this log).
+    """
+    columns = [c.strip() for c in header.decode("utf-8-sig").strip().split(",")]
+    partials = []
+    with open(path, "rb") as f:
+        f.seek(start)
+        while f.tell() < end:
+            block = f.read(min(block_bytes, end - f.tell()))
+            if f.tell() < end and not block.endswith(b"\n"):
+                block += f.readline()
+            chunk = pd.read_csv(io.BytesIO(block), header=None, names=columns)
+            partials.append(_partial_aggregates(_normalize_sales(chunk)))
+    return _combine_partials(partials)
+
+# (log version, archive version) -> aggregates dict
+_AGG_CACHE = {}
+
+def stream_sales_aggregates(chunksize: int = SALES_CHUNK_ROWS, workers: int = 1) -> dict:
+    """
+    Aggregates the whole sales log chunk by chunk with flat memory use,
+    plus the archived daily rollups of lines past the retention window.
+    Returns {"by_product": Total_Sold / Last_Sold_Date / Lines / Revenue per
+    Product ID, "by_day": revenue per date, "rows": line count}.
+    With workers > 1 and a large enough log, byte ranges of the file are
+    aggregated in parallel by a process pool and the partials merged.
+    Results are cached per file version.
+    """
+    _ensure_sales_file()
+    version = (file_version(SALES_CSV), file_version(SALES_ARCHIVE_CSV))
+    cached = _AGG_CACHE.get(version)
+    if cached is not None:
+        return cached
+    result = _scan_sales_aggregates(chunksize, workers)
+    _AGG_CACHE.clear()
+    _AGG_CACHE[version] = result
+    return result
+
+def _patch_aggregates(event) -> None:
+    """Folds an appended batch into the cached aggregates instead of rescanning."""
+    archive = file_version(SALES_ARCHIVE_CSV)
+    agg = _AGG_CACHE.pop((event.previous, archive), None)
+    if agg is None:
+        return
+    _AGG_CACHE.clear()
+    _AGG_CACHE[(event.version, archive)] = _combine_partials([agg, _partial_aggregates(event.rows)])
+
+subscribe(_patch_aggregates, [SALE_APPENDED])
+
+def _scan_sales_aggregates(chunksize: int, workers: int) -> dict:
+    if workers > 1 and os.path.getsize(SALES_CSV) >= PARALLEL_MIN_BYTES:
+        header, ranges = _byte_ranges(SALES_CSV, workers)
+        # ~100 bytes per line: keep each worker's block near `chunksize` rows
+        block_bytes = chunksize * 100
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_aggregate_byte_range, SALES_CSV, header, a, b, block_bytes)
+                for a, b in ranges
+            ]
+            return _combine_partials([f.result() for f in futures] + [_archive_partial()])
+
+    partials = [_partial_aggregates(c) for c in iter_sales_chunks(chunksize)]
+    return _combine_partials(partials + [_archive_partial()])
+
+# ---------------------------
+# Retention / Archive
+# ---------------------------
+# archive-file version -> rollups (one row per Date x Product ID)
+_ARCHIVE_CACHE = {}
+
+def load_sales_archive() -> pd.DataFrame:
+    """Per-day, per-product rollups of archived sales (cached per file version)."""
+    version = file_version(SALES_ARCHIVE_CSV)
+    if version is None:
+        return pd.DataFrame({
+            "Date": pd.Series(dtype="datetime64[ns]"), "Product ID": pd.Series(dtype="Int32"),
+            "Units": pd.Series(dtype="int64"), "Revenue": pd.Series(dtype=float),
+            "Lines": pd.Series(dtype="int64"), "Bills": pd.Series(dtype="int64"),
+        })
+    cached = _ARCHIVE_CACHE.get(version)
+    if cached is not None:
+        return cached
+
+    archive = pd.read_csv(SALES_ARCHIVE_CSV)
+    archive["Date"] = parse_dates(archive["Date"])
+    archive["Product ID"] = pd.to_numeric(archive["Product ID"], errors="coerce").astype("Int32")
+    # rollups are additive: a backdated sale archived later just adds to its cell
+    archive = archive.groupby(["Date", "Product ID"], as_index=False)[["Units", "Revenue", "Lines", "Bills"]].sum()
+    _ARCHIVE_CACHE.clear()
+    _ARCHIVE_CACHE[version] = archive
+    return archive
+
+_CUSTOMER_ARCHIVE_CACHE = {}
+
+def load_customer_archive() -> pd.DataFrame:
+    """Per-day, per-customer rollups of archived sales (cached per file version)."""
+    version = file_version(CUSTOMER_ARCHIVE_CSV)
+    if version is None:
+        return pd.DataFrame({
+            "Date": pd.Series(dtype="datetime64[ns]"), "Customer ID": pd.Series(dtype="Int32"),
+            "Lines": pd.Series(dtype="int64"), "Spend": pd.Series(dtype=float),
+        })
+    cached = _CUSTOMER_ARCHIVE_CACHE.get(version)
+    if cached is not None:
+        return cached
+
+    archive = pd.read_csv(CUSTOMER_ARCHIVE_CSV)
+    archive["Date"] = parse_dates(archive["Date"])
+    archive["Customer ID"] = pd.to_numeric(archive["Customer ID"], errors="coerce").astype("Int32")
+    archive = archive.groupby(["Date", "Customer ID"], as_index=False, dropna=False)[["Lines", "Spend"]].sum()
+    _CUSTOMER_ARCHIVE_CACHE.clear()
+    _CUSTOMER_ARCHIVE_CACHE[version] = archive
+    return archive
+
+def customer_archive_complete() -> bool:
+    """
+    Whether the customer archive holds every archived line (archives
+    written before it existed do not), i.e. whether the customer stats
+    can be rebuilt without losing archived spend and visits.
+    """
+    return int(load_customer_archive()["Lines"].sum()) == int(load_sales_archive()["Lines"].sum())
+
+def apply_sales_retention(retention_days: int = SALES_RETENTION_DAYS) -> dict:
+    """
+    Rolls sales lines dated before today - retention_days into the archive
+    (units, revenue, lines and distinct bills per day and product, plus
+    lines and spend per day and customer) and rewrites Sales_log.csv once
+    with only the recent lines.
+    The revenue cube, velocity rings, customer stats and bills are kept
+    incrementally and are not affected; their rebuilds fold in the archive,
+    except bills, which then only live in Bills.csv and are never dropped.
+    Returns {"archived": n, "kept": n}.
+    """
+    if retention_days < MIN_RETENTION_DAYS:
+        raise ValueError(f"Retention must be at least {MIN_RETENTION_DAYS} days.")
+    cutoff = pd.Timestamp(date.today() - timedelta(days=int(retention_days)))
+
+    # the log is read and rewritten as a whole: no sale may be appended in between
+    with sales_lock():
+        hot, bill_rows, customer_rows, archived = [], [], [], 0
+        for chunk in iter_sales_chunks():
+            old = (chunk["Date of Sale"] < cutoff).fillna(False).to_numpy()
+            hot.append(chunk[~old])
+            if old.any():
+                cold = chunk[old]
+                # lines without a Bill ID count as a bill each (unique negative keys)
+                own_bill = pd.Series(-(archived + np.arange(1, len(cold) + 1)), index=cold.index)
+                bill = cold["Bill ID"].astype("Int64").fillna(own_bill) if "Bill ID" in cold.columns else own_bill
+                archived += len(cold)
+                # bill-level partials: a bill's lines may span chunks
+                bill_rows.append(cold.groupby(
+                    ["Date of Sale", "Product ID", bill.rename("Bill ID")], observed=True
+                ).agg(Units=("Quantity Sold", "sum"), Revenue=("Total Sale Amount", "sum"),
+                      Lines=("Quantity Sold", "size")))
+                customer_rows.append(cold.groupby(["Date of Sale", "Customer ID"], observed=True, dropna=False).agg(
+                    Lines=("Quantity Sold", "size"), Spend=("Total Sale Amount", "sum")))
+        if not archived:
+            return {"archived": 0, "kept": sum(len(h) for h in hot)}
+
+        by_bill = pd.concat(bill_rows).groupby(level=[0, 1, 2]).sum()
+        rollup = by_bill.groupby(level=[0, 1]).agg(
+            Units=("Units", "sum"), Revenue=("Revenue", "sum"), Lines=("Lines", "sum"), Bills=("Units", "size"),
+        ).reset_index().rename(columns={"Date of Sale": "Date"})
+        rollup["Date"] = format_dates(rollup["Date"])
+        by_customer = pd.concat(customer_rows).groupby(level=[0, 1], dropna=False).sum().reset_index()
+        by_customer = by_customer.rename(columns={"Date of Sale": "Date"})
+        by_customer["Date"] = format_dates(by_customer["Date"])
+        # the customer rollup first: customer_archive_complete never
+        # reports an archive whose customers were not written
+        by_customer[CUSTOMER_ARCHIVE_COLUMNS].to_csv(
+            CUSTOMER_ARCHIVE_CSV, mode="a", header=not os.path.exists(CUSTOMER_ARCHIVE_CSV), index=False
+        )
+        rollup[ARCHIVE_COLUMNS].to_csv(
+            SALES_ARCHIVE_CSV, mode="a", header=not os.path.exists(SALES_ARCHIVE_CSV), index=False
+        )
+
+        kept = pd.concat(hot, ignore_index=True)
+        save_sales(kept)
+        return {"archived": archived, "kept": len(kept)}
+
+def get_sales_aggregates(workers: int = 1):
+    """
+    Returns a DataFrame grouped by Product ID with total units sold and last sold date.
+    """
+    agg = stream_sales_aggregates(workers=workers)["by_product"]
+    if agg.empty:
+        return pd.DataFrame(columns=["Product ID", "Total_Sold", "Last_Sold_Date"])
+    return agg[["Total_Sold", "Last_Sold_Date"]].rename_axis("Product ID").reset_index()
+
+def get_last_sold_date_map():
+    df = get_sales_aggregates()
+    return dict(zip(df["Product ID"].astype(int), df["Last_Sold_Date"]))
+
+def get_total_sold_map():
+    df = get_sales_aggregates()
+    return dict(zip(df["Product ID"].astype(int), df["Total_Sold"]))
+
+def apply_sales_to_inventory(product_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Subtracts sold quantities (from Sales_log.csv) from product_df['Total Quantity'].
+    This is idempotent: it stores and updates 'Applied_Sales_Total' column in product_df
+    to avoid double application. Returns the updated product_df (and does not save it).
+    """
+    prod = product_df.copy()
+    # Normalize types
+    prod["Total Quantity"] = pd.to_numeric(prod["Total Quantity"], errors="coerce").fillna(0).astype("int32")
+
+    # ensure column exists
+    if "Applied_Sales_Total" not in prod.columns:
+        prod["Applied_Sales_Total"] = 0
+    applied = pd.to_numeric(prod["Applied_Sales_Total"], errors="coerce").fillna(0).astype("int32")
+
+    # compute total sold per product from the streamed aggregates
+    sales_grp = get_sales_aggregates().set_index("Product ID")["Total_Sold"]
+    sold_total = prod["Product ID"].map(sales_grp).fillna(0).astype("int32")
+
+    # apply differences (vectorized); Total Quantity never goes negative
+    delta = sold_total - applied
+    changed = delta != 0
+    prod["Total Quantity"] = prod["Total Quantity"].where(~changed, (prod["Total Quantity"] - delta).clip(lower=0))
+    prod["Applied_Sales_Total"] = applied.where(~changed, sold_total)
+
+    return prod
+
+def products_not_sold_for_days(product_df: pd.DataFrame, days: int):
+    """
+    Returns products whose last sold date is older than today - days,
+    or never sold.
+    """
+    # last sold date per product (datetime64)
+    last_sold = get_sales_aggregates().set_index("Product ID")["Last_Sold_Date"]
+    threshold = pd.Timestamp(date.today() - timedelta(days=days))
+    last = product_df["Product ID"].map(last_sold)
+    # never sold, or last sold on/before the threshold
+    return product_df[(last.isna() | (last <= threshold)).to_numpy()]
+
+def _sale_date(date_of_sale) -> date:
+    # normalize date
+    if isinstance(date_of_sale, str):
+        parsed = parse_dates(pd.Series([date_of_sale])).iloc[0]
+        if pd.isna(parsed):
+            raise ValueError(f"Unrecognised sale date: {date_of_sale!r}")
+        return parsed.date()
+    if isinstance(date_of_sale, (datetime, pd.Timestamp)):
+        return date_of_sale.date()
+    if isinstance(date_of_sale, date):
+        return date_of_sale
+    return date.today()
+
+# sales-log version -> {Product ID: (Date of Sale, Unit Price)} of each product's latest line
+_LAST_PRICE_CACHE = {}
+
+def get_last_sold_prices() -> dict:
+    """
+    Latest sold unit price per product (by sale date; later lines win ties).
+    Built once by streaming the log, then patched by add_transactions.
+    """
+    version = file_version(SALES_CSV)
+    cached = _LAST_PRICE_CACHE.get(version)
+    if cached is not None:
+        return cached
+
+    last = {}
+    for chunk in iter_sales_chunks():
+        chunk = chunk.dropna(subset=["Product ID", "Date of Sale", "Unit Price"])
+        latest = chunk.sort_values("Date of Sale", kind="stable").drop_duplicates("Product ID", keep="last")
+        for pid, ds, price in zip(latest["Product ID"], latest["Date of Sale"], latest["Unit Price"]):
+            if pid not in last or ds >= last[pid][0]:
+                last[int(pid)] = (ds, float(price))
+    _LAST_PRICE_CACHE.clear()
+    _LAST_PRICE_CACHE[version] = last
+    return last
+
+def _note_last_prices(rows: list[dict], old_version) -> None:
+    """Carries the last-price map over an append instead of rebuilding it."""
+    last = _LAST_PRICE_CACHE.pop(old_version, None)
+    if last is None:
+        return
+    for r in rows:
+        ds = pd.Timestamp(r["Date of Sale"])
+        pid = int(r["Product ID"])
+        if pid not in last or ds >= last[pid][0]:
+            last[pid] = (ds, float(r["Unit Price"]))
+    _LAST_PRICE_CACHE.clear()
+    _LAST_PRICE_CACHE[file_version(SALES_CSV)] = last
+
+def _last_sold_price(product_id):
+    # last unit price the product was sold at (O(1) once the map is built)
+    hit = get_last_sold_prices().get(int(product_id))
+    if hit is not None:
+        return hit[1]
+    # only archived sales: average price of the product's latest archived day
+    archive = load_sales_archive()
+    days = archive[(archive["Product ID"] == int(product_id)).fillna(False).to_numpy()]
+    if not days.empty:
+        latest = days.loc[days["Date"].idxmax()]
+        if latest["Units"]:
+            return float(latest["Revenue"] / latest["Units"])
+    return 0.0
+
+def _append_sales_rows(rows: list[dict]) -> None:
+    """
+    Appends new lines to Sales_log.csv without rewriting it. A legacy file
+    whose header lacks a newer column is rewritten once with the full schema.
+    """
+    _ensure_sales_file()
+    with open(SALES_CSV, encoding="utf-8-sig") as f:
+        columns = [c.strip() for c in f.readline().strip().split(",")]
+    new = pd.DataFrame(rows)
+    if set(new.columns) - set(columns):
+        save_sales(pd.concat([load_sales(), new], ignore_index=True))
+        return
+
+    with open(SALES_CSV, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+        start = f.tell()
+    new.reindex(columns=columns).to_csv(SALES_CSV, mode="a", header=False, index=False)
+    record_write("sales", "append", len(new), os.path.getsize(SALES_CSV) - start)
+
+def add_transactions(lines: list[dict], on_appended=None) -> list[dict]:
+    """
+    Records a batch of sales lines with a single append to Sales_log.csv and
+    one update of each derived store (customers, bills, sketches, revenue cube, velocity)
+    and a first-expired-first-out draw from each product's lots.
+    Each line takes the keyword arguments of add_transaction. Lines without
+    a bill_id start a new bill each. Returns the new sales rows (dicts).
+    `on_appended(rows)` runs right after the append, in the same locked step
+    (the POS service records its idempotency keys there).
+    Once the lines are in the log the sale stands: a failing derived-store
+    update does not raise (see _update_derived).
+    Does NOT update product CSV here; caller should update inventory.
+    """
+    # one writer at a time: every session and the POS service share these
+    # stores, and the derived stores are read-modify-write
+    with observe("add_transactions", "sales", SALES_CSV) as op, sales_lock():
+        rows = _record_lines(lines, on_appended)
+        op.rows = len(rows)
+        return rows
+
+
+def sales_lock():
+    """
+    Held while the sales log or the stores derived from it are written. A
+    file lock, so the app and the POS service never interleave (see
+    store_utils.store_lock).
+    """
+    return store_lock(SALES_CSV)
+
+
+# derived-store updates, with the paths to drop when one fails: the store is
+# then rebuilt from the log on next use (lots are not derived from the log,
+# so a failed allocation is only recorded)
+_DERIVED_STORES = [
+    (update_customer_stats, (CUSTOMER_STATS_CSV, CUSTOMER_DAYS_CSV)),
+    (record_bill_lines, (BILLS_CSV,)),
+    (update_sketches, (SKETCH_DIR,)),
+    (update_revenue_cube, (REVENUE_CUBE_CSV,)),
+    (update_velocity, (VELOCITY_NPZ,)),
+    (allocate_fefo, ()),
+]
+
+# (update name, exception) of the last derived-store update that failed
+last_derived_error = None
+
+
+def _drop_paths(update, paths: tuple) -> tuple:
+    """
+    The paths to drop after a failed update; none when the rebuild from
+    the log could not recover archived lines (archived bills, or customers
+    of an archive older than the customer rollup): the store is kept as is.
+    """
+    if update is record_bill_lines and os.path.exists(SALES_ARCHIVE_CSV):
+        return ()
+    if update is update_customer_stats and not customer_archive_complete():
+        return ()
+    return paths
+
+def _update_derived(rows: list[dict]) -> None:
+    """Folds committed lines into each derived store; a failure marks that store for rebuild."""
+    global last_derived_error
+    for update, paths in _DERIVED_STORES:
+        try:
+            update(rows)
+        except Exception as e:
+            last_derived_error = (update.__name__, e)
+            for path in _drop_paths(update, paths):
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                elif os.path.exists(path):
+                    os.remove(path)
+
+
+def _record_lines(lines: list[dict], on_appended=None) -> list[dict]:
+    rows = []
+    # one reservation for every line that starts its own bill
+    unbilled = sum(line.get("bill_id") is None for line in lines)
+    bill_id = next_bill_id(unbilled) - 1 if unbilled else None
+    for line in lines:
+        ds = _sale_date(line.get("date_of_sale"))
+        product_id = line["product_id"]
+        quantity_sold = line["quantity_sold"]
+
+        # compute unit price if not given
+        unit_price = line.get("unit_price")
+        if unit_price is None:
+            unit_price = get_effective_price(product_id, ds)
+        if unit_price is None:
+            # unknown to the catalogue
+            unit_price = _last_sold_price(product_id)
+
+        total_sale = float(quantity_sold) * float(unit_price)
+
+        line_bill = line.get("bill_id")
+        if line_bill is None:
+            bill_id += 1
+            line_bill = bill_id
+
+        rows.append({
+            "Customer ID": line.get("customer_id"),
+            "Product ID": int(product_id),
+            "Product Name": line.get("product_name"),
+            "Date of Sale": ds.strftime("%Y-%m-%d"),
+            "Quantity Sold": int(quantity_sold),
+            "Unit Price": float(unit_price),
+            "Total Sale Amount": float(total_sale),
+            "Bill ID": int(line_bill),
+        })
+
+    if not rows:
+        return rows
+    old_version = file_version(SALES_CSV)
+    _append_sales_rows(rows)
+    new_version = file_version(SALES_CSV)
+    try:
+        if on_appended is not None:
+            on_appended(rows)
+    finally:
+        # the lines are in the log whatever on_appended did
+        _note_last_prices(rows, old_version)
+        _update_derived(rows)
+        emit(SALE_APPENDED, sorted({r["Product ID"] for r in rows}), old_version, new_version,
+             _normalize_sales(pd.DataFrame(rows)))
+    return rows
+
+def add_transaction(customer_id, product_id, product_name, date_of_sale, quantity_sold, unit_price=None,
+                    bill_id=None):
+    """
+    Adds a sale record to Sales_log.csv. Unit price and total sale amount computed if not provided:
+    the effective (discounted) price for the sale date is used, falling back to the last sold price.
+    Pass the Bill ID of an open bill to add another line to it; otherwise a new bill is started.
+    Returns the new sales row (dict). Does NOT update product CSV here; caller should update inventory.
+    """
+    return add_transactions([{
+        "customer_id": customer_id,
+        "product_id": product_id,
+        "product_name": product_name,
+        "date_of_sale": date_of_sale,
+        "quantity_sold": quantity_sold,
+        "unit_price": unit_price,
+        "bill_id": bill_id,
+    }])[0]
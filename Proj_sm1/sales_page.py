@@ -1,266 +1,345 @@
-# sales_page.py
-import streamlit as st
-import pandas as pd
-from datetime import date
-import altair as alt
-
-# --------------------------
-# IMPORTS FROM SALES MODEL
-# --------------------------
-from sales_model import (
-    load_sales,
-    save_sales,
-    get_sales_aggregates,
-    add_transaction,
-    products_not_sold_for_days,
-    apply_sales_to_inventory,
-    load_sales as load_sales_df
-)
-
-# --------------------------
-# IMPORTS FROM DATA MODEL
-# --------------------------
-from data_model import load_products, save_products
-
-
-def _ensure_sales_date_is_date(sales_df: pd.DataFrame) -> pd.DataFrame:
-    """Ensure 'Date of Sale' exists and is date-only (no time)."""
-    if "Date of Sale" not in sales_df.columns:
-        sales_df["Date of Sale"] = pd.NaT
-        return sales_df
-    sales_df = sales_df.copy()
-    sales_df["Date of Sale"] = pd.to_datetime(sales_df["Date of Sale"], errors="coerce")
-    # convert to date (remove time)
-    sales_df["Date of Sale"] = sales_df["Date of Sale"].dt.date
-    return sales_df
-
-
-def render_sales_page():
-    st.title("🧾 Sales & Transactions")
-
-    tab1, tab2, tab3 = st.tabs([
-        "Data & Stats",
-        "View Transactions",
-        "Add Transaction"
-    ])
-
-    # ----------------------
-    # TAB 1 — DATA & STATISTICS
-    # ----------------------
-    with tab1:
-        st.subheader("📊 Sales Summary & Statistics")
-
-        sales_df = load_sales()
-        sales_df = _ensure_sales_date_is_date(sales_df)
-        prod_df = load_products()
-        prod_snapshot = apply_sales_to_inventory(prod_df.copy())
-
-        # Inventory snapshot
-        st.write("### 🏷 Inventory Snapshot (After Sales Applied)")
-        st.dataframe(prod_snapshot, use_container_width=True)
-
-        st.markdown("---")
-
-        # ---------- Total revenue metrics (by Type) ----------
-        st.write("### 💰 Total Revenue Summary")
-
-        if sales_df.empty:
-            st.info("No sales recorded yet.")
-        else:
-            # Merge sales with product master to get Type (Veg / Non-Veg / Inedible)
-            # Use left join: sales -> product to pick up Type values
-            merged = sales_df.merge(
-                prod_df[["Product ID", "Type"]],
-                on="Product ID",
-                how="left"
-            )
-
-            # Ensure numeric and presence of Total Sale Amount
-            if "Total Sale Amount" not in merged.columns:
-                merged["Total Sale Amount"] = 0.0
-            merged["Total Sale Amount"] = pd.to_numeric(merged["Total Sale Amount"], errors="coerce").fillna(0.0)
-
-            total_rev = merged["Total Sale Amount"].sum()
-            veg_rev = merged[merged["Type"] == "Veg"]["Total Sale Amount"].sum()
-            nonveg_rev = merged[merged["Type"] == "Non-Veg"]["Total Sale Amount"].sum()
-            inedible_rev = merged[merged["Type"] == "Inedible"]["Total Sale Amount"].sum()
-
-            c1, c2, c3, c4 = st.columns(4)
-            c1.metric("Total Revenue", f"₹{total_rev:,.2f}")
-            c2.metric("Veg Revenue", f"₹{veg_rev:,.2f}")
-            c3.metric("Non-Veg Revenue", f"₹{nonveg_rev:,.2f}")
-            c4.metric("Inedible Revenue", f"₹{inedible_rev:,.2f}")
-
-        st.markdown("---")
-
-        # ---------- Scatter: Transaction # vs Bill Amount (dotted avg line) ----------
-        st.write("### 📈 Customer Bill Scatter (Transaction # vs Bill Amount)")
-
-        if sales_df.empty:
-            st.info("Not enough sales to plot bills.")
-        else:
-            # Group into bills: (Customer ID, Date of Sale) => one bill per customer per date
-            bills = sales_df.groupby(["Customer ID", "Date of Sale"], dropna=False)["Total Sale Amount"] \
-                            .sum().reset_index()
-
-            # Ensure Date is datetime.date and sorted chronologically
-            bills["Date of Sale"] = pd.to_datetime(bills["Date of Sale"], errors="coerce").dt.date
-            bills = bills.sort_values("Date of Sale").reset_index(drop=True)
-
-            bills["Transaction_Num"] = bills.index + 1
-            bills["Total Sale Amount"] = pd.to_numeric(bills["Total Sale Amount"], errors="coerce").fillna(0.0)
-
-            avg_bill = bills["Total Sale Amount"].mean()
-
-            st.write(f"**Average Bill Amount → ₹{avg_bill:,.2f}**")
-
-            scatter = alt.Chart(bills).mark_circle(size=70, color="#4EA8DE").encode(
-                x=alt.X("Transaction_Num:Q", title="Transaction #"),
-                y=alt.Y("Total Sale Amount:Q", title="Bill Amount (₹)"),
-                tooltip=[
-                    alt.Tooltip("Transaction_Num:Q", title="Txn #"),
-                    alt.Tooltip("Customer ID:O", title="Customer"),
-                    alt.Tooltip("Date of Sale:T", title="Date"),
-                    alt.Tooltip("Total Sale Amount:Q", title="Bill (₹)", format=",.2f"),
-                ]
-            ).properties(height=320, width="container")
-
-            avg_line = alt.Chart(pd.DataFrame({"y": [avg_bill]})).mark_rule(strokeDash=[6,6], color="red").encode(
-                y="y:Q"
-            )
-
-            st.altair_chart((scatter + avg_line).interactive(), use_container_width=True)
-
-        st.markdown("---")
-
-        # ---------- Daily revenue line chart (date-wise, no time) ----------
-        st.write("### 📉 Total Sales by Date (Date-wise)")
-
-        if sales_df.empty:
-            st.info("No sales to visualize.")
-        else:
-            daily = sales_df.groupby("Date of Sale", sort=True)["Total Sale Amount"].sum().reset_index()
-            # Ensure Date column is datetime (with no time)
-            daily["Date"] = pd.to_datetime(daily["Date of Sale"].astype(str), errors="coerce")
-            daily["Total Sale Amount"] = pd.to_numeric(daily["Total Sale Amount"], errors="coerce").fillna(0.0)
-
-            line = alt.Chart(daily).mark_line(point=True, color="#9B5DE5").encode(
-                x=alt.X("Date:T", title="Date", axis=alt.Axis(format="%Y-%m-%d", labelAngle=-45)),
-                y=alt.Y("Total Sale Amount:Q", title="Revenue (₹)")
-            ).properties(height=320, width="container")
-
-            st.altair_chart(line.interactive(), use_container_width=True)
-
-        st.markdown("---")
-
-        # ---------- Products not sold for N days ----------
-        st.write("### 🕒 Products Not Sold for N Days")
-        days = st.number_input("Enter days:", min_value=1, value=5, key="unsold_days_stats")
-        prod_df_for_unsold = prod_df.copy()
-        unsold = products_not_sold_for_days(prod_df_for_unsold, int(days))
-        if unsold.empty:
-            st.info(f"No products unsold for ≥ {days} days.")
-        else:
-            st.dataframe(unsold, use_container_width=True)
-
-    # ----------------------
-    # TAB 2 — VIEW TRANSACTIONS
-    # ----------------------
-    with tab2:
-        st.subheader("📒 View Transactions")
-        sales_df2 = load_sales_df()
-        sales_df2 = _ensure_sales_date_is_date(sales_df2)
-
-        if sales_df2.empty:
-            st.info("No transactions recorded.")
-        else:
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                f_pid = st.text_input("Filter by Product ID:")
-            with col2:
-                f_cust = st.text_input("Filter by Customer ID:")
-            with col3:
-                f_date = st.date_input("Filter by Date:")
-
-            filtered = sales_df2.copy()
-
-            if f_pid.strip().isdigit():
-                filtered = filtered[filtered["Product ID"] == int(f_pid)]
-
-            if f_cust.strip().isdigit():
-                filtered = filtered[filtered["Customer ID"] == int(f_cust)]
-
-            if f_date:
-                filtered = filtered[pd.to_datetime(filtered["Date of Sale"]).dt.date == f_date]
-
-            st.write("### Filtered Transactions")
-            st.dataframe(filtered, use_container_width=True)
-
-            # total revenue for displayed results
-            total_filtered_revenue = pd.to_numeric(filtered.get("Total Sale Amount", pd.Series([0.0])), errors="coerce").fillna(0.0).sum()
-            st.success(f"Total Revenue for Displayed Transactions: ₹{total_filtered_revenue:,.2f}")
-
-    # ----------------------
-    # TAB 3 — ADD TRANSACTION
-    # ----------------------
-    with tab3:
-        st.subheader("➕ Add New Transaction")
-
-        prod_df = load_products()
-        prod_df = apply_sales_to_inventory(prod_df.copy())
-
-        options = prod_df.apply(
-            lambda r: f"{int(r['Product ID'])} | {r['Product Name']} | Qty: {int(r['Total Quantity'])}",
-            axis=1
-        ).tolist()
-
-        choice = st.selectbox("Select Product:", ["-- Select --"] + options, key="addtx_select")
-
-        sel_pid = None
-        sel_row = None
-        if choice != "-- Select --":
-            sel_pid = int(choice.split("|")[0].strip())
-            sel_row = prod_df[prod_df["Product ID"] == sel_pid].iloc[0]
-            st.success(f"{sel_row['Product Name']}  | Available: {int(sel_row['Total Quantity'])}")
-
-        cust_id = st.text_input("Customer ID (optional):", key="addtx_cust")
-        qty = st.number_input("Quantity Sold:", min_value=1, value=1, key="addtx_qty")
-        unit_price = st.number_input("Unit Price (0 = auto):", min_value=0.0, value=0.0, key="addtx_price")
-        sale_date = st.date_input("Date of Sale:", value=date.today(), key="addtx_date")
-
-        if st.button("💾 Create Transaction", key="addtx_create"):
-            if sel_pid is None:
-                st.error("Please select a product.")
-            else:
-                available = int(sel_row["Total Quantity"])
-                if qty > available:
-                    st.error(f"Not enough stock. Available: {available}")
-                else:
-                    if unit_price == 0.0:
-                        unit_price = float(sel_row.get("Unit Price", 0.0))
-
-                    tx = add_transaction(
-                        customer_id=int(cust_id) if cust_id.strip().isdigit() else None,
-                        product_id=sel_pid,
-                        product_name=sel_row["Product Name"],
-                        date_of_sale=sale_date,
-                        quantity_sold=int(qty),
-                        unit_price=float(unit_price)
-                    )
-
-                    # update product inventory on disk
-                    prod_full = load_products()
-                    prod_full["Product ID"] = pd.to_numeric(prod_full["Product ID"], errors="coerce")
-                    mask = prod_full["Product ID"] == sel_pid
-                    if mask.any():
-                        idx = prod_full[mask].index[0]
-                        new_qty = max(0, int(prod_full.loc[idx, "Total Quantity"]) - int(qty))
-                        prod_full.loc[idx, "Total Quantity"] = new_qty
-                        prod_full.loc[idx, "Total_Amount"] = new_qty * float(prod_full.loc[idx].get("Unit Price", 0.0))
-                        if "Applied_Sales_Total" not in prod_full.columns:
-                            prod_full["Applied_Sales_Total"] = 0
-                        prod_full.loc[idx, "Applied_Sales_Total"] = int(prod_full.loc[idx, "Applied_Sales_Total"] or 0) + int(qty)
-                        save_products(prod_full)
-
-                    st.success("Transaction created and inventory updated.")
-                    st.json(tx)
+# sales_page.py
+import streamlit as st
+import pandas as pd
+from datetime import date
+import altair as alt
+
+# --------------------------
+# IMPORTS FROM SALES MODEL
+# --------------------------
+from sales_model import (
+    load_sales,
+    save_sales,
+    get_sales_aggregates,
+    add_transaction,
+    apply_sales_to_inventory,
+    apply_sales_retention,
+    SALES_RETENTION_DAYS,
+    MIN_RETENTION_DAYS,
+)
+
+# --------------------------
+# IMPORTS FROM DATA MODEL
+# --------------------------
+from data_model import load_products, decrement_stock, products_lock
+from bill_model import load_bills
+from revenue_model import revenue_between, daily_revenue, revenue_date_bounds
+from customer_model import load_customer_stats, get_customer, customers_in_segment, SEGMENTS
+from alert_model import refresh_alerts
+from velocity_model import days_of_stock
+from product_index import product_choices, get_product, product_prices, product_index
+from sketch_model import sketch_stats, sketch_bounds
+from query_engine import filter_transactions, unsold_products
+
+
+def render_sales_page():
+    st.title("🧾 Sales & Transactions")
+
+    tab1, tab2, tab3 = st.tabs([
+        "Data & Stats",
+        "View Transactions",
+        "Add Transaction"
+    ])
+
+    # ----------------------
+    # TAB 1 — DATA & STATISTICS
+    # ----------------------
+    with tab1:
+        st.subheader("📊 Sales Summary & Statistics")
+
+        # the cube covers archived history as well as the current log
+        first_day, last_day = revenue_date_bounds()
+        has_sales = first_day is not None
+        prod_df = load_products()
+        prod_snapshot = apply_sales_to_inventory(prod_df)
+        prod_snapshot.insert(
+            prod_snapshot.columns.get_loc("Total Quantity") + 1, "Days_Of_Stock", days_of_stock(prod_snapshot)
+        )
+
+        # Inventory snapshot
+        st.write("### 🏷 Inventory Snapshot (After Sales Applied)")
+        st.dataframe(prod_snapshot, use_container_width=True)
+
+        st.markdown("---")
+
+        # ---------- Total revenue metrics (by Type) ----------
+        st.write("### 💰 Total Revenue Summary")
+
+        if not has_sales:
+            st.info("No sales recorded yet.")
+        else:
+            # Revenue split by Type comes from the precomputed revenue cube
+            period = st.date_input("Revenue period:", value=(first_day, last_day), key="rev_period")
+            if isinstance(period, (tuple, list)) and len(period) == 2:
+                rev_start, rev_end = period
+            else:
+                rev_start, rev_end = first_day, last_day
+
+            total_rev = revenue_between(rev_start, rev_end)[1]
+            veg_rev = revenue_between(rev_start, rev_end, type_="Veg")[1]
+            nonveg_rev = revenue_between(rev_start, rev_end, type_="Non-Veg")[1]
+            inedible_rev = revenue_between(rev_start, rev_end, type_="Inedible")[1]
+
+            c1, c2, c3, c4 = st.columns(4)
+            c1.metric("Total Revenue", f"₹{total_rev:,.2f}")
+            c2.metric("Veg Revenue", f"₹{veg_rev:,.2f}")
+            c3.metric("Non-Veg Revenue", f"₹{nonveg_rev:,.2f}")
+            c4.metric("Inedible Revenue", f"₹{inedible_rev:,.2f}")
+
+        st.markdown("---")
+
+        # ---------- Scatter: Transaction # vs Bill Amount (dotted avg line) ----------
+        st.write("### 📈 Customer Bill Scatter (Transaction # vs Bill Amount)")
+
+        if not has_sales:
+            st.info("Not enough sales to plot bills.")
+        else:
+            # Precomputed bill rows, already in chronological order
+            bills = load_bills().rename(columns={"Total": "Total Sale Amount"})
+            bills["Transaction_Num"] = bills.index + 1
+
+            avg_bill = bills["Total Sale Amount"].mean()
+
+            st.write(f"**Average Bill Amount → ₹{avg_bill:,.2f}**")
+
+            scatter = alt.Chart(bills).mark_circle(size=70, color="#4EA8DE").encode(
+                x=alt.X("Transaction_Num:Q", title="Transaction #"),
+                y=alt.Y("Total Sale Amount:Q", title="Bill Amount (₹)"),
+                tooltip=[
+                    alt.Tooltip("Transaction_Num:Q", title="Txn #"),
+                    alt.Tooltip("Bill ID:O", title="Bill"),
+                    alt.Tooltip("Line Count:Q", title="Lines"),
+                    alt.Tooltip("Customer ID:O", title="Customer"),
+                    alt.Tooltip("Date of Sale:T", title="Date"),
+                    alt.Tooltip("Total Sale Amount:Q", title="Bill (₹)", format=",.2f"),
+                ]
+            ).properties(height=320, width="container")
+
+            avg_line = alt.Chart(pd.DataFrame({"y": [avg_bill]})).mark_rule(strokeDash=[6,6], color="red").encode(
+                y="y:Q"
+            )
+
+            st.altair_chart((scatter + avg_line).interactive(), use_container_width=True)
+
+        st.markdown("---")
+
+        # ---------- Daily revenue line chart (date-wise, no time) ----------
+        st.write("### 📉 Total Sales by Date (Date-wise)")
+
+        if not has_sales:
+            st.info("No sales to visualize.")
+        else:
+            daily = daily_revenue().rename(columns={"Revenue": "Total Sale Amount"})
+
+            line = alt.Chart(daily).mark_line(point=True, color="#9B5DE5").encode(
+                x=alt.X("Date:T", title="Date", axis=alt.Axis(format="%Y-%m-%d", labelAngle=-45)),
+                y=alt.Y("Total Sale Amount:Q", title="Revenue (₹)")
+            ).properties(height=320, width="container")
+
+            st.altair_chart(line.interactive(), use_container_width=True)
+
+        st.markdown("---")
+
+        # ---------- Sketch-backed metrics ----------
+        st.write("### ⚡ Approximate Metrics (Day Sketches)")
+
+        sk_first, sk_last = sketch_bounds()
+        if sk_first is None:
+            st.info("No sales sketched yet.")
+        else:
+            sk_period = st.date_input("Sketch period:", value=(sk_first, sk_last), key="sketch_period")
+            if isinstance(sk_period, (tuple, list)) and len(sk_period) == 2:
+                sk_start, sk_end = sk_period
+            else:
+                sk_start, sk_end = sk_first, sk_last
+            stats = sketch_stats(sk_start, sk_end)
+            st.caption(
+                f"Merged from {stats['days']} day sketch(es) — distinct customers ±{stats['distinct_error']:.1%} "
+                f"(1σ), bill percentiles within ±{stats['quantile_error']:.0%}; top lists may undercount "
+                f"by at most the Max_Undercount shown."
+            )
+
+            q = stats["bill_quantiles"]
+            c1, c2, c3, c4, c5 = st.columns(5)
+            c1.metric("Distinct Customers", f"≈{stats['distinct_customers']:,}")
+            c2.metric("Bills", f"{stats['bills']:,}")
+            for col, (label, key) in zip((c3, c4, c5), (("Median Bill", 0.5), ("p90 Bill", 0.9), ("p99 Bill", 0.99))):
+                col.metric(label, "–" if q[key] is None else f"≈₹{q[key]:,.0f}")
+
+            names = product_index()["Product Name"].astype(str)
+            top_products = stats["top_products"].copy()
+            top_products.insert(1, "Product Name", top_products["Product ID"].map(names).to_numpy())
+            c1, c2 = st.columns(2)
+            with c1:
+                st.write("**Top Products (units)**")
+                st.dataframe(top_products, use_container_width=True, hide_index=True)
+            with c2:
+                st.write("**Top Customers (spend)**")
+                st.dataframe(stats["top_customers"], use_container_width=True, hide_index=True)
+
+        st.markdown("---")
+
+        # ---------- Customer segments (RFM) ----------
+        st.write("### 👥 Customer Segments (RFM)")
+
+        cust_stats = load_customer_stats()
+        if cust_stats.empty:
+            st.info("No identified customers yet.")
+        else:
+            seg_counts = cust_stats["Segment"].value_counts().reindex(SEGMENTS, fill_value=0)
+            cols = st.columns(len(SEGMENTS))
+            for col, seg in zip(cols, SEGMENTS):
+                col.metric(seg, int(seg_counts[seg]))
+
+            sel_seg = st.selectbox("Show segment:", SEGMENTS, key="rfm_segment")
+            st.dataframe(customers_in_segment(sel_seg), use_container_width=True)
+
+        st.markdown("---")
+
+        # ---------- Products not sold for N days ----------
+        st.write("### 🕒 Products Not Sold for N Days")
+        days = st.number_input("Enter days:", min_value=1, value=5, key="unsold_days_stats")
+        unsold = unsold_products(int(days), prod_df)
+        if unsold.empty:
+            st.info(f"No products unsold for ≥ {days} days.")
+        else:
+            st.dataframe(unsold, use_container_width=True)
+
+        st.markdown("---")
+
+        # ---------- Retention ----------
+        with st.expander("🗄 Sales history retention"):
+            st.caption(
+                "Lines older than the window are rolled up into daily per-product totals; "
+                "all totals, revenue and charts above still include them."
+            )
+            keep_days = st.number_input(
+                "Keep line-level detail for (days):",
+                min_value=MIN_RETENTION_DAYS, value=SALES_RETENTION_DAYS, key="retention_days",
+            )
+            if st.button("Archive older sales", key="retention_apply"):
+                result = apply_sales_retention(int(keep_days))
+                st.success(f"Archived {result['archived']} line(s); {result['kept']} recent line(s) kept.")
+
+    # ----------------------
+    # TAB 2 — VIEW TRANSACTIONS
+    # ----------------------
+    with tab2:
+        st.subheader("📒 View Transactions")
+
+        if not has_sales:
+            st.info("No transactions recorded.")
+        else:
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                f_pid = st.text_input("Filter by Product ID:")
+            with col2:
+                f_cust = st.text_input("Filter by Customer ID:")
+            with col3:
+                f_date = st.date_input("Filter by Date:")
+
+            # filters run inside the query (only matching lines are loaded)
+            filtered = filter_transactions(
+                product_id=int(f_pid) if f_pid.strip().isdigit() else None,
+                customer_id=int(f_cust) if f_cust.strip().isdigit() else None,
+                on_date=f_date or None,
+            )
+
+            if f_cust.strip().isdigit():
+                cust = get_customer(int(f_cust))
+                if cust is None:
+                    st.warning(f"Customer {f_cust} has no recorded purchases.")
+                else:
+                    m1, m2, m3, m4, m5 = st.columns(5)
+                    m1.metric("Visits", int(cust["Visits"]))
+                    m2.metric("Total Spend", f"₹{cust['Total_Spend']:,.2f}")
+                    m3.metric("Avg Bill", f"₹{cust['Avg_Bill']:,.2f}")
+                    m4.metric("Last Visit", cust["Last_Visit"].strftime("%Y-%m-%d"))
+                    m5.metric("Segment", f"{cust['Segment']} ({cust['RFM']})")
+
+            st.write("### Filtered Transactions")
+            st.dataframe(filtered, use_container_width=True)
+
+            # total revenue for displayed results
+            total_filtered_revenue = pd.to_numeric(filtered.get("Total Sale Amount", pd.Series([0.0])), errors="coerce").fillna(0.0).sum()
+            st.success(f"Total Revenue for Displayed Transactions: ₹{total_filtered_revenue:,.2f}")
+
+    # ----------------------
+    # TAB 3 — ADD TRANSACTION
+    # ----------------------
+    with tab3:
+        st.subheader("➕ Add New Transaction")
+
+        # keyed product index: labels are pre-built, lookups are by Product ID
+        pids, labels = product_choices("Stock_Label")
+        sel_pid = st.selectbox(
+            "Select Product:", [None] + pids, key="addtx_select",
+            format_func=lambda p: "-- Select --" if p is None else labels[p],
+        )
+
+        sel_row = None
+        if sel_pid is not None:
+            sel_row = get_product(sel_pid)
+            st.success(f"{sel_row['Product Name']}  | Available: {int(sel_row['Total Quantity'])}")
+            prices = product_prices(sel_pid)
+            eff_price = prices["Effective Price"]
+            if eff_price is not None and eff_price < prices["Unit Price"]:
+                st.info(f"Discounted price today: ₹{eff_price:,.2f} (regular ₹{prices['Unit Price']:,.2f})")
+            if prices["Last Sold Price"] is not None:
+                st.caption(f"Last sold at ₹{prices['Last Sold Price']:,.2f}")
+
+        cust_id = st.text_input("Customer ID (optional):", key="addtx_cust")
+        cust_val = int(cust_id) if cust_id.strip().isdigit() else None
+
+        qty = st.number_input("Quantity Sold:", min_value=1, value=1, key="addtx_qty")
+        unit_price = st.number_input("Unit Price (0 = auto):", min_value=0.0, value=0.0, key="addtx_price")
+        sale_date = st.date_input("Date of Sale:", value=date.today(), key="addtx_date")
+
+        # Lines are added to the open bill of this customer and sale date until a new
+        # bill is started; walk-in (anonymous) sales never stay open
+        open_bill = st.session_state.get("open_bill")
+        if open_bill is not None and (open_bill["customer"], open_bill["date"]) != (cust_val, sale_date):
+            open_bill = None
+        if open_bill is not None:
+            st.caption(f"Adding to open Bill #{open_bill['bill_id']}")
+            if st.button("🧾 Start New Bill", key="addtx_new_bill"):
+                st.session_state.open_bill = None
+                open_bill = None
+
+        if st.button("💾 Create Transaction", key="addtx_create"):
+            if sel_pid is None:
+                st.error("Please select a product.")
+            else:
+                # stock is checked and taken in one locked step: another session or
+                # the POS service may have sold since this page was drawn
+                tx = None
+                with products_lock():
+                    current = get_product(sel_pid)
+                    available = int(current["Total Quantity"]) if current is not None else 0
+                    if qty <= available:
+                        # 0 = auto: add_transaction resolves the effective (discounted) price
+                        price_arg = float(unit_price) if unit_price > 0.0 else None
+
+                        tx = add_transaction(
+                            customer_id=cust_val,
+                            product_id=sel_pid,
+                            product_name=current["Product Name"],
+                            date_of_sale=sale_date,
+                            quantity_sold=int(qty),
+                            unit_price=price_arg,
+                            bill_id=open_bill["bill_id"] if open_bill is not None else None,
+                        )
+                        # update product inventory on disk
+                        decrement_stock({sel_pid: int(qty)})
+
+                if tx is None:
+                    st.error(f"Not enough stock. Available: {available}")
+                else:
+                    st.session_state.open_bill = (
+                        {"bill_id": tx["Bill ID"], "customer": cust_val, "date": sale_date}
+                        if cust_val is not None else None
+                    )
+                    refresh_alerts([sel_pid])
+
+                    st.success("Transaction created and inventory updated.")
+                    st.json(tx)
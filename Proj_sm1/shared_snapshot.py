@@ -0,0 +1,205 @@
+# shared_snapshot.py
+"""
+Cross-process snapshots of the typed product and sales frames.
+
+The first process to load a data version publishes the parsed frame as one
+.npy file per column under SNAPSHOT_DIR; every other process (Streamlit
+sessions in separate workers, pos_api instances) memory-maps those files
+copy-on-write instead of parsing the CSV again. The pages are shared through
+the OS page cache, so adding workers does not add a copy of the data.
+
+Enabled by setting SHELPIFY_SNAPSHOT_DIR; without it loaders parse as before.
+"""
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_DIR = os.environ.get("SHELPIFY_SNAPSHOT_DIR")
+SNAPSHOT_KEEP = 2   # published versions kept per frame (older ones are removed)
+
+_META = "meta.json"
+
+# (name, version) -> frame attached in this process
+_ATTACHED = {}
+
+
+def snapshots_enabled() -> bool:
+    return bool(SNAPSHOT_DIR)
+
+
+def _stamp(version) -> str:
+    if isinstance(version, tuple):
+        return "-".join(_stamp(v) for v in version)
+    return "none" if version is None else str(version)
+
+
+def _version_dir(name: str, version) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{name}-{_stamp(version)}")
+
+
+# ---------------------------
+# Column Encoding
+# ---------------------------
+# Each column becomes plain arrays + a small JSON description:
+#   numpy numeric/bool -> values
+#   masked (Int32 etc.) -> values + mask
+#   category           -> integer codes (+ categories in meta)
+#   datetime64         -> int64 view
+def _encode(col: pd.Series):
+    dtype = col.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        cats = dtype.categories
+        return {
+            "kind": "category",
+            "categories": cats.tolist(),
+            "categories_dtype": str(cats.dtype),
+        }, {"codes": col.cat.codes.to_numpy()}
+    if pd.api.types.is_datetime64_dtype(dtype):
+        return {"kind": "datetime", "dtype": str(dtype)}, {"values": col.to_numpy().view("int64")}
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype) and hasattr(col.array, "_mask"):
+        return {"kind": "masked", "dtype": str(dtype)}, {
+            "values": col.array._data,
+            "mask": col.array._mask,
+        }
+    if isinstance(dtype, np.dtype) and dtype.kind in "biuf":
+        return {"kind": "numpy"}, {"values": col.to_numpy()}
+    return None, None   # object / string / tz-aware columns are not shareable
+
+
+def _decode(spec: dict, arrays: dict) -> pd.api.extensions.ExtensionArray | np.ndarray:
+    kind = spec["kind"]
+    if kind == "category":
+        cats = pd.Index(spec["categories"], dtype=spec["categories_dtype"])
+        return pd.Categorical.from_codes(arrays["codes"], dtype=pd.CategoricalDtype(cats), validate=False)
+    if kind == "datetime":
+        return arrays["values"].view(spec["dtype"])
+    if kind == "masked":
+        dtype = pd.api.types.pandas_dtype(spec["dtype"])
+        return dtype.construct_array_type()(arrays["values"], arrays["mask"])
+    return arrays["values"]
+
+
+# ---------------------------
+# Publish / Attach
+# ---------------------------
+def publish(name: str, version, df: pd.DataFrame) -> bool:
+    """
+    Writes `df` as the snapshot of (name, version). The files go to a temp
+    directory that is renamed into place, so readers never see a partial
+    snapshot; if another process published first, its copy is kept.
+    """
+    if not snapshots_enabled() or version is None or df.empty:
+        return False
+    target = _version_dir(name, version)
+    if os.path.isdir(target):
+        return True
+
+    columns = []
+    encoded = []
+    for i, col in enumerate(df.columns):
+        spec, arrays = _encode(df[col])
+        if spec is None:
+            return False
+        columns.append({"name": col, **spec})
+        encoded.append((i, arrays))
+    # a RangeIndex is stored as its bounds, anything else as an integer array
+    if isinstance(df.index, pd.RangeIndex):
+        index, bounds = None, [df.index.start, df.index.stop, df.index.step]
+    else:
+        index, bounds = df.index.to_numpy(), None
+        if index.dtype.kind not in "iu":
+            return False
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=f".{name}-", dir=SNAPSHOT_DIR)
+    try:
+        if index is not None:
+            np.save(os.path.join(tmp, "index.npy"), index)
+        for i, arrays in encoded:
+            for part, values in arrays.items():
+                np.save(os.path.join(tmp, f"{i}.{part}.npy"), np.ascontiguousarray(values))
+        with open(os.path.join(tmp, _META), "w") as f:
+            json.dump({"columns": columns, "rows": len(df), "range_index": bounds}, f)
+        os.rename(tmp, target)
+    except OSError:
+        # lost the race (target exists) or the disk is full - either way the
+        # caller already has its parsed frame
+        shutil.rmtree(tmp, ignore_errors=True)
+        return os.path.isdir(target)
+    _prune(name, keep=target)
+    return True
+
+
+def _prune(name: str, keep: str) -> None:
+    """Removes all but the newest SNAPSHOT_KEEP versions. Processes that still
+    have an old version mapped keep reading it until they re-attach."""
+    dirs = [
+        os.path.join(SNAPSHOT_DIR, d) for d in os.listdir(SNAPSHOT_DIR)
+        if d.startswith(f"{name}-")
+    ]
+    dirs.sort(key=lambda d: os.stat(d).st_mtime_ns if os.path.exists(d) else 0, reverse=True)
+    for d in dirs[SNAPSHOT_KEEP:]:
+        if d != keep:
+            shutil.rmtree(d, ignore_errors=True)
+
+
+def attach(name: str, version) -> pd.DataFrame | None:
+    """
+    The published frame of (name, version), memory-mapped copy-on-write:
+    reads share the page cache with every other process, writes to the
+    frame stay private to this process. None if nothing is published.
+    """
+    if not snapshots_enabled() or version is None:
+        return None
+    key = (name, version)
+    df = _ATTACHED.get(key)
+    if df is None:
+        df = _map(_version_dir(name, version))
+        if df is None:
+            return None
+        for stale in [k for k in _ATTACHED if k[0] == name]:
+            del _ATTACHED[stale]
+        _ATTACHED[key] = df
+    # callers edit and save what they load; copy-on-write keeps the mapped frame intact
+    return df.copy(deep=False)
+
+
+def _load(path: str) -> np.ndarray:
+    # a plain ndarray view of the mapping: same pages, no np.memmap subclass in pandas
+    return np.load(path, mmap_mode="c").view(np.ndarray)
+
+
+def _map(path: str) -> pd.DataFrame | None:
+    try:
+        with open(os.path.join(path, _META)) as f:
+            meta = json.load(f)
+        bounds = meta["range_index"]
+        index = pd.RangeIndex(*bounds) if bounds else _load(os.path.join(path, "index.npy"))
+        data = {}
+        for i, spec in enumerate(meta["columns"]):
+            parts = ["codes"] if spec["kind"] == "category" else ["values", "mask"] if spec["kind"] == "masked" else ["values"]
+            arrays = {p: _load(os.path.join(path, f"{i}.{p}.npy")) for p in parts}
+            data[spec["name"]] = pd.Series(_decode(spec, arrays), index=index, copy=False)
+    except (OSError, ValueError, KeyError):
+        # pruned while we were attaching: fall back to parsing
+        return None
+    return pd.DataFrame(data, copy=False)
+
+
+def load_shared(name: str, version, parse) -> pd.DataFrame:
+    """
+    Attach the snapshot of (name, version) or, on a miss, run `parse()`
+    and publish its result for the other processes.
+    """
+    df = attach(name, version)
+    if df is not None:
+        return df
+    df = parse()
+    if publish(name, version, df):
+        shared = attach(name, version)
+        if shared is not None:
+            return shared
+    return df
@@ -0,0 +1,377 @@
+# sketch_model.py
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+
+from store_utils import file_version, parse_dates, store_lock
+from bill_model import load_bills
+
+# One small, mergeable summary per sale day, kept next to the sales log as
+# Sales_sketches/<YYYY-MM-DD>.npz. Appends only rewrite their own day; a
+# date range is answered by merging its days, never by scanning the log.
+SKETCH_DIR = "Sales_sketches"
+
+# HyperLogLog: 2**12 registers -> ~1.6% standard error on distinct customers
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+# Log-bucketed bill amounts (DDSketch style): any quantile is within
+# QUANTILE_ACCURACY relative error for amounts in [QUANTILE_MIN, QUANTILE_MAX]
+QUANTILE_ACCURACY = 0.01
+QUANTILE_MIN = 1.0
+QUANTILE_MAX = 1e8
+_GAMMA = (1 + QUANTILE_ACCURACY) / (1 - QUANTILE_ACCURACY)
+QUANTILE_BUCKETS = int(np.ceil(np.log(QUANTILE_MAX / QUANTILE_MIN) / np.log(_GAMMA))) + 2
+
+# Misra-Gries heavy hitters: counters kept per day for products (units sold)
+# and customers (spend)
+HEAVY_HITTERS = 512
+
+_NAT = np.iinfo(np.int64).min   # day number of a missing date
+
+
+# ---------------------------
+# Sketch Primitives
+# ---------------------------
+def _hash64(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer: well-mixed 64-bit hashes of integer IDs."""
+    z = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _hll_add(registers: np.ndarray, ids: np.ndarray) -> None:
+    if len(ids) == 0:
+        return
+    h = _hash64(ids)
+    bucket = (h >> np.uint64(64 - HLL_PRECISION)).astype(np.int64)
+    rest = h & np.uint64((1 << (64 - HLL_PRECISION)) - 1)
+    # rank = position of the first 1-bit in the remaining 52 bits (frexp gives
+    # the exact bit length: the values fit a float64 mantissa)
+    bit_length = np.frexp(rest.astype(np.float64))[1]
+    rank = (64 - HLL_PRECISION + 1 - bit_length).astype(np.uint8)
+    np.maximum.at(registers, bucket, rank)
+
+
+def hll_estimate(registers: np.ndarray) -> float:
+    m = HLL_REGISTERS
+    raw = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int((registers == 0).sum())
+    if raw <= 2.5 * m and zeros:
+        return m * np.log(m / zeros)   # linear counting for small cardinalities
+    return float(raw)
+
+
+def _bucket_of(amounts: np.ndarray) -> np.ndarray:
+    x = np.maximum(amounts, QUANTILE_MIN)
+    k = np.ceil(np.log(x / QUANTILE_MIN) / np.log(_GAMMA)).astype(np.int64)
+    return np.clip(k, 0, QUANTILE_BUCKETS - 1)
+
+
+def _bucket_value(k: np.ndarray) -> np.ndarray:
+    # midpoint (in relative terms) of (gamma**(k-1), gamma**k]
+    return QUANTILE_MIN * 2 * _GAMMA ** k / (_GAMMA + 1)
+
+
+def quantiles(hist: np.ndarray, qs) -> dict:
+    n = hist.sum()
+    if n == 0:
+        return {q: None for q in qs}
+    cum = np.cumsum(hist)
+    return {q: float(_bucket_value(np.searchsorted(cum, q * (n - 1), side="right"))) for q in qs}
+
+
+def _mg_merge(keys: np.ndarray, counts: np.ndarray, k: int = HEAVY_HITTERS) -> tuple:
+    """
+    Mergeable Misra-Gries: sums counters per key, then subtracts the
+    (k+1)-th largest count and drops what is left non-positive. Every kept
+    count undercounts by at most (total weight - counted weight) / (k + 1).
+    """
+    if len(keys) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    summed = pd.Series(counts).groupby(keys).sum()
+    if len(summed) > k:
+        cut = np.partition(summed.to_numpy(), -(k + 1))[-(k + 1)]
+        summed = summed - cut
+        summed = summed[summed > 0]
+    return summed.index.to_numpy(dtype=np.int64), summed.to_numpy(dtype=float)
+
+
+# ---------------------------
+# Day Partitions
+# ---------------------------
+def _empty_day() -> dict:
+    return {
+        "lines": 0,
+        "hll": np.zeros(HLL_REGISTERS, dtype=np.uint8),
+        "bills": np.zeros(QUANTILE_BUCKETS, dtype=np.int64),
+        "prod_keys": np.empty(0, dtype=np.int64), "prod_counts": np.empty(0), "prod_total": 0.0,
+        "cust_keys": np.empty(0, dtype=np.int64), "cust_counts": np.empty(0), "cust_total": 0.0,
+    }
+
+
+def _day_path(day: int, directory: str = SKETCH_DIR) -> str:
+    return os.path.join(directory, f"{np.datetime64(day, 'D')}.npz")
+
+
+def _read_day(path: str) -> dict:
+    with np.load(path) as f:
+        day = {k: f[k] for k in f.files}
+    for k in ("lines", "prod_total", "cust_total"):
+        day[k] = day[k].item()
+    return day
+
+
+def _save_day(day_number: int, day: dict, directory: str = SKETCH_DIR) -> None:
+    os.makedirs(directory, exist_ok=True)
+    path = _day_path(day_number, directory)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+    np.savez(tmp, **day)
+    os.replace(tmp, path)
+
+
+def _add_lines(day: dict, customers: np.ndarray, spend: np.ndarray, pids: np.ndarray, units: np.ndarray) -> None:
+    day["lines"] += len(pids)
+    known = customers >= 0
+    _hll_add(day["hll"], customers[known])
+    day["prod_keys"], day["prod_counts"] = _mg_merge(
+        np.concatenate([day["prod_keys"], pids]), np.concatenate([day["prod_counts"], units])
+    )
+    day["prod_total"] += float(units.sum())
+    day["cust_keys"], day["cust_counts"] = _mg_merge(
+        np.concatenate([day["cust_keys"], customers[known]]), np.concatenate([day["cust_counts"], spend[known]])
+    )
+    day["cust_total"] += float(spend[known].sum())
+
+
+def _line_arrays(sales: pd.DataFrame) -> tuple:
+    days = parse_dates(sales["Date of Sale"]).to_numpy().astype("datetime64[D]").astype(np.int64)
+    customers = pd.to_numeric(sales["Customer ID"], errors="coerce").fillna(-1).to_numpy(dtype=np.int64)
+    spend = pd.to_numeric(sales["Total Sale Amount"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    pids = pd.to_numeric(sales["Product ID"], errors="coerce").fillna(-1).to_numpy(dtype=np.int64)
+    units = pd.to_numeric(sales["Quantity Sold"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    return days, customers, spend, pids, units
+
+
+# ---------------------------
+# Build / Incremental Maintenance
+# ---------------------------
+def rebuild_sketches() -> None:
+    """
+    Rebuilds every day's sketches from the sales log and the bills (one-off
+    backfill). Archived days keep product heavy hitters from their rollups.
+    """
+    with store_lock(SKETCH_DIR):
+        _rebuild_sketches()
+
+
+def _rebuild_sketches() -> None:
+    # imported lazily: sales_model updates the sketches on every transaction
+    from sales_model import iter_sales_chunks, load_sales_archive
+
+    days = {}
+    archive = load_sales_archive()
+    if not archive.empty:
+        a_days = archive["Date"].to_numpy().astype("datetime64[D]").astype(np.int64)
+        for d in np.unique(a_days):
+            sel = a_days == d
+            day = days.setdefault(int(d), _empty_day())
+            day["lines"] += int(archive["Lines"].to_numpy()[sel].sum())
+            day["prod_keys"], day["prod_counts"] = _mg_merge(
+                archive["Product ID"].astype("int64").to_numpy()[sel], archive["Units"].to_numpy(dtype=float)[sel]
+            )
+            day["prod_total"] += float(archive["Units"].to_numpy()[sel].sum())
+
+    for chunk in iter_sales_chunks():
+        if chunk.empty:
+            continue
+        c_days, customers, spend, pids, units = _line_arrays(chunk)
+        for d in np.unique(c_days[c_days != _NAT]):
+            sel = c_days == d
+            _add_lines(days.setdefault(int(d), _empty_day()), customers[sel], spend[sel], pids[sel], units[sel])
+
+    bills = load_bills()
+    if not bills.empty:
+        b_days = bills["Date of Sale"].to_numpy().astype("datetime64[D]").astype(np.int64)
+        buckets = _bucket_of(bills["Total"].to_numpy(dtype=float))
+        for d in np.unique(b_days[b_days != _NAT]):
+            sel = b_days == d
+            np.add.at(days.setdefault(int(d), _empty_day())["bills"], buckets[sel], 1)
+
+    # written aside and swapped in, so readers never list a half-built directory
+    tmp = tempfile.mkdtemp(prefix=".sketches-", dir=os.path.dirname(SKETCH_DIR) or ".")
+    for d, day in days.items():
+        _save_day(d, day, tmp)
+    if os.path.isdir(SKETCH_DIR):
+        shutil.rmtree(SKETCH_DIR)
+    os.rename(tmp, SKETCH_DIR)
+    _SKETCH_CACHE.clear()
+
+
+def _ensure_sketches() -> bool:
+    """
+    Builds the sketches on first use (once, however many sessions or
+    processes ask). True if it did.
+    """
+    if os.path.isdir(SKETCH_DIR):
+        return False
+    # a file lock: the directory swap must not race the other process's updates
+    with store_lock(SKETCH_DIR):
+        if os.path.isdir(SKETCH_DIR):
+            return False
+        _rebuild_sketches()
+        return True
+
+
+def update_sketches(new_rows: list[dict]) -> None:
+    """
+    Folds newly recorded sales lines into their days' sketches. Runs after
+    record_bill_lines: a line added to an earlier bill moves that bill's
+    amount from its old total's bucket to the new total's.
+    """
+    if not new_rows:
+        return
+    with store_lock(SKETCH_DIR):
+        _update_sketches(new_rows)
+
+
+def _update_sketches(new_rows: list[dict]) -> None:
+    if _ensure_sketches():
+        return   # the log and bills already contain new_rows
+    state = _state()
+    new = pd.DataFrame(new_rows)
+    l_days, customers, spend, pids, units = _line_arrays(new)
+    touched = set()
+    for d in np.unique(l_days[l_days != _NAT]):
+        sel = l_days == d
+        _add_lines(state.setdefault(int(d), _empty_day()), customers[sel], spend[sel], pids[sel], units[sel])
+        touched.add(int(d))
+
+    # bill amounts: the bill rows already include this batch
+    batch = pd.DataFrame({"Bill ID": new["Bill ID"].astype("int64").to_numpy(), "Day": l_days, "Amount": spend})
+    batch = batch.groupby("Bill ID").agg(Day=("Day", "min"), Lines=("Amount", "size"), Amount=("Amount", "sum"))
+    bills = load_bills()
+    bills = bills[bills["Bill ID"].isin(batch.index).fillna(False).to_numpy()]
+    cur = bills.drop_duplicates("Bill ID", keep="last").set_index(bills["Bill ID"].astype("int64").rename(None))
+    cur = cur.reindex(batch.index)
+    b_days = cur["Date of Sale"].to_numpy().astype("datetime64[D]")
+    b_days = np.where(np.isnat(b_days), batch["Day"].to_numpy(), b_days.astype(np.int64))
+    total = cur["Total"].fillna(batch["Amount"]).to_numpy(dtype=float)
+    earlier = (cur["Line Count"].fillna(batch["Lines"]) - batch["Lines"]).to_numpy() > 0
+
+    old_buckets = _bucket_of(total - batch["Amount"].to_numpy())
+    new_buckets = _bucket_of(total)
+    for d, was, k, old_k in zip(b_days, earlier, new_buckets, old_buckets):
+        if d == _NAT:
+            continue
+        hist = state.setdefault(int(d), _empty_day())["bills"]
+        if was:
+            hist[old_k] = max(hist[old_k] - 1, 0)
+        hist[k] += 1
+        touched.add(int(d))
+
+    for d in touched:
+        _save_day(d, state[d])
+    _rekey(state)
+
+
+# ---------------------------
+# In-Memory Days
+# ---------------------------
+# sketch-directory version -> {day number: sketches}
+_SKETCH_CACHE = {}
+# (sketch-directory version, start, end, top) -> stats dict
+_STATS_CACHE = {}
+
+
+def _state() -> dict:
+    version = file_version(SKETCH_DIR)
+    cached = _SKETCH_CACHE.get(version)
+    if cached is not None:
+        return cached
+    state = {}
+    if os.path.isdir(SKETCH_DIR):
+        for name in os.listdir(SKETCH_DIR):
+            if name.endswith(".npz") and ".tmp" not in name:
+                day = int(np.datetime64(name[:-4], "D").astype(np.int64))
+                state[day] = _read_day(os.path.join(SKETCH_DIR, name))
+    _SKETCH_CACHE.clear()
+    _SKETCH_CACHE[version] = state
+    return state
+
+
+def _rekey(state: dict) -> None:
+    """After our own writes the patched days stay valid under the new directory version."""
+    _SKETCH_CACHE.clear()
+    _SKETCH_CACHE[file_version(SKETCH_DIR)] = state
+
+
+# ---------------------------
+# Queries
+# ---------------------------
+def sketch_bounds():
+    """(first day, last day) covered by the sketches, or (None, None)."""
+    _ensure_sketches()
+    state = _state()
+    if not state:
+        return None, None
+    return (pd.Timestamp(np.datetime64(min(state), "D")).date(),
+            pd.Timestamp(np.datetime64(max(state), "D")).date())
+
+
+def sketch_stats(start=None, end=None, top: int = 10) -> dict:
+    """
+    Approximate metrics for sale days in [start, end], merged from the
+    day sketches (cost depends on the number of days, not of sales lines):
+    distinct customers (HLL, ~1.6% std error), bill-amount quantiles
+    (within 1% relative error), and top products by units / customers by
+    spend (Misra-Gries, with each count's maximum undercount).
+    """
+    _ensure_sketches()
+    state = _state()
+    key = (file_version(SKETCH_DIR), start, end, top)
+    cached = _STATS_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    lo = -np.inf if start is None else int(np.datetime64(pd.Timestamp(start).date(), "D").astype(np.int64))
+    hi = np.inf if end is None else int(np.datetime64(pd.Timestamp(end).date(), "D").astype(np.int64))
+    days = [state[d] for d in state if lo <= d <= hi]
+
+    hll = np.zeros(HLL_REGISTERS, dtype=np.uint8)
+    hist = np.zeros(QUANTILE_BUCKETS, dtype=np.int64)
+    for day in days:
+        np.maximum(hll, day["hll"], out=hll)
+        hist += day["bills"]
+
+    def heavy(prefix, id_col, value_col):
+        if not days:
+            return pd.DataFrame(columns=[id_col, value_col, "Max_Undercount"])
+        keys, counts = _mg_merge(
+            np.concatenate([d[f"{prefix}_keys"] for d in days]),
+            np.concatenate([d[f"{prefix}_counts"] for d in days]),
+        )
+        total = sum(d[f"{prefix}_total"] for d in days)
+        slack = max(total - counts.sum(), 0.0) / (HEAVY_HITTERS + 1)
+        order = np.argsort(-counts)[:top]
+        return pd.DataFrame({id_col: keys[order], value_col: counts[order], "Max_Undercount": slack})
+
+    bill_qs = quantiles(hist, [0.5, 0.9, 0.95, 0.99])
+    stats = {
+        "days": len(days),
+        "lines": int(sum(d["lines"] for d in days)),
+        "bills": int(hist.sum()),
+        "distinct_customers": round(hll_estimate(hll)) if days else 0,
+        "distinct_error": 1.04 / np.sqrt(HLL_REGISTERS),
+        "bill_quantiles": bill_qs,
+        "quantile_error": QUANTILE_ACCURACY,
+        "top_products": heavy("prod", "Product ID", "Units"),
+        "top_customers": heavy("cust", "Customer ID", "Spend"),
+    }
+    _STATS_CACHE.clear()
+    _STATS_CACHE[key] = stats
+    return stats
@@ -0,0 +1,162 @@
+# stock_history.py
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from data_model import load_products, products_version
+from revenue_model import load_revenue_cube, REVENUE_CUBE_CSV
+from lot_model import load_lots, load_write_offs, LOTS_CSV, LOT_WRITE_OFFS_CSV
+from store_utils import file_version
+
+# stock of every product is materialized at the end of each block of this many days
+CHECKPOINT_DAYS = 30
+
+
+# ---------------------------
+# Building the History
+# ---------------------------
+# (products, cube, lots, write-offs version, today) -> history dict
+_HISTORY_CACHE = {}
+
+
+def _day(values) -> np.ndarray:
+    return pd.to_datetime(pd.Series(values)).to_numpy().astype("datetime64[D]")
+
+
+def _build_history(today: date) -> dict:
+    """
+    Net stock movements per (product, day): lot receipts in, sold units and
+    written-off expired lots out (sales from the hot log and archive, via
+    the revenue cube). Anchored on today's stock:
+    opening = current - all movements, so stock(D) = opening + movements up to D.
+    """
+    prod = load_products().dropna(subset=["Product ID"]).drop_duplicates("Product ID")
+    cube = load_revenue_cube()
+    lots = load_lots()
+    offs = load_write_offs()
+
+    ev_pid = np.concatenate([
+        lots["Product ID"].astype("int64").to_numpy(),
+        cube["Product ID"].astype("int64").to_numpy(),
+        offs["Product ID"].astype("int64").to_numpy(),
+    ])
+    ev_day = np.concatenate([_day(lots["Received_Date"]), _day(cube["Date"]), _day(offs["Date"])])
+    ev_delta = np.concatenate([
+        lots["Quantity_Received"].to_numpy(dtype=float),
+        -cube["Units"].to_numpy(dtype=float),
+        -offs["Quantity"].to_numpy(dtype=float),
+    ])
+    ok = ~np.isnat(ev_day)
+    ev_pid, ev_day, ev_delta = ev_pid[ok], ev_day[ok], ev_delta[ok]
+
+    today_day = np.datetime64(today, "D")
+    start = min(ev_day.min(), today_day) if len(ev_day) else today_day
+    n_days = int((today_day - start).astype(int)) + 1
+    # movements dated after today count as today
+    offset = np.minimum((ev_day - start).astype(np.int64), n_days - 1)
+
+    pids = np.union1d(prod["Product ID"].astype("int64").to_numpy(), ev_pid)
+    code = np.searchsorted(pids, ev_pid)
+    current = pd.Series(prod["Total Quantity"].fillna(0).to_numpy(dtype=float),
+                        index=prod["Product ID"].astype("int64").to_numpy())
+    current = current.reindex(pids).fillna(0.0).to_numpy()
+    opening = current - np.bincount(code, weights=ev_delta, minlength=len(pids))
+
+    # checkpoints: stock per product at the end of every CHECKPOINT_DAYS block
+    n_blocks = (n_days + CHECKPOINT_DAYS - 1) // CHECKPOINT_DAYS
+    block = offset // CHECKPOINT_DAYS
+    moves = np.zeros((len(pids), n_blocks))
+    np.add.at(moves, (code, block), ev_delta)
+    checkpoints = opening[:, None] + np.cumsum(moves, axis=1)
+
+    # movements sorted by (product, day) so one product's slice is a binary search
+    order = np.lexsort((offset, code))
+    store_daily = np.bincount(offset, weights=ev_delta, minlength=n_days)
+    return {
+        "start": start,
+        "days": n_days,
+        "pids": pids,
+        "opening": opening,
+        "checkpoints": checkpoints,
+        "ev_code": code[order],
+        "ev_offset": offset[order],
+        "ev_delta": ev_delta[order],
+        "store": opening.sum() + np.cumsum(store_daily),
+    }
+
+
+def _history() -> dict:
+    today = date.today()
+    key = (products_version(), file_version(REVENUE_CUBE_CSV), file_version(LOTS_CSV),
+           file_version(LOT_WRITE_OFFS_CSV), today)
+    cached = _HISTORY_CACHE.get(key)
+    if cached is not None:
+        return cached
+    hist = _build_history(today)
+    _HISTORY_CACHE.clear()
+    _HISTORY_CACHE[key] = hist
+    return hist
+
+
+def _offset(hist: dict, on_date) -> int:
+    return int((np.datetime64(pd.Timestamp(on_date).date(), "D") - hist["start"]).astype(int))
+
+
+# ---------------------------
+# Point-in-Time Queries
+# ---------------------------
+def stock_on(product_id, on_date) -> float:
+    """
+    Units of one product on hand at the end of `on_date`: the checkpoint
+    before that day plus at most one block of its movements.
+    """
+    hist = _history()
+    i = int(np.searchsorted(hist["pids"], int(product_id)))
+    if i >= len(hist["pids"]) or hist["pids"][i] != int(product_id):
+        return 0.0
+    d = _offset(hist, on_date)
+    if d < 0:
+        return float(hist["opening"][i])
+    d = min(d, hist["days"] - 1)
+
+    b = d // CHECKPOINT_DAYS
+    base = hist["checkpoints"][i, b - 1] if b > 0 else hist["opening"][i]
+    lo = np.searchsorted(hist["ev_code"], i, side="left")
+    hi = np.searchsorted(hist["ev_code"], i, side="right")
+    days = hist["ev_offset"][lo:hi]
+    sel = (days >= b * CHECKPOINT_DAYS) & (days <= d)
+    return float(base + hist["ev_delta"][lo:hi][sel].sum())
+
+
+def inventory_on(on_date) -> pd.DataFrame:
+    """Product ID -> Stock_On_Hand for every product at the end of `on_date`."""
+    hist = _history()
+    d = _offset(hist, on_date)
+    if d < 0:
+        stock = hist["opening"].copy()
+    else:
+        d = min(d, hist["days"] - 1)
+        b = d // CHECKPOINT_DAYS
+        stock = hist["checkpoints"][:, b - 1].copy() if b > 0 else hist["opening"].copy()
+        sel = (hist["ev_offset"] >= b * CHECKPOINT_DAYS) & (hist["ev_offset"] <= d)
+        stock += np.bincount(hist["ev_code"][sel], weights=hist["ev_delta"][sel], minlength=len(hist["pids"]))
+    return pd.DataFrame({"Product ID": hist["pids"], "Stock_On_Hand": stock})
+
+
+def stock_series(product_id=None) -> pd.DataFrame:
+    """
+    Daily end-of-day stock (Date, Stock) for one product, or for the whole
+    store when product_id is None - a chart data source.
+    """
+    hist = _history()
+    dates = pd.date_range(pd.Timestamp(hist["start"]), periods=hist["days"], freq="D")
+    if product_id is None:
+        return pd.DataFrame({"Date": dates, "Stock": hist["store"]})
+
+    i = int(np.searchsorted(hist["pids"], int(product_id)))
+    if i >= len(hist["pids"]) or hist["pids"][i] != int(product_id):
+        return pd.DataFrame({"Date": dates, "Stock": np.zeros(hist["days"])})
+    lo = np.searchsorted(hist["ev_code"], i, side="left")
+    hi = np.searchsorted(hist["ev_code"], i, side="right")
+    daily = np.bincount(hist["ev_offset"][lo:hi], weights=hist["ev_delta"][lo:hi], minlength=hist["days"])
+    return pd.DataFrame({"Date": dates, "Stock": hist["opening"][i] + np.cumsum(daily)})
@@ -0,0 +1,138 @@
+# store_utils.py
+import os
+import threading
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+    import msvcrt
+
+
+def file_version(path: str):
+    """
+    Returns a cheap version stamp (mtime_ns, size) for a CSV store,
+    or None if the file does not exist. Used as a cache key.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def write_csv(df: pd.DataFrame, path: str) -> None:
+    """
+    Rewrites a whole CSV store atomically (temp file + rename): sessions
+    reading it meanwhile see the old or the new file, never a truncated one.
+    """
+    tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+
+
+
+# ---------------------------
+# Cross-process Store Locks
+# ---------------------------
+def _lock_fd(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return
+    while True:
+        try:
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue   # LK_LOCK gives up after ~10 s; keep waiting
+
+
+def _unlock_fd(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class _StoreLock:
+    """
+    Exclusive lock on one store, held across every thread and process that
+    writes it (the app server and the POS service). Re-entrant within a
+    thread; the OS lock lives on a `<store>.lock` file next to the store.
+    """
+
+    def __init__(self, path: str):
+        self.path = f"{path}.lock"
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+                try:
+                    _lock_fd(fd)
+                except BaseException:
+                    os.close(fd)
+                    raise
+            except BaseException:
+                self._thread_lock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0:
+            fd, self._fd = self._fd, None
+            try:
+                _unlock_fd(fd)
+            finally:
+                os.close(fd)
+        self._thread_lock.release()
+
+
+_STORE_LOCKS = {}
+_STORE_LOCKS_GUARD = threading.Lock()
+
+
+def store_lock(path: str) -> _StoreLock:
+    """The shared lock guarding read-modify-write of the store at `path`."""
+    key = os.path.abspath(path)
+    with _STORE_LOCKS_GUARD:
+        lock = _STORE_LOCKS.get(key)
+        if lock is None:
+            lock = _STORE_LOCKS[key] = _StoreLock(key)
+        return lock
+
+
+# ---------------------------
+# Canonical Dates
+# ---------------------------
+# In memory every date is a normalized datetime64 column; on disk it is ISO.
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """
+    Fast explicit-format parse of a date column to normalized datetime64.
+    Already-typed columns are passed through; only rows that don't match
+    DATE_FORMAT (legacy writes) fall back to the slow flexible parser.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.dt.normalize()
+    parsed = pd.to_datetime(values, format=DATE_FORMAT, errors="coerce")
+    bad = parsed.isna() & values.notna()
+    if bad.any():
+        parsed[bad] = pd.to_datetime(values[bad], errors="coerce", format="mixed")
+    return parsed.dt.normalize()
+
+
+def format_dates(values: pd.Series) -> pd.Series:
+    """datetime64 (or parseable) column -> ISO date strings for writing."""
+    return parse_dates(values).dt.strftime(DATE_FORMAT)
@@ -0,0 +1,184 @@
+# store_watcher.py
+"""
+Background refresh of the in-memory caches when the CSV stores change.
+
+A supplier drop replacing the product file or a script appending to
+Sales_log.csv would otherwise be parsed and aggregated by the first page
+that asks. The watcher notices the change (inotify through watchdog when it
+is installed, stat polling otherwise) and rebuilds the typed frames, sales
+aggregates and classifications on its own thread, so pages find the new
+version already cached.
+"""
+import os
+import threading
+import time
+
+from data_model import CSV_FILE, TOMBSTONES_CSV, tombstoned_ids
+from sales_model import SALES_CSV, SALES_ARCHIVE_CSV, load_sales, stream_sales_aggregates, get_last_sold_prices
+from shared_snapshot import snapshots_enabled
+from store_utils import file_version
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:   # polling fallback
+    Observer = None
+    FileSystemEventHandler = object
+
+POLL_INTERVAL = 2.0     # seconds between stat checks without inotify
+SETTLE_DELAY = 0.25     # wait for a burst of writes to finish before rebuilding
+
+
+# ---------------------------
+# Warmers
+# ---------------------------
+def warm_products() -> None:
+    # imported lazily: the indexes and pages build on the models imported above
+    from product_index import product_choices
+    from analytics_page import classified_products
+    from alert_model import load_alerts
+
+    tombstoned_ids()
+    product_choices()        # also publishes the shared snapshot
+    classified_products()
+    load_alerts()
+
+
+def warm_sales() -> None:
+    from revenue_model import load_revenue_cube
+    from velocity_model import rolling_velocity
+
+    if snapshots_enabled():
+        load_sales()         # only cached (and worth parsing ahead) when shared
+    stream_sales_aggregates()
+    get_last_sold_prices()
+    load_revenue_cube()
+    rolling_velocity()
+
+
+# group -> (watched files, warmer)
+WATCH_GROUPS = {
+    "products": ([CSV_FILE, TOMBSTONES_CSV], warm_products),
+    "sales": ([SALES_CSV, SALES_ARCHIVE_CSV], warm_sales),
+}
+
+
+# ---------------------------
+# Watcher
+# ---------------------------
+class _StoreEvents(FileSystemEventHandler):
+    def __init__(self, watcher: "StoreWatcher"):
+        self._watcher = watcher
+
+    def on_any_event(self, event):
+        # an os.replace of a temp file shows up as a move onto the store
+        for path in (event.src_path, getattr(event, "dest_path", "")):
+            group = self._watcher.group_of(path)
+            if group is not None:
+                self._watcher.mark(group)
+
+
+class StoreWatcher:
+    def __init__(self, poll_interval: float = POLL_INTERVAL, use_inotify: bool = True):
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and Observer is not None
+        self.last_error = None      # (group, exception) of the last failed rebuild
+        self.refreshes = 0
+        self._files = {
+            os.path.basename(path): group
+            for group, (paths, _) in WATCH_GROUPS.items() for path in paths
+        }
+        self._versions = {}         # group -> file versions last warmed
+        self._dirty = set()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._threads = []
+        self._observer = None
+
+    # ----- lifecycle -----
+    def start(self):
+        self._dirty.update(WATCH_GROUPS)     # first warm-up also runs off the request path
+        self._spawn(self._run, "store-refresh")
+        if self.use_inotify:
+            self._observer = Observer()
+            self._observer.schedule(_StoreEvents(self), os.path.abspath(os.path.dirname(CSV_FILE) or "."))
+            self._observer.daemon = True
+            self._observer.start()
+        else:
+            self._spawn(self._poll, "store-poll")
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        for t in self._threads:
+            t.join()
+
+    def _spawn(self, target, name):
+        t = threading.Thread(target=target, name=name, daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    # ----- change detection -----
+    def group_of(self, path: str):
+        return self._files.get(os.path.basename(path or ""))
+
+    def mark(self, group: str) -> None:
+        with self._cond:
+            self._dirty.add(group)
+            self._cond.notify()
+
+    def _group_versions(self, group: str) -> tuple:
+        return tuple(file_version(p) for p in WATCH_GROUPS[group][0])
+
+    def _poll(self):
+        while not self._stopping:
+            for group in WATCH_GROUPS:
+                if self._group_versions(group) != self._versions.get(group):
+                    self.mark(group)
+            with self._cond:
+                self._cond.wait(self.poll_interval)
+
+    # ----- refresh -----
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._dirty and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+            time.sleep(SETTLE_DELAY)
+            with self._cond:
+                groups, self._dirty = self._dirty, set()
+            for group in groups:
+                self.refresh(group)
+
+    def refresh(self, group: str) -> None:
+        """Rebuilds one group's caches unless its files are unchanged since the last run."""
+        version = self._group_versions(group)
+        if version == self._versions.get(group):
+            return
+        try:
+            WATCH_GROUPS[group][1]()
+        except Exception as e:   # keep watching; the page path rebuilds on demand
+            self.last_error = (group, e)
+            return
+        self._versions[group] = version
+        self.refreshes += 1
+
+
+_WATCHER = None
+_WATCHER_LOCK = threading.Lock()
+
+
+def start_watcher(poll_interval: float = POLL_INTERVAL) -> StoreWatcher:
+    """Starts the process-wide watcher once; later calls return the running one."""
+    global _WATCHER
+    with _WATCHER_LOCK:
+        if _WATCHER is None:
+            _WATCHER = StoreWatcher(poll_interval)
+            _WATCHER.start()
+        return _WATCHER
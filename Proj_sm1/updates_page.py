@@ -1,59 +1,82 @@
-# updates_page.py (adjusted)
-import streamlit as st
-import pandas as pd
-from datetime import datetime
-from data_model import load_products
-from sales_model import apply_sales_to_inventory, products_not_sold_for_days, load_sales
-
-from analytics_page import get_near_expiry_window, classify_expiry
-
-def render_updates_page():
-    st.title("🔔 Updates")
-
-    prod_df = load_products().copy()
-    # apply historical sales to get current snapshot (does not save)
-    prod_snapshot = apply_sales_to_inventory(prod_df)
-
-    if prod_snapshot.empty:
-        st.warning("No products available.")
-        return
-
-    prod_snapshot["Expiry_Date"] = pd.to_datetime(prod_snapshot["Expiry_Date"]).dt.date
-
-    # compute expiry statuses
-    prod_snapshot["Expiry_Status"] = prod_snapshot.apply(
-        lambda r: classify_expiry(
-            r["Expiry_Date"],
-            get_near_expiry_window(r["Category"], r["Product Name"], r["Expiry_Days"])
-        ), axis=1
-    )
-
-    # Expired table
-    expired_df = prod_snapshot[prod_snapshot["Expiry_Status"] == "Expired"]
-    st.subheader(f"🟥 Expired Products ({len(expired_df)})")
-    if expired_df.empty:
-        st.info("No expired products.")
-    else:
-        st.dataframe(expired_df, use_container_width=True)
-
-    st.markdown("---")
-
-    # Near expiry table
-    near_df = prod_snapshot[prod_snapshot["Expiry_Status"] == "Near Expiry"]
-    st.subheader(f"🟧 Near-Expiry Products ({len(near_df)})")
-    if near_df.empty:
-        st.info("No near-expiry products.")
-    else:
-        st.dataframe(near_df, use_container_width=True)
-
-    st.markdown("---")
-
-    # Products not sold for N days
-    st.subheader("Products not sold for N days")
-    days = st.number_input("Show products not sold for at least (days)", min_value=1, value=5, key="updates_not_sold_days")
-    ns_df = products_not_sold_for_days(prod_df, int(days))
-    if ns_df.empty:
-        st.info("No products matched the filter.")
-    else:
-        st.write(f"Products not sold for >= {days} days (or never sold): {len(ns_df)}")
-        st.dataframe(ns_df, use_container_width=True)
+# updates_page.py (adjusted)
+import streamlit as st
+from data_model import load_products
+from sales_model import products_not_sold_for_days
+
+from analytics_page import near_expiry_windows, expiry_statuses
+from alert_model import load_alerts, set_reorder_point, ALERT_LEVELS
+from lot_model import open_lots, stock_drift
+
+def render_updates_page():
+    st.title("🔔 Updates")
+
+    prod_df = load_products()
+    if prod_df.empty:
+        st.warning("No products available.")
+        return
+
+    # expiry is tracked per lot: each open lot gets its own status
+    # (vectorized over datetime64 Expiry_Date, windows from the lot's shelf life)
+    lots = open_lots()
+    lots["Expiry_Status"] = expiry_statuses(lots["Expiry_Date"], near_expiry_windows(lots))
+
+    # Stock alerts (maintained per transaction - no scan of the inventory here)
+    alerts = load_alerts()
+    st.subheader(f"🚨 Stock Alerts ({len(alerts)})")
+    if alerts.empty:
+        st.info("No stock alerts.")
+    else:
+        counts = alerts["Alert"].value_counts().reindex(ALERT_LEVELS, fill_value=0)
+        cols = st.columns(len(ALERT_LEVELS))
+        for col, level in zip(cols, ALERT_LEVELS):
+            col.metric(level, int(counts[level]))
+        st.dataframe(alerts, use_container_width=True)
+
+    # product quantities and open lots are kept in step; any gap needs a stock check
+    drift = stock_drift(prod_df)
+    if not drift.empty:
+        st.warning(f"{len(drift)} product(s) have a Total Quantity that differs from their open lots.")
+        st.dataframe(drift, use_container_width=True)
+
+    with st.expander("Reorder points"):
+        rp_scope = st.radio("Set for:", ["Category", "Product"], key="rp_scope", horizontal=True)
+        if rp_scope == "Category":
+            rp_target = st.selectbox("Category", sorted(prod_df["Category"].dropna().unique()), key="rp_target_cat")
+        else:
+            rp_target = st.number_input("Product ID", min_value=1, step=1, key="rp_target_pid")
+        rp_value = st.number_input("Reorder at or below (units)", min_value=0, value=25, key="rp_value")
+        if st.button("Save reorder point", key="rp_save"):
+            set_reorder_point(rp_scope, int(rp_target) if rp_scope == "Product" else rp_target, int(rp_value))
+            st.success(f"Reorder point for {rp_scope} {rp_target} set to {int(rp_value)}.")
+
+    st.markdown("---")
+
+    # Expired table
+    expired_df = lots[lots["Expiry_Status"] == "Expired"]
+    st.subheader(f"🟥 Expired Lots ({len(expired_df)})")
+    if expired_df.empty:
+        st.info("No expired stock.")
+    else:
+        st.dataframe(expired_df, use_container_width=True)
+
+    st.markdown("---")
+
+    # Near expiry table
+    near_df = lots[lots["Expiry_Status"] == "Near Expiry"]
+    st.subheader(f"🟧 Near-Expiry Lots ({len(near_df)})")
+    if near_df.empty:
+        st.info("No near-expiry stock.")
+    else:
+        st.dataframe(near_df, use_container_width=True)
+
+    st.markdown("---")
+
+    # Products not sold for N days
+    st.subheader("Products not sold for N days")
+    days = st.number_input("Show products not sold for at least (days)", min_value=1, value=5, key="updates_not_sold_days")
+    ns_df = products_not_sold_for_days(prod_df, int(days))
+    if ns_df.empty:
+        st.info("No products matched the filter.")
+    else:
+        st.write(f"Products not sold for >= {days} days (or never sold): {len(ns_df)}")
+        st.dataframe(ns_df, use_container_width=True)
@@ -0,0 +1,181 @@
+# velocity_model.py
+import os
+import threading
+import numpy as np
+import pandas as pd
+from datetime import date
+
+from store_utils import file_version, parse_dates
+
+VELOCITY_NPZ = "Sales_velocity.npz"
+
+# One ring of daily unit buckets per product. Day d lives in slot d % RING_DAYS,
+# `anchor` is the newest day the ring holds; slots older than
+# anchor - RING_DAYS + 1 are reused (zeroed) as the anchor moves forward.
+RING_DAYS = 90
+VELOCITY_WINDOWS = (7, 30, 90)
+
+
+# ---------------------------
+# Ring Buffer Storage
+# ---------------------------
+def _day_number(values) -> np.ndarray:
+    """Days since the epoch for a column / list of sale dates."""
+    return parse_dates(pd.Series(values)).to_numpy().astype("datetime64[D]").astype(np.int64)
+
+
+def _empty_ring() -> dict:
+    return {
+        "pids": np.empty(0, dtype=np.int64),
+        "buckets": np.zeros((0, RING_DAYS), dtype=np.float32),
+        "anchor": None,
+    }
+
+
+def _read_ring() -> dict:
+    with np.load(VELOCITY_NPZ) as f:
+        anchor = int(f["anchor"])
+        return {
+            "pids": f["pids"],
+            "buckets": f["buckets"],
+            "anchor": anchor if anchor >= 0 else None,
+        }
+
+
+def _save_ring(ring: dict) -> None:
+    # written to a temp file first so readers never see a half-written ring
+    # (one per thread: sessions building the ring at once must not share it)
+    tmp = f"{VELOCITY_NPZ}.{threading.get_ident()}.tmp.npz"
+    np.savez(tmp, pids=ring["pids"], buckets=ring["buckets"],
+             anchor=np.int64(-1 if ring["anchor"] is None else ring["anchor"]))
+    os.replace(tmp, VELOCITY_NPZ)
+
+
+def _advance(ring: dict, day: int) -> None:
+    """Moves the anchor forward to `day`, zeroing the slots it recycles."""
+    anchor = ring["anchor"]
+    if anchor is None:
+        ring["anchor"] = day
+        return
+    if day <= anchor:
+        return
+    if day - anchor >= RING_DAYS:
+        ring["buckets"][:] = 0
+    else:
+        ring["buckets"][:, np.arange(anchor + 1, day + 1) % RING_DAYS] = 0
+    ring["anchor"] = day
+
+
+def _add_units(ring: dict, pids: np.ndarray, days: np.ndarray, units: np.ndarray) -> None:
+    """Adds sold units into the ring (in place); lines older than the ring are ignored."""
+    ok = days >= 0
+    pids, days, units = pids[ok], days[ok], units[ok]
+    if len(days) == 0:
+        return
+    _advance(ring, int(days.max()))
+    keep = days > ring["anchor"] - RING_DAYS
+    pids, days, units = pids[keep], days[keep], units[keep]
+
+    # new products get an empty ring row
+    unseen = np.setdiff1d(np.unique(pids), ring["pids"])
+    if len(unseen):
+        all_pids = np.concatenate([ring["pids"], unseen])
+        order = np.argsort(all_pids)
+        buckets = np.vstack([ring["buckets"], np.zeros((len(unseen), RING_DAYS), dtype=np.float32)])
+        ring["pids"], ring["buckets"] = all_pids[order], buckets[order]
+
+    rows = np.searchsorted(ring["pids"], pids)
+    np.add.at(ring["buckets"], (rows, days % RING_DAYS), units.astype(np.float32))
+
+
+def _sales_arrays(sales: pd.DataFrame) -> tuple:
+    pids = pd.to_numeric(sales["Product ID"], errors="coerce")
+    ok = pids.notna().to_numpy()
+    days = _day_number(sales["Date of Sale"])
+    units = pd.to_numeric(sales["Quantity Sold"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    return pids[ok].astype(np.int64).to_numpy(), days[ok], units[ok]
+
+
+# ---------------------------
+# Build / Incremental Maintenance
+# ---------------------------
+def rebuild_velocity() -> None:
+    """Rebuilds the rings from the archive and the sales log, streamed chunk by chunk (one-off backfill)."""
+    # imported lazily: sales_model updates the rings on every transaction
+    from sales_model import iter_sales_chunks, load_sales_archive
+
+    ring = _empty_ring()
+    archive = load_sales_archive()
+    if not archive.empty:
+        _add_units(ring, archive["Product ID"].astype("int64").to_numpy(),
+                   _day_number(archive["Date"]), archive["Units"].to_numpy(dtype=float))
+    for chunk in iter_sales_chunks():
+        if not chunk.empty:
+            _add_units(ring, *_sales_arrays(chunk))
+    _save_ring(ring)
+
+
+def update_velocity(new_rows: list[dict]) -> None:
+    """Adds newly recorded sales lines to their products' daily buckets."""
+    if not new_rows:
+        return
+    if not os.path.exists(VELOCITY_NPZ):
+        rebuild_velocity()   # the log already contains new_rows
+        return
+    ring = _read_ring()
+    _add_units(ring, *_sales_arrays(pd.DataFrame(new_rows)))
+    _save_ring(ring)
+
+
+# ---------------------------
+# Rolling Velocity
+# ---------------------------
+# (ring-file version, date) -> velocity frame
+_VELOCITY_CACHE = {}
+
+
+def rolling_velocity(on_date=None) -> pd.DataFrame:
+    """
+    Units sold per day over the trailing 7/30/90 days (inclusive of
+    `on_date`, default today) for every product that sold in the last
+    RING_DAYS days. Columns: Product ID, Velocity_7d, Velocity_30d, Velocity_90d.
+    """
+    if not os.path.exists(VELOCITY_NPZ):
+        rebuild_velocity()
+
+    on_date = on_date or date.today()
+    key = (file_version(VELOCITY_NPZ), on_date)
+    cached = _VELOCITY_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    ring = _read_ring()
+    today = int(_day_number([pd.Timestamp(on_date)])[0])
+    out = pd.DataFrame({"Product ID": ring["pids"]})
+    for w in VELOCITY_WINDOWS:
+        col = f"Velocity_{w}d"
+        if ring["anchor"] is None:
+            out[col] = 0.0
+            continue
+        # days of the window that the ring still holds
+        first = max(today - w + 1, ring["anchor"] - RING_DAYS + 1)
+        last = min(today, ring["anchor"])
+        slots = np.arange(first, last + 1) % RING_DAYS if last >= first else np.empty(0, dtype=int)
+        out[col] = ring["buckets"][:, slots].sum(axis=1, dtype=np.float64) / w
+
+    if len(_VELOCITY_CACHE) >= 8:
+        _VELOCITY_CACHE.clear()
+    _VELOCITY_CACHE[key] = out
+    return out
+
+
+def days_of_stock(prod_df: pd.DataFrame, window: int = 30, on_date=None) -> np.ndarray:
+    """
+    Days until each product sells out at its trailing `window`-day velocity,
+    for all rows at once. NaN when the product has not sold in that window.
+    """
+    velocity = rolling_velocity(on_date).set_index("Product ID")[f"Velocity_{window}d"]
+    v = pd.to_numeric(prod_df["Product ID"], errors="coerce").map(velocity).to_numpy(dtype=float, na_value=np.nan)
+    qty = pd.to_numeric(prod_df["Total Quantity"], errors="coerce").to_numpy(dtype=float, na_value=np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(v > 0, qty / v, np.nan).round(1)